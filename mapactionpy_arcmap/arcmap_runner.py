@@ -2,10 +2,28 @@ import arcpy
 import logging
 import os
 import json
-from PIL import Image
-from resizeimage import resizeimage
+import shutil
+from timeit import default_timer
 from slugify import slugify
-from map_chef import MapChef, get_map_scale, get_map_spatial_ref
+from cooking_session import CookingSession
+from map_chef import MapChef, IncrementalCookError, get_map_scale, get_map_spatial_ref
+from change_detection import ChangeDetector, get_manifest_path, load_manifest, write_manifest
+from cook_profile import CookProfile
+from dataset_types import get_default_resolver
+from doc_index import DocumentIndex
+import export_workers
+from export_packaging import DEFAULT_PACKAGE_BUFFER_SIZE, StreamingPackage, get_package_path
+from export_profiles import (DEFAULT_EXPORT_PROFILE, PRINT_PROFILE, get_export_options, get_export_profile,
+                             get_resolutions)
+from atlas_checkpoint import AtlasCheckpoint, get_checkpoint_path
+from atlas_export import (export_atlas_in_parallel, export_atlas_pages, iter_region_features, plan_atlas_pages,
+                          plan_atlas_regions)
+from marginalia import MarginaliaRenderer, MarginaliaContext, ATLAS_PAGE_HANDLERS
+from layer_cache import LayerFileCache, DEFAULT_LAYER_CACHE_SIZE
+from layer_extents import CACHE_FNAME as EXTENT_CACHE_FNAME, LayerExtentCache
+from preflight import run_preflight
+from recipe_diff import RecipeDiff, load_recipe_json
+from template_index import INDEX_FNAME, TemplateIndex, check_template, get_frames
 from mapactionpy_controller.plugin_base import BaseRunnerPlugin
 
 logging.basicConfig(
@@ -17,10 +35,25 @@ logging.basicConfig(
 class ArcMapRunner(BaseRunnerPlugin):
     """
     ArcMapRunner - Executes the ArcMap automation methods
+
+    `export_processes`, `atlas_processes`, `template_processes` and `extent_processes` each default to 1.
+    Every worker process started for them runs arcpy, and so checks out its own ArcGIS licence. Only raise
+    them where there are enough licences for every worker at the same time.
     """
 
     def __init__(self,
-                 hum_event):
+                 hum_event,
+                 layer_cache_size=DEFAULT_LAYER_CACHE_SIZE,
+                 incremental_cook=False,
+                 skip_unchanged=False,
+                 export_processes=1,
+                 atlas_processes=1,
+                 template_processes=1,
+                 extent_processes=1,
+                 stream_packaging=True,
+                 derive_thumbnail=True,
+                 export_profile_name=DEFAULT_EXPORT_PROFILE,
+                 package_buffer_size=DEFAULT_PACKAGE_BUFFER_SIZE):
         super(ArcMapRunner, self).__init__(hum_event)
 
         self.exportMap = False
@@ -29,21 +62,211 @@ class ArcMapRunner(BaseRunnerPlugin):
         self.maxx = 0
         self.maxy = 0
         self.chef = None
+        # The run report for the most recent cook, and the profile of the most recent export
+        self.run_report = None
+        self.export_profile = None
+        # Shared between all of the products built by this runner, as an event reuses the same layer files
+        # across many products. No copier is known to be safe for `arcpy.mapping.Layer`, so for now every
+        # layer file is parsed and the cache only records how many parses there were (see `LayerFileCache`).
+        self.layer_cache = LayerFileCache(arcpy.mapping.Layer, max_size=layer_cache_size)
+        # Keeps each template open between products
+        self.session = CookingSession(self.cmf, self.hum_event, layer_cache=self.layer_cache)
+        # If True, a new version of a product is created by updating a copy of the previous version where
+        # it is safe to do so, rather than being rebuilt from the template. See `_try_incremental_cook`. Off
+        # by default, so that every version is built from the template unless the caller opts in.
+        self.incremental_cook = incremental_cook
+        # If True, products whose inputs have not changed since their latest version are not rebuilt, and keep
+        # that version number. Off by default, as for `incremental_cook`.
+        self.skip_unchanged = skip_unchanged
+        self.change_detector = ChangeDetector(self.hum_event)
+        # The same memoized resolver as the cook uses, so that the pre-flight checks do not repeat its lookups
+        self.dataset_type_resolver = get_default_resolver()
+        self._unchanged_products = set()
+        # Products whose inputs are unchanged but whose previous export did not complete
+        self._resumable_products = set()
+        # If greater than 1, the PDF, JPEG and thumbnail are exported in parallel worker processes
+        self.export_processes = export_processes
+        # If True, the thumbnail is made from the exported JPEG, rather than from a separate render of the
+        # layout by ArcMap
+        self.derive_thumbnail = derive_thumbnail
+        # The resolutions, options and formats of the export. See `export_profiles`.
+        self.export_settings = get_export_profile(export_profile_name)
+        # If greater than 1, the pages of an atlas are shared between this many worker processes
+        self.atlas_processes = atlas_processes
+        # The pages exported and any which failed, for the most recent atlas
+        self.atlas_report = None
+        # Passed from the most recent cook to the export of the same MXD. See `_take_export_handoff`.
+        self.export_handoff = None
+        # Saves opening every candidate template for each recipe, just to read its data frames
+        self.template_index = TemplateIndex(os.path.join(self.cmf.map_projects, INDEX_FNAME), template_processes)
+        # Saves describing the same data source again for every layer and recipe which uses it
+        self.extent_cache = LayerExtentCache(os.path.join(self.cmf.map_projects, EXTENT_CACHE_FNAME), extent_processes)
+        # If True, each exported file is added to the product's zip file as soon as it has been written. See
+        # `StreamingPackage`.
+        self.stream_packaging = stream_packaging
+        self.package_buffer_size = package_buffer_size
+        # The package being written by the current export, and the entries of the most recent package
+        self._package = None
+        self.package_report = None
 
     def build_project_files(self, **kwargs):
         # Construct a Crash Move Folder object if the cmf_description.json exists
         recipe = kwargs['state']
-        mxd = arcpy.mapping.MapDocument(recipe.map_project_path)
-
-        self.chef = MapChef(mxd, self.cmf, self.hum_event)
-        self.chef.cook(recipe)
+        # Write any extents found by `get_lyr_extents` for this recipe
+        self.extent_cache.save()
+        if recipe.map_project_path in self._unchanged_products:
+            logging.info('Skipping cook of unchanged product "{}"'.format(recipe.product))
+            return recipe
+        if recipe.map_project_path in self._resumable_products:
+            logging.info('Skipping cook of "{}", to resume its export'.format(recipe.product))
+            return recipe
+
+        # Check all of the layer files and data sources before the MXD is touched
+        preflight_start = default_timer()
+        preflight_report = run_preflight([recipe], resolver=self.dataset_type_resolver)[0]
+        self._check_template(recipe, preflight_report)
+        preflight_seconds = default_timer() - preflight_start
+        if not preflight_report.is_ok():
+            self._write_run_report(recipe, {'preflight': preflight_report.as_dict()})
+            preflight_report.raise_for_fatal()
+
+        self.export_handoff = None
+        self.chef, cook_mode = self._cook(recipe)
+        self.export_profile = None
+        self.export_handoff = self.chef.get_export_handoff(recipe)
         # Output the Map Generation report alongside the MXD
         final_recipe_file = recipe.map_project_path.replace(".mxd", ".json")
         with open(final_recipe_file, 'w') as outfile:
             outfile.write(str(recipe))
 
+        self.run_report = self.chef.get_run_report()
+        self.run_report['map_project_path'] = recipe.map_project_path
+        self.run_report['cook_mode'] = cook_mode
+        self.run_report['session'] = self.session.get_stats()
+        self.run_report['preflight'] = preflight_report.as_dict()
+        self.run_report['preflight_seconds'] = preflight_seconds
+        self._write_run_report(recipe, self.run_report)
+
         return recipe
 
+    def _check_template(self, recipe, preflight_report):
+        """
+        Adds any problems with the template for `recipe` (eg a missing principal map frame) to
+        `preflight_report`, using the template index rather than opening the template.
+        """
+        template_path = getattr(recipe, 'template_path', None)
+        if not template_path:
+            return
+
+        entry = self.template_index.get_entry(template_path)
+        if not entry:
+            return
+
+        for problem in check_template(entry, recipe):
+            preflight_report.add_issue(None, None, template_path, problem)
+
+    def _cook(self, recipe):
+        """
+        Cooks `recipe` incrementally if possible, otherwise using a full cook.
+
+        @returns: A tuple of the MapChef used, and a dict describing how the recipe was cooked.
+        """
+        cook_mode = {'mode': 'full'}
+        if self.incremental_cook:
+            chef, cook_mode = self._try_incremental_cook(recipe)
+            if chef:
+                return chef, cook_mode
+
+            logging.info('Using a full cook for "{}": {}'.format(recipe.product, cook_mode['reason']))
+            # Discard any copy of the previous version
+            template_path = getattr(recipe, 'template_path', None)
+            if template_path and os.path.exists(template_path) and os.path.exists(recipe.map_project_path):
+                shutil.copyfile(template_path, recipe.map_project_path)
+
+        return self.session.cook(recipe), cook_mode
+
+    def get_previous_version_path(self, recipe):
+        """
+        Returns the path of the MXD for the previous version of `recipe`, or None if there is no
+        previous version.
+        """
+        if not recipe.version_num or recipe.version_num < 2:
+            return None
+
+        output_dir, mxd_name = os.path.split(recipe.map_project_path)
+        prefix = '{}-v{}-'.format(recipe.mapnumber, str(recipe.version_num).zfill(2))
+        if not mxd_name.startswith(prefix):
+            return None
+
+        previous_mxd = os.path.join(output_dir, '{}-v{}-{}'.format(
+            recipe.mapnumber, str(recipe.version_num - 1).zfill(2), mxd_name[len(prefix):]))
+        return previous_mxd if os.path.exists(previous_mxd) else None
+
+    def _try_incremental_cook(self, recipe):
+        """
+        Creates the new version of a product by copying the MXD of the previous version and applying only
+        the differences between the previous and current recipes. This is only attempted if the previous
+        recipe JSON and run report are available, neither the previous MXD nor the template have been
+        modified since the previous cook, and the differences can be applied safely (see `RecipeDiff`).
+
+        @returns: A tuple of the MapChef used (or None if a full cook is required) and a dict describing
+                  the outcome.
+        """
+        def _full_cook(reason):
+            return None, {'mode': 'full', 'reason': reason}
+
+        previous_mxd = self.get_previous_version_path(recipe)
+        if not previous_mxd:
+            return _full_cook('There is no previous version')
+
+        previous_json = previous_mxd.replace(".mxd", ".json")
+        previous_report = previous_mxd.replace(".mxd", "-report.json")
+        if not (os.path.exists(previous_json) and os.path.exists(previous_report)):
+            return _full_cook('The previous version does not have a recipe and run report')
+
+        if os.path.getmtime(previous_mxd) > os.path.getmtime(previous_report):
+            return _full_cook('The previous version has been edited since it was created')
+
+        template_path = getattr(recipe, 'template_path', None)
+        if template_path and os.path.exists(template_path) and \
+                os.path.getmtime(template_path) > os.path.getmtime(previous_mxd):
+            return _full_cook('The template has been updated since the previous version was created')
+
+        with open(previous_report, 'r') as report_file:
+            added_layers = json.load(report_file).get('added_layers')
+        if not added_layers:
+            return _full_cook('The previous run report does not record the layers added')
+
+        recipe_diff = RecipeDiff(load_recipe_json(previous_json), recipe, added_layers)
+        if not recipe_diff.is_safe():
+            return _full_cook('; '.join(recipe_diff.unsafe_reasons))
+
+        shutil.copyfile(previous_mxd, recipe.map_project_path)
+        chef = MapChef(arcpy.mapping.MapDocument(recipe.map_project_path), self.cmf, self.hum_event,
+                       layer_cache=self.layer_cache)
+        try:
+            chef.cook_incremental(recipe, recipe_diff)
+        except IncrementalCookError as exp:
+            return _full_cook(str(exp))
+
+        logging.info('Incremental cook of "{}" from {}'.format(recipe.product, previous_mxd))
+        return chef, {'mode': 'incremental', 'previous_version': previous_mxd, 'diff': recipe_diff.get_report()}
+
+    def _write_run_report(self, recipe, report):
+        """
+        Writes the run report (eg the number of times the MXD was saved and the time spent in each stage of
+        the cook and export) alongside the MXD.
+
+        @param recipe: The MapRecipe which has just been cooked.
+        @param report: A dict of JSON-serialisable values.
+        @returns: The path to the run report.
+        """
+        report_file = recipe.map_project_path.replace(".mxd", "-report.json")
+        with open(report_file, 'w') as outfile:
+            json.dump(report, outfile, indent=4, sort_keys=True)
+
+        return report_file
+
     def get_projectfile_extension(self):
         return '.mxd'
 
@@ -61,21 +284,46 @@ class ArcMapRunner(BaseRunnerPlugin):
                   See `_get_largest_map_frame` for the description of hour largest is determined.
         """
         logging.debug('Calculating the aspect ratio of the largest map frame within the list of templates.')
+        entries = self.template_index.get_entries(possible_templates)
         results = []
         for template in possible_templates:
-            mxd = arcpy.mapping.MapDocument(template)
-            arc_frame = arcpy.mapping.ListDataFrames(mxd, recipe.principal_map_frame).pop()
-
-            aspect_ratio = float(arc_frame.elementWidth)/float(arc_frame.elementHeight)
+            entry = entries.get(template)
+            if entry:
+                frames = get_frames(entry, recipe.principal_map_frame)
+                if not frames:
+                    raise ValueError('Template {} does not have a MapFrame (aka DataFrame) with the name "{}"'.format(
+                        template, recipe.principal_map_frame))
+                width, height = frames[-1]['element_width'], frames[-1]['element_height']
+            else:
+                # Not in the index, eg because it could not be read
+                mxd = arcpy.mapping.MapDocument(template)
+                arc_frame = arcpy.mapping.ListDataFrames(mxd, recipe.principal_map_frame).pop()
+                width, height = arc_frame.elementWidth, arc_frame.elementHeight
+
+            aspect_ratio = float(width)/float(height)
             results.append((template, aspect_ratio))
             logging.debug('Calculated aspect ratio= {} for template={}'.format(aspect_ratio, template))
 
         return results
 
     def get_lyr_extents(self, recipe_lyr):
-        print('arcmap_runner.get_lyr_extents')
-        desc = arcpy.Describe(recipe_lyr.data_source_path)
-        recipe_lyr.extent = json.loads(desc.extent.JSON)
+        # The cache file is written by `build_project_files`, once per recipe, rather than for each layer
+        self.extent_cache.fill([recipe_lyr])
+
+    def get_recipe_lyr_extents(self, recipe, epsg=None):
+        """
+        Sets `recipe_lyr.extent` for every layer in `recipe` which has a data source, describing each data
+        source which is not already cached only once.
+
+        @param epsg: (optional) An EPSG code. If supplied the extents are projected into that spatial
+                     reference.
+        """
+        recipe_lyrs = [recipe_lyr for recipe_frame in recipe.map_frames for recipe_lyr in recipe_frame.layers
+                       if getattr(recipe_lyr, 'data_source_path', None)]
+        try:
+            self.extent_cache.fill(recipe_lyrs, epsg)
+        finally:
+            self.extent_cache.save()
 
     # TODO: asmith 2020/03/03
     # Instinctively I would like to see this moved to the MapReport class with an __eq__ method which
@@ -106,39 +354,343 @@ class ArcMapRunner(BaseRunnerPlugin):
         # return returnValue
         return True
 
+    def have_recipe_inputs_changed(self, recipe, previous_map_project_path):
+        """
+        Returns True if any of the inputs to `recipe` (its recipe definition, template, layer files and
+        data sources) have changed since `previous_map_project_path` was produced, or if that cannot be
+        determined.
+        """
+        return self.change_detector.have_inputs_changed(recipe, get_manifest_path(previous_map_project_path))
+
+    def get_latest_unchanged_version(self, recipe):
+        """
+        @returns: A tuple of (path, version number, export complete) of the latest version of `recipe`, if
+                  its inputs are unchanged since it was produced. Otherwise None.
+        """
+        output_dir = os.path.join(self.cmf.map_projects, recipe.mapnumber)
+        if not os.path.isdir(output_dir):
+            return None
+
+        output_map_base = slugify(recipe.product)
+        latest_version = self.get_next_map_version_number(output_dir, recipe.mapnumber, output_map_base) - 1
+        if latest_version < 1:
+            return None
+
+        latest_path = os.path.abspath(os.path.join(output_dir, '{}-v{}-{}{}'.format(
+            recipe.mapnumber, str(latest_version).zfill(2), output_map_base, self.get_projectfile_extension())))
+        if not os.path.exists(latest_path) or self.have_recipe_inputs_changed(recipe, latest_path):
+            return None
+
+        manifest = load_manifest(get_manifest_path(latest_path))
+        # An export with a different profile (eg a draft) does not count as complete
+        export_complete = manifest.get('export_complete', True) and \
+            manifest.get('export_profile', PRINT_PROFILE) == self.export_settings.name
+        return latest_path, latest_version, export_complete
+
+    def create_ouput_map_project(self, **kwargs):
+        """
+        As `BaseRunnerPlugin.create_ouput_map_project`, except that if `skip_unchanged` is True and none of
+        the inputs to the recipe have changed since the latest version was produced, that version is reused
+        rather than creating a new one. The cook is then skipped for that recipe, as is the export unless the
+        previous export of that version was interrupted, in which case it is resumed.
+        """
+        recipe = kwargs['state']
+        if self.skip_unchanged:
+            unchanged = self.get_latest_unchanged_version(recipe)
+            if unchanged:
+                recipe.map_project_path, recipe.version_num, export_complete = unchanged
+                if export_complete:
+                    self._unchanged_products.add(recipe.map_project_path)
+                else:
+                    self._resumable_products.add(recipe.map_project_path)
+                logging.info('The inputs to "{}" are unchanged. Reusing {}'.format(
+                    recipe.product, recipe.map_project_path))
+                return recipe
+
+        return super(ArcMapRunner, self).create_ouput_map_project(**kwargs)
+
+    def export_maps(self, **kwargs):
+        """
+        As `BaseRunnerPlugin.export_maps`, except that unchanged products (see `create_ouput_map_project`)
+        are not exported again. The manifest of the product's inputs is written alongside the MXD before the
+        export starts, and marked as complete once the export has succeeded. If `stream_packaging` is True
+        the product's zip file is written as the export progresses (see `zip_exported_files`).
+        """
+        recipe = kwargs['state']
+        if recipe.map_project_path in self._unchanged_products:
+            logging.info('Skipping export of unchanged product "{}"'.format(recipe.product))
+            return recipe
+
+        manifest = self._write_manifest(recipe, export_complete=False)
+        self._open_package(recipe)
+        try:
+            result = super(ArcMapRunner, self).export_maps(**kwargs)
+        finally:
+            # Only still open if the export or packaging failed
+            self._abort_package()
+        manifest['export_complete'] = True
+        write_manifest(get_manifest_path(recipe.map_project_path), manifest)
+        return result
+
+    def _write_manifest(self, recipe, export_complete=True):
+        previous_manifest = None
+        previous_mxd = self.get_previous_version_path(recipe)
+        if previous_mxd:
+            previous_manifest = load_manifest(get_manifest_path(previous_mxd))
+
+        manifest = self.change_detector.build_manifest(recipe, previous_manifest)
+        manifest['export_complete'] = export_complete
+        manifest['export_profile'] = self.export_settings.name
+        write_manifest(get_manifest_path(recipe.map_project_path), manifest)
+        return manifest
+
+    def _take_export_handoff(self, recipe):
+        """
+        Returns the ExportHandoff from the cook of `recipe` by `build_project_files`, if that is the most
+        recent cook and is of the same MXD. Otherwise None, in which case the MXD is opened from disk. The
+        handoff can only be used once.
+        """
+        handoff, self.export_handoff = self.export_handoff, None
+        if handoff and os.path.normcase(os.path.abspath(handoff.map_project_path)) == \
+                os.path.normcase(os.path.abspath(recipe.map_project_path)):
+            return handoff
+
+        return None
+
     def _do_export(self, recipe):
         """
         Does the actual work of exporting of the PDF, Jpeg and thumbnail files.
-        """
-        arc_mxd = arcpy.mapping.MapDocument(recipe.map_project_path)
 
+        The in-memory document from the cook is used if it is available (see `_take_export_handoff`),
+        otherwise `recipe.map_project_path` is opened from disk.
+
+        Which files are exported, and at what resolution and quality, is set by the export profile (see
+        `export_profiles`).
+        """
+        profile = CookProfile()
+        self.export_profile = profile
+        self.atlas_report = None
+        self.package_report = None
+        start = default_timer()
+
+        handoff = self._take_export_handoff(recipe)
+        if handoff:
+            arc_mxd = handoff.mxd
+            doc_index = handoff.doc_index
+            doc_index.profile = profile
+        else:
+            with profile.stage('export_open'):
+                profile.count_calls()
+                arc_mxd = arcpy.mapping.MapDocument(recipe.map_project_path)
+            doc_index = DocumentIndex(arc_mxd, profile)
+
+        if self.export_processes > 1:
+            pdf_path, jpeg_path, tb_nail_path = self._export_formats_in_parallel(recipe, profile)
+        else:
+            pdf_path, jpeg_path, tb_nail_path = self._export_formats(recipe, arc_mxd, profile)
+
+        # Any format which is not produced by the export profile is given an empty file name, so that the
+        # export metadata is still complete
         # PDF export
-        pdf_path = self.export_pdf(recipe, arc_mxd)
-        recipe.zip_file_contents.append(pdf_path)
-        recipe.export_metadata['pdffilename'] = os.path.basename(pdf_path)
+        recipe.export_metadata['pdffilename'] = os.path.basename(pdf_path) if pdf_path else ''
+        recipe.export_metadata.setdefault('pdffilesize', 0)
 
         # JPEG export
-        jpeg_path = self.export_jpeg(recipe, arc_mxd)
-        recipe.zip_file_contents.append(jpeg_path)
-        recipe.export_metadata['jpgfilename'] = os.path.basename(jpeg_path)
+        recipe.export_metadata['jpgfilename'] = os.path.basename(jpeg_path) if jpeg_path else ''
+        recipe.export_metadata.setdefault('jpgfilesize', 0)
 
         # Thumbnail
-        tb_nail_path = self.export_png_thumbnail(recipe, arc_mxd)
-        recipe.zip_file_contents.append(tb_nail_path)
-        recipe.export_metadata['pngThumbNailFileLocation'] = tb_nail_path
+        recipe.export_metadata['pngThumbNailFileLocation'] = tb_nail_path or ''
 
         # Atlas (if required)
-        if recipe.atlas:
+        if recipe.atlas and not self.export_settings.include_atlas:
+            logging.info('The atlas pages are not exported with the "{}" export profile'.format(
+                self.export_settings.name))
+        elif recipe.atlas:
             export_dir = recipe.export_path
-            self._export_atlas(recipe, arc_mxd, export_dir)
+            with profile.stage('export_atlas'):
+                self._export_atlas(recipe, arc_mxd, export_dir, doc_index, profile, handoff)
+            if handoff and self.chef.reuse_document:
+                # The atlas pages have changed the in-memory document, so do not reuse it for another recipe
+                self.session.evict(recipe)
 
         # Update export metadata and return
-        return self._update_export_metadata(recipe, arc_mxd)
+        with profile.stage('export_metadata'):
+            recipe = self._update_export_metadata(recipe, arc_mxd, doc_index, handoff)
+
+        self._record_export_profile(recipe, profile, default_timer() - start, 'cook' if handoff else 'disk')
+        return recipe
+
+    def _export_formats(self, recipe, arc_mxd, profile):
+        """
+        Exports the PDF, JPEG and thumbnail one after another, in this process. Only the formats of the
+        export profile are produced.
+
+        @returns: A tuple of the paths of the PDF, JPEG and thumbnail. The path of a format which is not
+                  produced is None.
+        """
+        formats = self.export_settings.formats
+        pdf_path = jpeg_path = tb_nail_path = None
+        if 'pdf' in formats:
+            with profile.stage('export_pdf'):
+                profile.count_calls()
+                pdf_path = self.export_pdf(recipe, arc_mxd)
+            self._package_file(recipe, pdf_path)
+
+        if 'jpeg' in formats:
+            with profile.stage('export_jpeg'):
+                profile.count_calls()
+                jpeg_path = self.export_jpeg(recipe, arc_mxd)
+            self._package_file(recipe, jpeg_path)
+
+        if 'thumbnail' in formats:
+            with profile.stage('export_thumbnail'):
+                if self.derive_thumbnail and jpeg_path:
+                    tb_nail_path = self.export_png_thumbnail(recipe, arc_mxd, jpeg_path)
+                else:
+                    profile.count_calls()
+                    tb_nail_path = self.export_png_thumbnail(recipe, arc_mxd)
+            self._package_file(recipe, tb_nail_path)
+
+        return pdf_path, jpeg_path, tb_nail_path
+
+    def _export_formats_in_parallel(self, recipe, profile):
+        """
+        Exports the PDF, JPEG and thumbnail at the same time, each in its own worker process with its own
+        copy of the MXD. The export metadata from each worker is merged in a fixed order. If
+        `derive_thumbnail` is True only the PDF and JPEG are exported by workers, and the thumbnail is then
+        made from the JPEG in this process.
+
+        @returns: A tuple of the paths of the PDF, JPEG and thumbnail. The path of a format which is not
+                  produced by the export profile is None.
+        """
+        dpis = get_resolutions(self.export_settings, self.hum_event)
+        formats = self.export_settings.formats
+        derive_thumbnail = self.derive_thumbnail and 'thumbnail' in formats and 'jpeg' in formats
+        if derive_thumbnail:
+            formats = [fmt for fmt in formats if fmt in export_workers.RENDERED_FORMATS]
+        with profile.stage('export_parallel'):
+            results = export_workers.export_in_parallel(
+                recipe.map_project_path, recipe.export_path, recipe.core_file_name, dpis, self.export_processes,
+                formats, get_export_options(self.export_settings))
+
+        paths = dict.fromkeys(export_workers.EXPORT_FORMATS)
+        for result in results:
+            # Time spent within the workers. This overlaps with the 'export_parallel' stage.
+            profile.record('export_' + result['format'], result['seconds'])
+            profile.record('export_worker_open', result['open_seconds'])
+            recipe.export_metadata.update(result['metadata'])
+            paths[result['format']] = result['path']
+            self._package_file(recipe, result['path'])
+
+        if derive_thumbnail:
+            with profile.stage('export_thumbnail'):
+                paths['thumbnail'] = self.export_png_thumbnail(recipe, None, paths['jpeg'])
+            self._package_file(recipe, paths['thumbnail'])
+
+        return paths['pdf'], paths['jpeg'], paths['thumbnail']
+
+    def _package_file(self, recipe, f_path):
+        """
+        Adds `f_path` to `recipe.zip_file_contents` and, if packaging is being streamed, queues it to be
+        written to the product's zip file straight away.
+        """
+        recipe.zip_file_contents.append(f_path)
+        if self._package:
+            self._package.add(f_path)
+
+    def _open_package(self, recipe):
+        """
+        If `stream_packaging` is True, starts writing the product's zip file, so that `_do_export` can add
+        each file to it as soon as the file has been written. The package is closed by `zip_exported_files`,
+        and must be aborted with `_abort_package` if that is not reached.
+        """
+        self._abort_package()
+        if self.stream_packaging:
+            self._package = StreamingPackage(self._get_package_path(recipe), self.package_buffer_size)
+
+    def _get_package_path(self, recipe):
+        return get_package_path(recipe, self.export_settings.package_suffix)
+
+    def _abort_package(self):
+        package, self._package = self._package, None
+        if package:
+            package.abort()
+
+    def zip_exported_files(self, recipe):
+        """
+        As `BaseRunnerPlugin.zip_exported_files`, except that when packaging is streamed (see
+        `StreamingPackage`) most of the files have already been written to the zip by the time this is
+        called. Only those files in `recipe.zip_file_contents` which were added after the export (eg the
+        export XML) remain to be written before the package is closed.
+
+        When packaging is not streamed, `BaseRunnerPlugin.zip_exported_files` is only used for an export
+        profile which produces every format under the usual package name. For any other profile (eg
+        "draft", which only produces the PDF) the package is written here in a single pass.
 
-    def _update_export_metadata(self, recipe, arc_mxd):
+        The size, CRC32 and MD5 of each entry are added to the run report.
+        """
+        package, self._package = self._package, None
+        if package is None:
+            if self._is_standard_package():
+                return super(ArcMapRunner, self).zip_exported_files(recipe)
+            package = StreamingPackage(self._get_package_path(recipe), self.package_buffer_size)
+
+        start = default_timer()
+        try:
+            for f_path in recipe.zip_file_contents:
+                package.add(f_path)
+            entries = package.close()
+        except Exception:
+            package.abort()
+            raise
+
+        self.package_report = {
+            'path': package.zip_path,
+            'entries': entries,
+            'write_seconds': package.write_seconds,
+            # The time between the end of the export and the package being ready
+            'close_seconds': default_timer() - start
+        }
+        if self.run_report and self.run_report.get('map_project_path') == recipe.map_project_path:
+            self.run_report['package'] = self.package_report
+            self._write_run_report(recipe, self.run_report)
+
+    def _is_standard_package(self):
+        """
+        Returns True if the export profile produces the package which `BaseRunnerPlugin.zip_exported_files`
+        expects, with the JPEG and thumbnail present and under the usual name.
+        """
+        settings = self.export_settings
+        return not settings.package_suffix and set(export_workers.EXPORT_FORMATS) <= set(settings.formats)
+
+    def _record_export_profile(self, recipe, profile, export_seconds, document_source):
+        """
+        Adds the export timings to the run report written by `build_project_files`, if that report is for
+        the same MXD. The run report is not written for exports of MXDs which were not cooked by this
+        runner.
         """
-        Populates the `recipe.export_metadata` dict
+        logging.info('Export complete in {:.2f}s'.format(export_seconds))
+        if not self.run_report or self.run_report.get('map_project_path') != recipe.map_project_path:
+            return
+
+        self.run_report['export_seconds'] = export_seconds
+        self.run_report['export_stages'] = profile.as_dict()
+        # Whether the export used the in-memory document from the cook, or reopened the MXD from disk
+        self.run_report['export_document'] = document_source
+        self.run_report['export_profile'] = self.export_settings.name
+        if recipe.atlas and self.atlas_report:
+            self.run_report['atlas'] = self.atlas_report
+        self._write_run_report(recipe, self.run_report)
+
+    def _update_export_metadata(self, recipe, arc_mxd, doc_index=None, handoff=None):
         """
+        Populates the `recipe.export_metadata` dict. If `handoff` is supplied the extent, scale and datum
+        found by the cook are used, rather than being read from the document again.
+        """
+        if doc_index is None:
+            doc_index = DocumentIndex(arc_mxd)
+
         recipe.export_metadata["coreFileName"] = recipe.core_file_name
         recipe.export_metadata["product-type"] = "mapsheet"
         recipe.export_metadata['themes'] = recipe.export_metadata.get('themes', set())
@@ -147,21 +699,40 @@ class ArcMapRunner(BaseRunnerPlugin):
         recipe.export_metadata['title'] = recipe.product
         recipe.export_metadata['versionNumber'] = recipe.version_num
         recipe.export_metadata['summary'] = recipe.summary
-        recipe.export_metadata["xmin"] = self.minx
-        recipe.export_metadata["ymin"] = self.miny
-        recipe.export_metadata["xmax"] = self.maxx
-        recipe.export_metadata["ymax"] = self.maxy
+        xmin, ymin, xmax, ymax = (handoff and handoff.extent) or (self.minx, self.miny, self.maxx, self.maxy)
+        recipe.export_metadata["xmin"] = xmin
+        recipe.export_metadata["ymin"] = ymin
+        recipe.export_metadata["xmax"] = xmax
+        recipe.export_metadata["ymax"] = ymax
 
         recipe.export_metadata["createdate"] = recipe.creation_time_stamp.strftime("%d-%b-%Y")
         recipe.export_metadata["createtime"] = recipe.creation_time_stamp.strftime("%H:%M")
-        recipe.export_metadata["scale"] = get_map_scale(arc_mxd, recipe)
-        recipe.export_metadata["datum"] = get_map_spatial_ref(arc_mxd, recipe)
+        if handoff:
+            recipe.export_metadata["scale"] = handoff.scale
+            recipe.export_metadata["datum"] = handoff.datum
+        else:
+            recipe.export_metadata["scale"] = get_map_scale(arc_mxd, recipe, doc_index)
+            recipe.export_metadata["datum"] = get_map_spatial_ref(arc_mxd, recipe, doc_index)
         return recipe
 
-    def _export_atlas(self, recipe_with_atlas, arc_mxd, export_dir):
+    def _export_atlas(self, recipe_with_atlas, arc_mxd, export_dir, doc_index=None, profile=None, handoff=None):
         """
-        Exports each individual page for recipes which contain an atlas definition
+        Exports each individual page for recipes which contain an atlas definition. If `atlas_processes` is
+        greater than 1 the pages are rendered by a pool of worker processes, each with its own copy of the
+        MXD at `recipe_with_atlas.map_project_path`.
+
+        A page which fails to export is logged and left out of `zip_file_contents`, but does not prevent the
+        remaining pages from being exported. Progress is recorded in an `AtlasCheckpoint` alongside the MXD,
+        so that if the export is interrupted, exporting the same MXD again only renders the pages which are
+        missing or stale.
+
+        @returns: A list of the results for each page, in page order (see `atlas_export.export_atlas_pages`).
         """
+        if profile is None:
+            profile = CookProfile()
+        if doc_index is None:
+            doc_index = DocumentIndex(arc_mxd, profile)
+
         if not recipe_with_atlas.atlas:
             raise ValueError('Cannot export atlas. The specified recipe does not contain an atlas definition')
 
@@ -185,136 +756,113 @@ class ArcMapRunner(BaseRunnerPlugin):
         recipe_lyr = recipe_frame.get_layer(recipe_with_atlas.atlas.layer_name)
         queryColumn = recipe_with_atlas.atlas.column_name
 
-        lyr_index = recipe_frame.layers.index(recipe_lyr)
-        arc_df = arcpy.mapping.ListDataFrames(arc_mxd, recipe_frame.name)[0]
-        arc_lyr = arcpy.mapping.ListLayers(arc_mxd, None, arc_df)[lyr_index]
+        arc_df = doc_index.get_frame(recipe_frame.name)
+        arc_lyr = None
+        if handoff:
+            # The cook recorded the name which the atlas layer was given in the map
+            for recipe_name, arc_name in handoff.added_layers.get(recipe_frame.name, []):
+                if recipe_name == recipe_lyr.name:
+                    arc_lyr = doc_index.get_layers(arc_df, arc_name)[0]
+                    break
+        if arc_lyr is None:
+            lyr_index = recipe_frame.layers.index(recipe_lyr)
+            arc_lyr = doc_index.list_layers(arc_df)[lyr_index]
 
         # TODO: asmith 2020/03/03
         #
         # Presumably `regions` here means admin1 boundaries or some other internal
         # administrative devision? Replace with a more generic name.
 
-        # For each layer and column name, export a regional map
-        regions = list()
-        # UpdateCursor requires that the queryColumn must be passed as a list or tuple
-        with arcpy.da.UpdateCursor(arc_lyr.dataSource, [queryColumn]) as cursor:
-            for row in cursor:
-                regions.append(row[0])
-
-        # This loop simulates the behaviour of Data Driven Pages. This is because of the
+        # For each layer and column name, export a regional map. The distinct regions and their extents are
+        # read in a single pass of a read-only cursor, so each page does not need to select its region.
+        # Only the regions shown by the layer are included
+        where_clause = (arc_lyr.definitionQuery if arc_lyr.supports('DEFINITIONQUERY') else None) or None
+        with profile.stage('export_atlas_regions'):
+            profile.count_calls()
+            region_extents = plan_atlas_regions(iter_region_features(
+                arc_lyr.dataSource, queryColumn, where_clause, arc_df.spatialReference))
+
+        # The text elements and the parts of the marginalia which are common to every page are only looked
+        # up once.
+        text_elements = arcpy.mapping.ListLayoutElements(arc_mxd, "TEXT_ELEMENT")
+        page_renderer = MarginaliaRenderer(ATLAS_PAGE_HANDLERS, include_defaults=False)
+        atlas_context = MarginaliaContext(recipe=recipe_with_atlas, event=self.hum_event)
+        dpi = get_resolutions(self.export_settings, self.hum_event)['pdf']
+        pdf_options = get_export_options(self.export_settings)['pdf']
+        pages = plan_atlas_pages(region_extents, export_dir, recipe_with_atlas.core_file_name, dpi,
+                                 [elm.name for elm in text_elements], page_renderer, atlas_context)
+
+        # Pages which were completed by an earlier, interrupted, export of this MXD are not rendered again
+        with profile.stage('export_atlas_checkpoint'):
+            checkpoint = AtlasCheckpoint(get_checkpoint_path(recipe_with_atlas.map_project_path),
+                                         recipe_with_atlas.map_project_path, dpi, pdf_options)
+            pending = checkpoint.get_pending(pages)
+
+        def _on_page(result):
+            checkpoint.record(result)
+            if self._package and not result['error']:
+                self._package.add(result['path'])
+
+        # This simulates the behaviour of Data Driven Pages. This is because of the
         # limitations in the arcpy API for maniplulating DDPs.
-        for region in regions:
-            # TODO: asmith 2020/03/03
-            # Please do not hardcode mapFrame names. If a particular mapframe as a special
-            # meaning then this should be explicit in the structure of the mapCookBook.json
-            # and/or layerProperties.json files.arc_mxd, dataFrameName)[0]
-
-            # Select the next region
-            query = "\"" + queryColumn + "\" = \'" + region + "\'"
-            arcpy.SelectLayerByAttribute_management(arc_lyr, "NEW_SELECTION", query)
-
-            # Set the extent mapframe to the selected area
-            arc_df.extent = arc_lyr.getSelectedExtent()
-
-            # # Create a polygon using the bounding box
-            # bounds = arcpy.Array()
-            # bounds.add(arc_df.extent.lowerLeft)
-            # bounds.add(arc_df.extent.lowerRight)
-            # bounds.add(arc_df.extent.upperRight)
-            # bounds.add(arc_df.extent.upperLeft)
-            # # ensure the polygon is closed
-            # bounds.add(arc_df.extent.lowerLeft)
-            # # Create the polygon object
-            # polygon = arcpy.Polygon(bounds, arc_df.extent.spatialReference)
-
-            # bounds.removeAll()
-
-            # # Export the extent to a shapefile
-            # shapeFileName = "extent_" + slugify(unicode(region)).replace('-', '')
-            # shpFile = shapeFileName + ".shp"
-
-            # if arcpy.Exists(os.path.join(export_dir, shpFile)):
-            #     arcpy.Delete_management(os.path.join(export_dir, shpFile))
-            # arcpy.CopyFeatures_management(polygon, os.path.join(export_dir, shpFile))
-
-            # # For the 'extent' layer...
-            # locationMapDataFrameName = "Location map"
-            # locationMapDataFrame = arcpy.mapping.ListDataFrames(arc_mxd, locationMapDataFrameName)[0]
-            # extentLayerName = "locationmap-s0-py-extent"
-            # extentLayer = arcpy.mapping.ListLayers(arc_mxd, extentLayerName, locationMapDataFrame)[0]
-
-            # # Update the layer
-            # extentLayer.replaceDataSource(export_dir, 'SHAPEFILE_WORKSPACE', shapeFileName)
-            # arcpy.RefreshActiveView()
-
-            # # In Main map, zoom to the selected region
-            # dataFrameName = "Main map"
-            # df = arcpy.mapping.ListDataFrames(arc_mxd, dataFrameName)[0]
-            # arcpy.SelectLayerByAttribute_management(arc_lyr, "NEW_SELECTION", query)
-            # df.extent = arc_lyr.getSelectedExtent()
-
-            for elm in arcpy.mapping.ListLayoutElements(arc_mxd, "TEXT_ELEMENT"):
-                if elm.name == "title":
-                    elm.text = recipe_with_atlas.category + " map of " + self.hum_event.country_name +\
-                        '\n' +\
-                        "<CLR red = '255'>Sheet - " + region + "</CLR>"
-                if elm.name == "map_no":
-                    elm.text = recipe_with_atlas.mapnumber + "_Sheet_" + region.replace(' ', '_')
-
-            # Clear selection, otherwise the selected feature is highlighted in the exported map
-            arcpy.SelectLayerByAttribute_management(arc_lyr, "CLEAR_SELECTION")
-            # Export to PDF
-            pdfFileName = recipe_with_atlas.core_file_name + "-" + \
-                slugify(unicode(region)) + "-" + str(self.hum_event.default_pdf_res_dpi) + "dpi.pdf"
-            pdfFileLocation = os.path.join(export_dir, pdfFileName)
-            recipe_with_atlas.zip_file_contents.append(pdfFileLocation)
-
-            logging.info('About to export atlas page for region; {}.'.format(region))
-            arcpy.mapping.ExportToPDF(arc_mxd, pdfFileLocation, resolution=int(self.hum_event.default_pdf_res_dpi))
-            logging.info('Completed exporting atlas page for for region; {}.'.format(region))
-
-            # if arcpy.Exists(os.path.join(export_dir, shpFile)):
-            #     arcpy.Delete_management(os.path.join(export_dir, shpFile))
+        if self.atlas_processes > 1 and len(pending) > 1:
+            with profile.stage('export_atlas_parallel'):
+                rendered = export_atlas_in_parallel(recipe_with_atlas.map_project_path, recipe_frame.name,
+                                                    pending, dpi, self.atlas_processes, _on_page, pdf_options)
+        else:
+            rendered = export_atlas_pages(arc_mxd, arc_df, pending, dpi, text_elements, _on_page, pdf_options)
+
+        rendered = dict((result['index'], result) for result in rendered)
+        results = []
+        failed = []
+        for page in pages:
+            result = rendered.get(page.index)
+            if result is None:
+                result = {'index': page.index, 'region': page.region, 'path': page.pdf_path, 'seconds': 0,
+                          'error': None, 'resumed': True}
+            else:
+                # When exported in parallel this is time spent within the workers, which overlaps with the
+                # 'export_atlas_parallel' stage.
+                profile.record('export_atlas_page', result['seconds'])
+
+            results.append(result)
+            if result['error']:
+                failed.append({'region': result['region'], 'error': result['error']})
+            elif result.get('resumed'):
+                # Completed by an earlier export, so not yet in the package
+                self._package_file(recipe_with_atlas, result['path'])
+            else:
+                # Already queued to the package by `_on_page`, as soon as the page was written
+                recipe_with_atlas.zip_file_contents.append(result['path'])
+
+        if failed:
+            logging.error('Failed to export {} of the {} atlas pages for "{}": {}'.format(
+                len(failed), len(pages), recipe_with_atlas.product, ', '.join(f['region'] for f in failed)))
+
+        self.atlas_report = {'pages': len(pages), 'resumed': len(pages) - len(pending), 'failed': failed}
+        return results
 
     def export_jpeg(self, recipe, arc_mxd):
-        # JPEG
-        jpeg_fname = recipe.core_file_name+"-"+str(self.hum_event.default_jpeg_res_dpi) + "dpi.jpg"
-        jpeg_fpath = os.path.join(recipe.export_path, jpeg_fname)
-        recipe.export_metadata["jpgfilename"] = jpeg_fname
-        arcpy.mapping.ExportToJPEG(arc_mxd, jpeg_fpath)
-        jpeg_fsize = os.path.getsize(jpeg_fpath)
-        recipe.export_metadata["jpgfilesize"] = jpeg_fsize
+        jpeg_fpath, metadata = export_workers.export_jpeg(
+            arc_mxd, recipe.export_path, recipe.core_file_name,
+            get_resolutions(self.export_settings, self.hum_event)['jpeg'], **self.export_settings.jpeg_options)
+        recipe.export_metadata.update(metadata)
         return jpeg_fpath
 
     def export_pdf(self, recipe, arc_mxd):
-        # recipe.core_file_name, recipe.export_path, arc_mxd, recipe.export_metadata
-
-        # PDF
-        pdf_fname = recipe.core_file_name+"-"+str(self.hum_event.default_pdf_res_dpi) + "dpi.pdf"
-        pdf_fpath = os.path.join(recipe.export_path, pdf_fname)
-        recipe.export_metadata["pdffilename"] = pdf_fname
-        arcpy.mapping.ExportToPDF(arc_mxd, pdf_fpath, resolution=int(self.hum_event.default_pdf_res_dpi))
-        pdf_fsize = os.path.getsize(pdf_fpath)
-        recipe.export_metadata["pdffilesize"] = pdf_fsize
+        pdf_fpath, metadata = export_workers.export_pdf(
+            arc_mxd, recipe.export_path, recipe.core_file_name,
+            get_resolutions(self.export_settings, self.hum_event)['pdf'], **self.export_settings.pdf_options)
+        recipe.export_metadata.update(metadata)
         return pdf_fpath
 
-    def export_png_thumbnail(self, recipe, arc_mxd):
-        # PNG Thumbnail.  Need to create a larger image first.
-        # If this isn't done, the thumbnail is pixelated amd doesn't look good
-        tmp_fname = "tmp-thumbnail.png"
-        tmp_fpath = os.path.join(recipe.export_path, tmp_fname)
-        arcpy.mapping.ExportToPNG(arc_mxd, tmp_fpath)
-
-        png_fname = "thumbnail.png"
-        png_fpath = os.path.join(recipe.export_path, png_fname)
-
-        # Resize the thumbnail
-        fd_img = open(tmp_fpath, 'r+b')
-        img = Image.open(fd_img)
-        img = resizeimage.resize('thumbnail', img, [140, 99])
-        img.save(png_fpath, img.format)
-        fd_img.close()
-
-        # Remove the temporary larger thumbnail
-        os.remove(tmp_fpath)
+    def export_png_thumbnail(self, recipe, arc_mxd, src_path=None):
+        """
+        If `src_path` is supplied the thumbnail is made from that image (see
+        `export_workers.derive_png_thumbnail`) and `arc_mxd` is not rendered.
+        """
+        if src_path:
+            png_fpath, metadata = export_workers.derive_png_thumbnail(src_path, recipe.export_path)
+        else:
+            png_fpath, metadata = export_workers.export_png_thumbnail(arc_mxd, recipe.export_path)
         return png_fpath
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import logging
+import os
+
+from change_detection import hash_file, load_manifest, write_manifest
+
+CHECKPOINT_VERSION = 1
+
+
+def get_checkpoint_path(map_project_path):
+    """
+    Returns the path of the atlas checkpoint file stored alongside the MXD.
+    """
+    return os.path.splitext(map_project_path)[0] + '-atlas-checkpoint.json'
+
+
+def get_page_key(page):
+    return unicode(page.region)
+
+
+def get_page_fingerprint(page, dpi, mxd_md5, pdf_options=None):
+    """
+    Returns a digest of everything which affects the content of the PDF for `page`: the MXD, the extent and
+    text of the page, the resolution and any other options passed to `arcpy.mapping.ExportToPDF`.
+    """
+    definition = {
+        'mxd_md5': mxd_md5,
+        'region': get_page_key(page),
+        'extent': list(page.extent),
+        'texts': page.texts,
+        'dpi': str(dpi),
+        'pdf_fname': os.path.basename(page.pdf_path)
+    }
+    if pdf_options:
+        definition['pdf_options'] = pdf_options
+    return hashlib.md5(json.dumps(definition, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class AtlasCheckpoint:
+    """
+    Records each page of an atlas as it is exported, so that if the export is interrupted a rerun only
+    needs to render the pages which are missing or stale.
+
+    For each page the checkpoint holds the fingerprint of its inputs (see `get_page_fingerprint`) and the
+    path, size and MD5 of the PDF. A page is only skipped if its fingerprint is unchanged and the PDF on disk
+    still matches.
+    """
+
+    def __init__(self, checkpoint_path, mxd_path, dpi, pdf_options=None):
+        self.checkpoint_path = checkpoint_path
+        self.dpi = dpi
+        self.pdf_options = pdf_options
+        self.mxd_md5 = hash_file(mxd_path)
+        checkpoint = load_manifest(checkpoint_path)
+        if checkpoint and checkpoint.get('version') == CHECKPOINT_VERSION:
+            self.pages = checkpoint.get('pages', {})
+        else:
+            self.pages = {}
+        # The pages which are to be exported, keyed on page index
+        self._pending = {}
+
+    def is_complete(self, page):
+        """
+        @returns: True if the PDF for `page` has already been exported from the same inputs, and has not
+                  since been modified.
+        """
+        entry = self.pages.get(get_page_key(page))
+        if not entry or entry['fingerprint'] != get_page_fingerprint(page, self.dpi, self.mxd_md5, self.pdf_options):
+            return False
+
+        if entry['path'] != page.pdf_path or not os.path.exists(page.pdf_path):
+            return False
+
+        return os.path.getsize(page.pdf_path) == entry['size'] and hash_file(page.pdf_path) == entry['md5']
+
+    def get_pending(self, pages):
+        """
+        Returns those of `pages` which still need to be exported. Entries for regions which are no longer
+        part of the atlas are discarded.
+        """
+        keys = set(get_page_key(page) for page in pages)
+        for key in set(self.pages) - keys:
+            del self.pages[key]
+
+        pending = [page for page in pages if not self.is_complete(page)]
+        for page in pending:
+            self.pages.pop(get_page_key(page), None)
+
+        self._pending = dict((page.index, page) for page in pending)
+        logging.info('{} of the {} atlas pages are already complete'.format(
+            len(pages) - len(pending), len(pages)))
+        return pending
+
+    def record(self, result):
+        """
+        Records the result of exporting a page which was returned by `get_pending`, and writes the
+        checkpoint. Failed pages are not recorded.
+        """
+        page = self._pending.pop(result['index'])
+        if result['error']:
+            return
+
+        self.pages[get_page_key(page)] = {
+            'fingerprint': get_page_fingerprint(page, self.dpi, self.mxd_md5, self.pdf_options),
+            'path': page.pdf_path,
+            'size': os.path.getsize(page.pdf_path),
+            'md5': hash_file(page.pdf_path)
+        }
+        self.save()
+
+    def save(self):
+        write_manifest(self.checkpoint_path, {'version': CHECKPOINT_VERSION, 'pages': self.pages})
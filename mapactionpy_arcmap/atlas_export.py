@@ -0,0 +1,216 @@
+import arcpy
+import logging
+import multiprocessing
+import os
+import traceback
+from collections import namedtuple, OrderedDict
+from timeit import default_timer
+from slugify import slugify
+
+from doc_index import DocumentIndex
+
+# A single page of an atlas. `extent` is a tuple of (xmin, ymin, xmax, ymax) in the coordinate system of the
+# map frame and `texts` is a dict of the new text for each text element, keyed on element name. Everything
+# here is a plain value, so that a page can be passed to a worker process.
+AtlasPage = namedtuple('AtlasPage', ['index', 'region', 'pdf_path', 'texts', 'extent'])
+
+
+def iter_region_features(data_source, query_column, where_clause=None, spatial_reference=None):
+    """
+    Streams the (region, extent) of each feature of the atlas layer, using a single read-only cursor. Only
+    one row is held in memory at a time. Features with a null region or geometry are skipped.
+
+    @param data_source: The data source of the atlas layer.
+    @param query_column: The column which identifies each region.
+    @param where_clause: (optional) Only features matching this are included, eg the definition query of
+                         the layer.
+    @param spatial_reference: (optional) The extents are projected into this spatial reference, eg that of
+                              the map frame.
+    @returns: A generator of (region, (xmin, ymin, xmax, ymax)) tuples.
+    """
+    with arcpy.da.SearchCursor(data_source, [query_column, 'SHAPE@'], where_clause=where_clause,
+                               spatial_reference=spatial_reference) as cursor:
+        for region, geometry in cursor:
+            if region is None or geometry is None:
+                continue
+            ext = geometry.extent
+            yield region, (ext.XMin, ext.YMin, ext.XMax, ext.YMax)
+
+
+def plan_atlas_regions(region_features):
+    """
+    Combines the extents of the features of each region. Memory use grows with the number of distinct
+    regions, rather than the number of features.
+
+    @param region_features: An iterable of (region, extent) tuples, eg from `iter_region_features`.
+    @returns: An OrderedDict of the extent of each distinct region, in the order in which each region was
+              first seen.
+    """
+    regions = OrderedDict()
+    for region, (xmin, ymin, xmax, ymax) in region_features:
+        current = regions.get(region)
+        if current is None:
+            regions[region] = (xmin, ymin, xmax, ymax)
+        else:
+            regions[region] = (min(current[0], xmin), min(current[1], ymin),
+                               max(current[2], xmax), max(current[3], ymax))
+
+    return regions
+
+
+def get_atlas_page_path(export_dir, core_file_name, region, dpi):
+    """
+    Returns the path of the PDF for the page of an atlas for `region`.
+    """
+    pdf_fname = core_file_name + "-" + slugify(unicode(region)) + "-" + str(dpi) + "dpi.pdf"
+    return os.path.join(export_dir, pdf_fname)
+
+
+def plan_atlas_pages(region_extents, export_dir, core_file_name, dpi, text_element_names, page_renderer, context):
+    """
+    Works out the output path and the marginalia text of every page of an atlas up front, in this process,
+    so that the pages can be rendered by worker processes which do not have access to the recipe or the
+    event.
+
+    @param region_extents: An OrderedDict of the extent of each region, in page order (see
+                           `plan_atlas_regions`).
+    @param text_element_names: The names of the text elements in the layout.
+    @param page_renderer: A MarginaliaRenderer with the handlers for the atlas pages.
+    @param context: The MarginaliaContext common to every page. A `region` value is added for each page.
+    @returns: A list of AtlasPage.
+    """
+    pages = []
+    for index, (region, extent) in enumerate(region_extents.items()):
+        page_context = context.derive(region=region)
+        texts = {}
+        for elm_name in text_element_names:
+            handler = page_renderer.handlers.get(elm_name)
+            if handler is None:
+                continue
+            new_text = handler(page_context)
+            if new_text is not None:
+                texts[elm_name] = new_text
+
+        pdf_path = get_atlas_page_path(export_dir, core_file_name, region, dpi)
+        pages.append(AtlasPage(index, region, pdf_path, texts, extent))
+
+    return pages
+
+
+def render_atlas_page(arc_mxd, arc_df, page, text_elements, dpi, pdf_options=None):
+    """
+    Renders a single page of an atlas: zooms to the region, updates the text elements and exports the PDF.
+    The extent comes from the page itself, so the atlas layer does not need to be selected.
+
+    @param pdf_options: (optional) A dict of keyword arguments for `arcpy.mapping.ExportToPDF`.
+    """
+    arc_df.extent = arcpy.Extent(*page.extent)
+
+    for elm in text_elements:
+        new_text = page.texts.get(elm.name)
+        if new_text is not None and elm.text != new_text:
+            elm.text = new_text
+
+    logging.info('About to export atlas page for region; {}.'.format(page.region))
+    arcpy.mapping.ExportToPDF(arc_mxd, page.pdf_path, resolution=int(dpi), **(pdf_options or {}))
+    logging.info('Completed exporting atlas page for for region; {}.'.format(page.region))
+
+
+def _page_result(page, seconds, error):
+    return {'index': page.index, 'region': page.region, 'path': page.pdf_path, 'seconds': seconds, 'error': error}
+
+
+def export_atlas_pages(arc_mxd, arc_df, pages, dpi, text_elements=None, on_result=None, pdf_options=None):
+    """
+    Renders each of `pages` in turn. A failure to render one page is recorded in its result and does not
+    prevent the remaining pages from being rendered.
+
+    @param on_result: (optional) Called with the result of each page as soon as it has been rendered.
+    @param pdf_options: (optional) A dict of keyword arguments for `arcpy.mapping.ExportToPDF`.
+    @returns: A list of dicts, one per page, with the keys `index`, `region`, `path`, `seconds` and `error`.
+              `error` is None if the page was exported successfully.
+    """
+    if text_elements is None:
+        text_elements = arcpy.mapping.ListLayoutElements(arc_mxd, "TEXT_ELEMENT")
+
+    results = []
+    for page in pages:
+        start = default_timer()
+        error = None
+        try:
+            render_atlas_page(arc_mxd, arc_df, page, text_elements, dpi, pdf_options)
+        except Exception:
+            error = traceback.format_exc()
+            logging.error('Failed to export atlas page for region; {}.\n{}'.format(page.region, error))
+
+        result = _page_result(page, default_timer() - start, error)
+        if on_result:
+            on_result(result)
+        results.append(result)
+
+    return results
+
+
+# The MXD opened by each worker process. See `_init_atlas_worker`.
+_worker_state = {}
+
+
+def _init_atlas_worker(mxd_path, frame_name, dpi, pdf_options=None):
+    """
+    Opens the MXD once in each worker process, rather than once per page.
+    """
+    _worker_state.clear()
+    _worker_state['dpi'] = dpi
+    _worker_state['pdf_options'] = pdf_options
+    try:
+        arc_mxd = arcpy.mapping.MapDocument(mxd_path)
+        _worker_state['arc_mxd'] = arc_mxd
+        _worker_state['arc_df'] = DocumentIndex(arc_mxd).get_frame(frame_name)
+        _worker_state['text_elements'] = arcpy.mapping.ListLayoutElements(arc_mxd, "TEXT_ELEMENT")
+    except Exception:
+        # None of the pages given to this worker can be rendered
+        _worker_state['error'] = traceback.format_exc()
+
+
+def run_atlas_page(page):
+    """
+    Renders a single page of an atlas in a worker process.
+
+    @returns: The result, as for `export_atlas_pages`.
+    """
+    if 'error' in _worker_state:
+        return _page_result(page, 0, _worker_state['error'])
+
+    return export_atlas_pages(_worker_state['arc_mxd'], _worker_state['arc_df'], [page], _worker_state['dpi'],
+                              _worker_state['text_elements'], pdf_options=_worker_state['pdf_options'])[0]
+
+
+def export_atlas_in_parallel(mxd_path, frame_name, pages, dpi, processes, on_result=None, pdf_options=None):
+    """
+    Renders `pages` using a pool of worker processes. Each worker takes the next page as soon as it has
+    finished the previous one.
+
+    @param mxd_path: The path to the MXD. It must have been saved, as each worker opens its own copy.
+    @param frame_name: The name of the map frame containing the atlas layer.
+    @param pages: A list of AtlasPage.
+    @param dpi: The resolution of the PDFs.
+    @param processes: The number of worker processes.
+    @param on_result: (optional) Called, in this process, with the result of each page as soon as it has
+                      been rendered.
+    @param pdf_options: (optional) A dict of keyword arguments for `arcpy.mapping.ExportToPDF`.
+    @returns: A list of results (see `export_atlas_pages`), in page order regardless of which worker
+              rendered each page.
+    """
+    pool = multiprocessing.Pool(processes=max(1, min(processes, len(pages))),
+                                initializer=_init_atlas_worker, initargs=(mxd_path, frame_name, dpi, pdf_options))
+    results = []
+    try:
+        for result in pool.imap_unordered(run_atlas_page, pages):
+            if on_result:
+                on_result(result)
+            results.append(result)
+    finally:
+        pool.close()
+        pool.join()
+
+    return sorted(results, key=lambda r: r['index'])
@@ -0,0 +1,245 @@
+import hashlib
+import json
+import logging
+import os
+import re
+
+from recipe_diff import FRAME_FIELDS, FULL_COOK_LAYER_FIELDS, IN_PLACE_LAYER_FIELDS, as_plain
+
+MANIFEST_VERSION = 1
+HASH_CHUNK_SIZE = 1024 * 1024
+
+_GDB_REGEX = re.compile(r'^(.*?\.gdb)([\\/].*)?$', re.IGNORECASE)
+
+# The sidecar files of a shapefile or raster, which replace the extension of the data source (eg `roads.dbf`)
+SIDECAR_EXTENSIONS = ('.shp', '.shx', '.dbf', '.prj', '.cpg', '.sbn', '.sbx', '.fbn', '.fbx', '.ain', '.aih',
+                      '.atx', '.ixs', '.mxs', '.qix', '.tfw', '.tifw', '.jgw', '.pgw', '.wld', '.rrd', '.aux')
+# The sidecar files which are appended to the full name of the data source (eg `roads.shp.xml`)
+APPENDED_SIDECAR_EXTENSIONS = ('.xml', '.aux.xml', '.ovr', '.aux', '.rrd', '.vat.dbf')
+
+# The attributes of the Event which appear on the map, or which set the resolution of the exports
+EVENT_FIELDS = ('country_name', 'glide_number', 'default_donor_credits', 'default_disclaimer_text',
+                'default_source_organisation', 'deployment_primary_email', 'default_source_organisation_url',
+                'default_pdf_res_dpi', 'default_jpeg_res_dpi')
+
+
+def get_manifest_path(map_project_path):
+    """
+    Returns the path of the manifest file stored alongside the MXD.
+    """
+    return os.path.splitext(map_project_path)[0] + '-manifest.json'
+
+
+def hash_file(f_path, chunk_size=HASH_CHUNK_SIZE):
+    """
+    Returns the MD5 hex digest of the contents of `f_path`. The file is read in chunks so that memory use
+    is constant regardless of the size of the file. (A memory map is not used, as a multi-GB raster can not
+    be mapped into the address space of the 32-bit Python which ships with ArcMap.)
+    """
+    md5 = hashlib.md5()
+    with open(f_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            md5.update(chunk)
+
+    return md5.hexdigest()
+
+
+def get_data_source_container(data_source_path):
+    """
+    Returns the real path of the file geodatabase which contains `data_source_path`, or of the data source
+    itself if it is not within a file geodatabase. Every feature class in the same geodatabase has the same
+    container, and so the same related files.
+    """
+    r_path = os.path.realpath(data_source_path)
+    gdb = _GDB_REGEX.match(r_path)
+    if gdb:
+        return gdb.group(1)
+    return r_path
+
+
+def get_related_files(data_source_path):
+    """
+    Returns all of the files which make up a data source, eg each of the sidecar files of a shapefile
+    (`.shx`, `.dbf`, `.prj`, ...) or a raster (`.aux.xml`, `.ovr`, `.tfw`, ...), or every file within a file
+    geodatabase. Only the known sidecar extensions are matched, so that lock files (eg `roads.shp.1234.sr.lock`),
+    which only exist while the data source is open, and unrelated files which share its name are excluded.
+
+    @returns: A sorted list of the real paths of the files which exist.
+    """
+    r_path = get_data_source_container(data_source_path)
+    if os.path.isdir(r_path):
+        related = set()
+        for dir_path, dir_names, file_names in os.walk(r_path):
+            # The lock files of a file geodatabase change whenever it is opened
+            related.update(os.path.join(dir_path, f) for f in file_names if not f.endswith('.lock'))
+        return sorted(related)
+
+    stem = os.path.splitext(r_path)[0]
+    candidates = [r_path]
+    candidates.extend(stem + ext for ext in SIDECAR_EXTENSIONS)
+    candidates.extend(r_path + ext for ext in APPENDED_SIDECAR_EXTENSIONS)
+    return sorted(set(f_path for f_path in candidates if os.path.isfile(f_path)))
+
+
+def get_recipe_digest(recipe, hum_event=None):
+    """
+    Returns a digest of those parts of `recipe`, and of the Event `hum_event`, which affect the content of
+    the map.
+    """
+    frames = []
+    for recipe_frame in recipe.map_frames:
+        frame = dict((f, as_plain(getattr(recipe_frame, f, None))) for f in FRAME_FIELDS)
+        frame['name'] = recipe_frame.name
+        lyr_fields = ('name',) + FULL_COOK_LAYER_FIELDS + IN_PLACE_LAYER_FIELDS
+        frame['layers'] = [
+            dict((f, as_plain(getattr(lyr, f, None))) for f in lyr_fields) for lyr in recipe_frame.layers]
+        frames.append(frame)
+
+    atlas = getattr(recipe, 'atlas', None)
+    definition = {
+        'product': recipe.product,
+        'summary': recipe.summary,
+        'category': recipe.category,
+        'template': os.path.basename(getattr(recipe, 'template_path', None) or ''),
+        'atlas': [getattr(atlas, f, None) for f in ('map_frame', 'layer_name', 'column_name')] if atlas else None,
+        'map_frames': frames,
+        'event': dict((f, as_plain(getattr(hum_event, f, None))) for f in EVENT_FIELDS) if hum_event else None
+    }
+    return hashlib.md5(json.dumps(definition, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ChangeDetector:
+    """
+    Determines whether any of the inputs to a product (its layer files, data sources, template and recipe)
+    have changed since a previous version was produced, using a manifest of file fingerprints stored
+    alongside each MXD.
+
+    For each file the size and mtime are checked first. A file is only hashed if its size is unchanged
+    but its mtime differs. Writing a manifest never hashes a file; it records the size and mtime, plus any
+    hash already known for that size and mtime.
+    """
+
+    def __init__(self, hum_event=None):
+        """
+        Arguments:
+           hum_event {Event} -- (optional) The Event, whose values shown on the map are included in the
+                                recipe digest.
+        """
+        self.hum_event = hum_event
+        # Keyed on (path, size, mtime)
+        self._hashes = dict()
+        self.files_hashed = 0
+
+    def _get_hash(self, f_path, size, mtime):
+        key = (f_path, size, mtime)
+        if key not in self._hashes:
+            self.files_hashed += 1
+            self._hashes[key] = hash_file(f_path)
+        return self._hashes[key]
+
+    def get_input_files(self, recipe):
+        """
+        Returns a sorted list of every file which is an input to `recipe`.
+        """
+        inputs = set()
+        template_path = getattr(recipe, 'template_path', None)
+        if template_path and os.path.exists(template_path):
+            inputs.add(os.path.realpath(template_path))
+
+        for recipe_frame in recipe.map_frames:
+            for recipe_lyr in recipe_frame.layers:
+                lyr_path = getattr(recipe_lyr, 'layer_file_path', None)
+                if lyr_path and os.path.exists(lyr_path):
+                    inputs.add(os.path.realpath(lyr_path))
+
+                data_source_path = getattr(recipe_lyr, 'data_source_path', None)
+                if data_source_path:
+                    inputs.update(get_related_files(data_source_path))
+
+        return sorted(inputs)
+
+    def build_manifest(self, recipe, previous_manifest=None):
+        """
+        Creates the manifest for `recipe`. Hashes are carried forward from `previous_manifest` for any
+        file whose size and mtime are unchanged, or taken from those calculated by `get_changes`. No file is
+        hashed here.
+        """
+        previous_files = (previous_manifest or {}).get('files', {})
+        files = {}
+        for f_path in self.get_input_files(recipe):
+            stat = os.stat(f_path)
+            entry = {'size': stat.st_size, 'mtime': stat.st_mtime, 'md5': None}
+            prev = previous_files.get(f_path)
+            if prev and prev['size'] == entry['size'] and prev['mtime'] == entry['mtime']:
+                entry['md5'] = prev.get('md5')
+            else:
+                entry['md5'] = self._hashes.get((f_path, stat.st_size, stat.st_mtime))
+            files[f_path] = entry
+
+        return {
+            'version': MANIFEST_VERSION,
+            'recipe_digest': get_recipe_digest(recipe, self.hum_event),
+            'files': files
+        }
+
+    def get_changes(self, recipe, previous_manifest):
+        """
+        Compares the current inputs of `recipe` with `previous_manifest`.
+
+        @returns: A list of descriptions of the changes. An empty list means that nothing has changed.
+        """
+        if not previous_manifest or previous_manifest.get('version') != MANIFEST_VERSION:
+            return ['There is no usable manifest for the previous version']
+
+        changes = []
+        if previous_manifest.get('recipe_digest') != get_recipe_digest(recipe, self.hum_event):
+            changes.append('The recipe has changed')
+
+        previous_files = previous_manifest.get('files', {})
+        current_files = self.get_input_files(recipe)
+        for f_path in sorted(set(previous_files) - set(current_files)):
+            changes.append('{} is no longer an input'.format(f_path))
+
+        for f_path in current_files:
+            prev = previous_files.get(f_path)
+            if prev is None:
+                changes.append('{} is a new input'.format(f_path))
+                continue
+
+            stat = os.stat(f_path)
+            if stat.st_size != prev['size']:
+                changes.append('{} has changed size'.format(f_path))
+            elif stat.st_mtime != prev['mtime']:
+                # Hashed even if there is no previous hash to compare with (in which case the file is treated as
+                # modified), so that `build_manifest` can record the hash and a later `touch` is not a change
+                current_md5 = self._get_hash(f_path, stat.st_size, stat.st_mtime)
+                if current_md5 != prev.get('md5'):
+                    changes.append('{} has been modified'.format(f_path))
+
+        return changes
+
+    def have_inputs_changed(self, recipe, previous_manifest_path):
+        """
+        @returns: True if the inputs to `recipe` have changed since the manifest at `previous_manifest_path`
+                  was written, or if that manifest does not exist.
+        """
+        changes = self.get_changes(recipe, load_manifest(previous_manifest_path))
+        for change in changes:
+            logging.debug('Change detected for "{}": {}'.format(recipe.product, change))
+        return bool(changes)
+
+
+def load_manifest(manifest_path):
+    """
+    @returns: The manifest, or None if it does not exist or cannot be read.
+    """
+    try:
+        with open(manifest_path, 'r') as manifest_file:
+            return json.load(manifest_file)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def write_manifest(manifest_path, manifest):
+    with open(manifest_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=4, sort_keys=True)
@@ -0,0 +1,102 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from timeit import default_timer
+
+# Calls counted outside of any named stage are attributed to this stage.
+DEFAULT_STAGE = 'other'
+
+
+class CookProfile:
+    """
+    Records the wall time spent in, and the number of arcpy calls made during, each stage of a cook
+    or export (eg "layer_reset", "add_layer", "legend", "export_pdf").
+
+    Code which makes arcpy calls wraps them in `with profile.stage('name'):` and calls
+    `profile.count_calls()` alongside each arcpy call. Stages may be nested, in which case calls are
+    attributed to the innermost stage only. For each stage both `seconds` (excluding time spent in
+    nested stages) and `total_seconds` (including them) are recorded.
+
+    The overhead is two timer reads per stage entry, so the profile is always enabled.
+    """
+
+    def __init__(self):
+        self._stages = OrderedDict()
+        self._active = []
+        # For each active stage, the time spent so far in the stages nested within it
+        self._nested_seconds = []
+
+    def _get_stage(self, name):
+        if name not in self._stages:
+            self._stages[name] = {'arcpy_calls': 0, 'entries': 0, 'seconds': 0.0, 'total_seconds': 0.0}
+
+        return self._stages[name]
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Context manager which attributes any calls counted, and the time spent, within it to the stage
+        `name`.
+        """
+        stats = self._get_stage(name)
+        stats['entries'] += 1
+        self._active.append(name)
+        self._nested_seconds.append(0.0)
+        start = default_timer()
+        try:
+            yield
+        finally:
+            elapsed = default_timer() - start
+            self._active.pop()
+            nested = self._nested_seconds.pop()
+            stats['total_seconds'] += elapsed
+            stats['seconds'] += elapsed - nested
+            if self._nested_seconds:
+                self._nested_seconds[-1] += elapsed
+
+    def count_calls(self, num_calls=1, stage=None):
+        """
+        Records `num_calls` arcpy calls against `stage`, or if `stage` is None, against the innermost
+        active stage.
+        """
+        if stage is None:
+            stage = self._active[-1] if self._active else DEFAULT_STAGE
+
+        self._get_stage(stage)['arcpy_calls'] += num_calls
+
+    def record(self, stage, seconds, num_calls=1):
+        """
+        Records time which was measured elsewhere (eg in a worker process) against `stage`, as a single
+        entry.
+        """
+        stats = self._get_stage(stage)
+        stats['entries'] += 1
+        stats['arcpy_calls'] += num_calls
+        stats['seconds'] += seconds
+        stats['total_seconds'] += seconds
+
+    def get_calls(self, stage):
+        """
+        Returns the number of arcpy calls recorded against `stage`.
+        """
+        return self._stages.get(stage, {}).get('arcpy_calls', 0)
+
+    def get_total_calls(self):
+        return sum(s['arcpy_calls'] for s in self._stages.values())
+
+    def get_seconds(self, stage):
+        """
+        Returns the wall time spent in `stage`, excluding any stages nested within it.
+        """
+        return self._stages.get(stage, {}).get('seconds', 0.0)
+
+    def get_total_seconds(self):
+        """
+        Returns the total wall time spent within all of the stages.
+        """
+        return sum(s['seconds'] for s in self._stages.values())
+
+    def as_dict(self):
+        """
+        Returns the profile as a dict, suitable for writing to the run report.
+        """
+        return OrderedDict((name, dict(values)) for name, values in self._stages.items())
@@ -0,0 +1,132 @@
+import arcpy
+import logging
+import os
+from map_chef import MapChef
+from layer_cache import LayerFileCache
+
+
+class CookingSession:
+    """
+    Cooks a stream of recipes one after another, keeping as much as possible warm between products.
+
+    Each template MXD is opened once and held in memory by its own MapChef. For each recipe the chef
+    restores only the state which the previous recipe changed (its layers, frame spatial references and
+    extents, and text elements), cooks the new recipe into the same in-memory document and then writes
+    the result to `recipe.map_project_path` using `saveACopy`. The template on disk is never modified.
+
+    Parsed layer files, the index of the data frames and layers, the list of text elements and
+    per-WKID spatial references are all reused between recipes which share a template.
+    """
+
+    def __init__(self, crash_move_folder, hum_event, layer_cache=None, marginalia_handlers=None,
+                 deferred_save=True):
+        """
+        Arguments:
+           crash_move_folder {CrashMoveFolder} -- CrashMoveFolder Object
+           hum_event {Event} -- Event Object
+           layer_cache {LayerFileCache} -- (optional) Shared cache of parsed layer files.
+           marginalia_handlers {dict} -- (optional) Passed on to each MapChef.
+           deferred_save {bool} -- Passed on to each MapChef.
+        """
+        self.crash_move_folder = crash_move_folder
+        self.hum_event = hum_event
+        if layer_cache is None:
+            layer_cache = LayerFileCache(arcpy.mapping.Layer)
+        self.layer_cache = layer_cache
+        self.marginalia_handlers = marginalia_handlers
+        self.deferred_save = deferred_save
+
+        # Keyed on the normalised template path. Values are (template mtime, MapChef)
+        self._chefs = dict()
+        self.cook_count = 0
+        self.documents_opened = 0
+
+    def _template_key(self, template_path):
+        return os.path.normcase(os.path.realpath(template_path))
+
+    def _create_chef(self, mxd_path):
+        self.documents_opened += 1
+        mxd = arcpy.mapping.MapDocument(mxd_path)
+        return MapChef(mxd, self.crash_move_folder, self.hum_event,
+                       deferred_save=self.deferred_save,
+                       layer_cache=self.layer_cache,
+                       marginalia_handlers=self.marginalia_handlers)
+
+    def get_chef(self, recipe):
+        """
+        Returns the MapChef which will cook `recipe`.
+
+        If `recipe.template_path` is available the chef holding that template open is returned (after
+        reopening it if the template file has changed on disk). Otherwise a new single-use chef is
+        created for `recipe.map_project_path`.
+        """
+        template_path = getattr(recipe, 'template_path', None)
+        if not template_path or not os.path.exists(template_path):
+            return self._create_chef(recipe.map_project_path)
+
+        key = self._template_key(template_path)
+        mtime = os.path.getmtime(template_path)
+        cached = self._chefs.get(key)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        if cached:
+            logging.info('Template {} has changed on disk. Reopening it'.format(template_path))
+
+        chef = self._create_chef(template_path)
+        chef.reuse_document = True
+        self._chefs[key] = (mtime, chef)
+        return chef
+
+    def cook(self, recipe):
+        """
+        Cooks `recipe` and writes the resulting MXD to `recipe.map_project_path`.
+
+        @param recipe: A MapRecipe with both `map_project_path` and (ideally) `template_path` set.
+        @returns: The MapChef which cooked the recipe. Its `mxd` is the in-memory document, which stays
+                  valid until the next recipe using the same template is cooked.
+        """
+        chef = self.get_chef(recipe)
+        if chef.reuse_document:
+            chef.output_path = recipe.map_project_path
+
+        try:
+            chef.cook(recipe)
+        except Exception:
+            # The chef has rolled back its own edits, but the state of the template can no longer be
+            # trusted. Drop it so that it is reopened from disk for the next recipe.
+            self.evict(recipe)
+            raise
+
+        self.cook_count += 1
+        return chef
+
+    def cook_all(self, recipes):
+        """
+        Generator which cooks each recipe in `recipes` in turn, yielding each recipe once it has been
+        cooked.
+        """
+        for recipe in recipes:
+            self.cook(recipe)
+            yield recipe
+
+    def evict(self, recipe):
+        """
+        Discards the open template document (if any) used for `recipe`.
+        """
+        template_path = getattr(recipe, 'template_path', None)
+        if template_path:
+            self._chefs.pop(self._template_key(template_path), None)
+
+    def close(self):
+        """
+        Releases all of the open template documents.
+        """
+        self._chefs.clear()
+
+    def get_stats(self):
+        return {
+            'recipes_cooked': self.cook_count,
+            'documents_opened': self.documents_opened,
+            'open_templates': len(self._chefs)
+        }
@@ -0,0 +1,170 @@
+import os
+import re
+from collections import OrderedDict
+
+ESRI_DATASET_TYPES = [
+    "SHAPEFILE_WORKSPACE",
+    "RASTER_WORKSPACE",
+    "FILEGDB_WORKSPACE",
+    "ACCESS_WORKSPACE",
+    "ARCINFO_WORKSPACE",
+    "CAD_WORKSPACE",
+    "EXCEL_WORKSPACE",
+    "OLEDB_WORKSPACE",
+    "PCCOVERAGE_WORKSPACE",
+    "SDE_WORKSPACE",
+    "TEXT_WORKSPACE",
+    "TIN_WORKSPACE",
+    "VPF_WORKSPACE"
+]
+
+# Evaluated in order, against the path with all separators converted to '/'. The first match wins, so
+# datasets within a geodatabase (whose names may contain a '.') are listed before the file extensions.
+DATASET_TYPE_PATTERNS = [
+    # Feature classes, tables and raster catalogues within a geodatabase
+    (r'\.gdb/.+', 'FILEGDB_WORKSPACE'),
+    (r'\.mdb/.+', 'ACCESS_WORKSPACE'),
+    (r'\.sde/.+', 'SDE_WORKSPACE'),
+    (r'\.odc/.+', 'OLEDB_WORKSPACE'),
+    # Worksheets within a spreadsheet eg `admin.xls/Sheet1$`. The spreadsheet itself is not a dataset.
+    (r'\.xlsx?/.+', 'EXCEL_WORKSPACE'),
+    (r'\.shp$', 'SHAPEFILE_WORKSPACE'),
+    (r'\.(tif|tiff|gtif|geotiff|img|jp2|ecw|sid|bil|bip|bsq|dem|dt[0-2]|asc|png|jpg|jpeg)$', 'RASTER_WORKSPACE'),
+    (r'\.(dwg|dxf|dgn)(/.+)?$', 'CAD_WORKSPACE'),
+    (r'\.(csv|txt)$', 'TEXT_WORKSPACE')
+]
+# Not supported, as `MapChef.replace_data_source` uses the directory containing the data source as its
+# workspace:
+#   * ESRI GRIDs and TINs, which are themselves directories. Their workspace is the directory above, and the
+#     `.adf` files within them are not data sources in their own right.
+#   * ArcInfo interchange (`.e00`) files, which must be imported before they can be used.
+#   * MapInfo (`.tab`) files, which have no workspace type of their own.
+
+
+class UnsupportedDatasetTypeError(ValueError):
+    """
+    Raised when the ESRI dataset type of one or more data sources cannot be determined from their paths.
+    """
+
+    def __init__(self, paths):
+        self.paths = list(paths)
+        super(UnsupportedDatasetTypeError, self).__init__(
+            'Unsupported dataset type with path(s): {}'.format(', '.join(self.paths)))
+
+
+class DatasetTypeResolver:
+    """
+    Determines the ESRI dataset type (as used by `Layer.replaceDataSource`) from the path of a data
+    source. The patterns are compiled once and the result for each path is memoized.
+    """
+
+    def __init__(self, patterns=None):
+        """
+        Arguments:
+           patterns {list} -- (optional) A list of (regex, dataset type) tuples. Defaults to
+                              `DATASET_TYPE_PATTERNS`.
+        """
+        if patterns is None:
+            patterns = DATASET_TYPE_PATTERNS
+
+        self._patterns = [(re.compile(reg_ex, re.IGNORECASE), dataset_type) for reg_ex, dataset_type in patterns]
+        self._cache = dict()
+
+    def _lookup(self, f_path):
+        normalised = f_path.replace('\\', '/').rstrip('/')
+        for reg_ex, dataset_type in self._patterns:
+            if reg_ex.search(normalised):
+                return dataset_type
+
+        return None
+
+    def get_dataset_type(self, f_path):
+        """
+        @param f_path: The path of the data source.
+        @returns: One of `ESRI_DATASET_TYPES`.
+        @raises UnsupportedDatasetTypeError: If the dataset type cannot be determined.
+        """
+        try:
+            dataset_type = self._cache[f_path]
+        except KeyError:
+            dataset_type = self._cache[f_path] = self._lookup(f_path)
+
+        if dataset_type is None:
+            raise UnsupportedDatasetTypeError([f_path])
+
+        return dataset_type
+
+    def classify(self, paths):
+        """
+        Determines the dataset type of every path in `paths`, without raising an exception.
+
+        @param paths: An iterable of data source paths.
+        @returns: A tuple of (an OrderedDict of path to dataset type, a list of the unsupported paths).
+        """
+        resolved = OrderedDict()
+        unsupported = []
+        for f_path in paths:
+            if f_path in resolved or f_path in unsupported:
+                continue
+            try:
+                resolved[f_path] = self.get_dataset_type(f_path)
+            except UnsupportedDatasetTypeError:
+                unsupported.append(f_path)
+
+        return resolved, unsupported
+
+    def resolve_all(self, paths):
+        """
+        As `classify`, but raises a single UnsupportedDatasetTypeError listing every unsupported path.
+
+        @returns: An OrderedDict of path to dataset type.
+        """
+        resolved, unsupported = self.classify(paths)
+        if unsupported:
+            raise UnsupportedDatasetTypeError(unsupported)
+
+        return resolved
+
+
+def get_recipe_data_source_paths(recipe):
+    """
+    Returns the real paths of the data sources of every layer in `recipe`. Layers which do not have
+    a `data_source_path` are skipped.
+    """
+    paths = []
+    for recipe_frame in recipe.map_frames:
+        for recipe_lyr in recipe_frame.layers:
+            data_source_path = getattr(recipe_lyr, 'data_source_path', None)
+            if data_source_path:
+                paths.append(os.path.realpath(data_source_path))
+
+    return paths
+
+
+_default_resolver = DatasetTypeResolver()
+
+
+def get_default_resolver():
+    """
+    Returns the DatasetTypeResolver shared by `get_dataset_type` and `resolve_recipe`, and hence by the
+    cook, so that other checks of the same data sources reuse its results.
+    """
+    return _default_resolver
+
+
+def get_dataset_type(f_path):
+    """
+    Returns the ESRI dataset type of `f_path` using the shared DatasetTypeResolver.
+    """
+    return _default_resolver.get_dataset_type(f_path)
+
+
+def resolve_recipe(recipe, resolver=None):
+    """
+    Determines the dataset type of every data source in `recipe` in one batch.
+
+    @raises UnsupportedDatasetTypeError: Listing every data source whose type cannot be determined.
+    @returns: An OrderedDict of path to dataset type.
+    """
+    resolver = resolver or _default_resolver
+    return resolver.resolve_all(get_recipe_data_source_paths(recipe))
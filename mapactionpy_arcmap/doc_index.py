@@ -0,0 +1,157 @@
+import arcpy
+import re
+from cook_profile import CookProfile
+
+
+def matches_wildcard(name, wildcard):
+    """
+    Returns True if `name` matches `wildcard` by the same rules as the `wildcard` argument of
+    `arcpy.mapping.ListDataFrames` and `arcpy.mapping.ListLayers`: the match is case-insensitive, `*` matches
+    any characters, and an empty wildcard matches every name. No other character is special.
+    """
+    if not wildcard:
+        return True
+
+    pattern = '.*'.join(re.escape(part) for part in wildcard.split('*'))
+    return re.match('(?:' + pattern + r')\Z', name, re.IGNORECASE | re.DOTALL) is not None
+
+
+class DocumentIndex:
+    """
+    An index of the data frames and layers within a MapDocument.
+
+    `arcpy.mapping.ListDataFrames` and `arcpy.mapping.ListLayers` walk the whole document on every call.
+    This index lists the data frames at most once and the layers of each data frame at most once (in both
+    cases on first use) and is then kept up to date as layers are added and removed, so that repeated
+    lookups do not require any further arcpy calls.
+    """
+
+    def __init__(self, arc_mxd, profile=None):
+        """
+        Arguments:
+           arc_mxd {MapDocument} -- The MapDocument to index.
+           profile {CookProfile} -- (optional) Records the arcpy calls made by the index.
+        """
+        self.mxd = arc_mxd
+        self.profile = profile if profile is not None else CookProfile()
+        # Populated lazily by `list_frames`
+        self._frames = None
+
+        # Keyed on `id(data_frame)`. Each value is a `(data_frame, layers)` tuple, so that the data frame
+        # is kept alive (and hence its id is not reused) for as long as it is in the index. Populated
+        # lazily by `list_layers`.
+        self._layers = {}
+        self._spatial_refs = {}
+
+    def list_frames(self):
+        """
+        Returns a list of all of the data frames in the document, in document order.
+        """
+        if self._frames is None:
+            self.profile.count_calls()
+            self._frames = list(arcpy.mapping.ListDataFrames(self.mxd))
+
+        return list(self._frames)
+
+    def get_frames(self, frame_name):
+        """
+        Returns a (possibly empty) list of the data frames whose names match `frame_name`, in document
+        order. As for `arcpy.mapping.ListDataFrames(mxd, frame_name)` the match is made by
+        `matches_wildcard`.
+        """
+        return [arc_df for arc_df in self.list_frames() if matches_wildcard(arc_df.name, frame_name)]
+
+    def get_frame(self, frame_name):
+        """
+        Returns the data frame whose name matches `frame_name` (see `get_frames`). If more than one data
+        frame matches, the last one is returned (consistent with `arcpy.mapping.ListDataFrames(...).pop()`).
+
+        Raises ValueError if there is no data frame with that name.
+        """
+        frames = self.get_frames(frame_name)
+        if not frames:
+            raise ValueError('MXD does not have a MapFrame (aka DataFrame) with the name "{}"'.format(
+                frame_name))
+        return frames[-1]
+
+    def list_layers(self, arc_df):
+        """
+        Returns the list of layers (including any sublayers) in the data frame `arc_df`, in the same
+        order as `arcpy.mapping.ListLayers`.
+        """
+        if id(arc_df) not in self._layers:
+            self.profile.count_calls()
+            self._layers[id(arc_df)] = (arc_df, list(arcpy.mapping.ListLayers(self.mxd, "", arc_df)))
+
+        return self._layers[id(arc_df)][1]
+
+    def get_layers(self, arc_df, lyr_name):
+        """
+        Returns a (possibly empty) list of the layers in data frame `arc_df` with the name `lyr_name`.
+        """
+        return [lyr for lyr in self.list_layers(arc_df) if lyr.name == lyr_name]
+
+    def is_empty(self):
+        """
+        Returns True if there are no layers in any data frame. If the layers have not yet been listed
+        this takes a single `ListLayers` call for the whole document, rather than one per data frame.
+        """
+        if all(id(arc_df) in self._layers for arc_df in self.list_frames()):
+            return not any(self._layers[id(arc_df)][1] for arc_df in self.list_frames())
+
+        self.profile.count_calls()
+        if arcpy.mapping.ListLayers(self.mxd):
+            return False
+
+        # Record that every frame is empty, so they do not need listing individually
+        for arc_df in self.list_frames():
+            self._layers[id(arc_df)] = (arc_df, [])
+        return True
+
+    def all_layers(self):
+        """
+        Generator which yields a `(data_frame, layer)` tuple for every layer in the document.
+        """
+        for arc_df in self.list_frames():
+            for lyr in self.list_layers(arc_df):
+                yield arc_df, lyr
+
+    def note_layer_added(self, arc_df):
+        """
+        Must be called after a layer has been added to `arc_df`. The object passed to
+        `arcpy.mapping.AddLayer` is not the same object as the one inserted into the document, so the
+        layers of `arc_df` will be listed again the next time they are requested.
+        """
+        self._layers.pop(id(arc_df), None)
+
+    def remove_layer(self, arc_df, lyr):
+        """
+        Removes the layer `lyr` from `arc_df` and from the index. If `lyr` is a group layer, its
+        sublayers are also removed from the index.
+        """
+        self.profile.count_calls()
+        arcpy.mapping.RemoveLayer(arc_df, lyr)
+        if id(arc_df) not in self._layers:
+            return
+
+        remaining = [indexed for indexed in self._layers[id(arc_df)][1] if indexed is not lyr]
+        if lyr.isGroupLayer:
+            prefix = lyr.longName + '\\'
+            remaining = [indexed for indexed in remaining if not indexed.longName.startswith(prefix)]
+        self._layers[id(arc_df)] = (arc_df, remaining)
+
+    def contains_layer(self, arc_df, lyr):
+        """
+        Returns True if `lyr` is still present in `arc_df`.
+        """
+        return any(indexed is lyr for indexed in self.list_layers(arc_df))
+
+    def get_spatial_reference(self, wkid):
+        """
+        Returns an `arcpy.SpatialReference` for the given WKID. Each WKID is only constructed once.
+        """
+        if wkid not in self._spatial_refs:
+            self.profile.count_calls()
+            self._spatial_refs[wkid] = arcpy.SpatialReference(wkid)
+
+        return self._spatial_refs[wkid]
@@ -0,0 +1,135 @@
+import logging
+import os
+import threading
+import traceback
+import zipfile
+from Queue import Queue
+from timeit import default_timer
+
+from change_detection import hash_file
+
+# The number of files which may be waiting to be written to the package before `add` blocks
+DEFAULT_PACKAGE_BUFFER_SIZE = 4
+
+
+def get_package_path(recipe, suffix=''):
+    """
+    Returns the path of the zip file of the product, as written by `BaseRunnerPlugin.zip_exported_files`.
+
+    @param suffix: (optional) Added to the file name before the extension (see
+                   `export_profiles.ExportProfile.package_suffix`).
+    """
+    return os.path.join(recipe.export_path, recipe.core_file_name + suffix + '.zip')
+
+
+class StreamingPackage:
+    """
+    Writes the zip file of a product while the product is still being exported, so that each file is
+    packaged as soon as it has been written rather than in one pass after every export has finished.
+
+    Files are passed to `add` and written to the zip by a background thread. At most `buffer_size` files
+    may be waiting to be written; beyond that `add` blocks until the thread catches up. The zip is written
+    to a temporary `.part` file which only replaces `zip_path` when `close` succeeds, so an interrupted
+    export never leaves a partial package in place of a complete one.
+
+    As each file is written its size, CRC32 and MD5 are recorded in `entries`.
+    """
+
+    def __init__(self, zip_path, buffer_size=DEFAULT_PACKAGE_BUFFER_SIZE):
+        self.zip_path = zip_path
+        self._part_path = zip_path + '.part'
+        # The exports (PDF, JPEG and PNG) are already compressed, so as for the non-streaming package they
+        # are stored rather than deflated
+        self._zip = zipfile.ZipFile(self._part_path, 'w', zipfile.ZIP_STORED, allowZip64=True)
+        self._queue = Queue(maxsize=max(1, buffer_size))
+        self._arcnames = set()
+        self.entries = []
+        self.error = None
+        # Time spent in the background thread writing to the zip, which overlaps with the exports
+        self.write_seconds = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='package-' + os.path.basename(zip_path))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def add(self, f_path, arcname=None):
+        """
+        Queues `f_path` to be written to the package, blocking if the buffer is full. A file whose name
+        within the package has already been added is ignored.
+
+        @returns: True if the file was queued.
+        """
+        arcname = arcname or os.path.basename(f_path)
+        if self._closed or arcname in self._arcnames:
+            return False
+
+        self._arcnames.add(arcname)
+        self._queue.put((f_path, arcname))
+        return True
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                if self.error:
+                    # Drain the queue, so that `add` does not block
+                    continue
+                start = default_timer()
+                self.entries.append(self._write(*item))
+                self.write_seconds += default_timer() - start
+            except Exception:
+                self.error = traceback.format_exc()
+            finally:
+                self._queue.task_done()
+
+    def _write(self, f_path, arcname):
+        self._zip.write(f_path, arcname)
+        info = self._zip.getinfo(arcname)
+        return {
+            'name': arcname,
+            'size': info.file_size,
+            'crc32': '{:08x}'.format(info.CRC & 0xffffffff),
+            'md5': hash_file(f_path)
+        }
+
+    def _finish(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self._zip.close()
+
+    def close(self):
+        """
+        Waits for the queued files to be written, and moves the finished package to `zip_path`.
+
+        @returns: The list of entries, in the order in which they were written.
+        @raises IOError: If any file could not be written to the package. The partial package is removed.
+        """
+        self._finish()
+        if self.error:
+            self._remove_part()
+            raise IOError('Unable to write the package {}:\n{}'.format(self.zip_path, self.error))
+
+        if os.path.exists(self.zip_path):
+            # `os.rename` does not replace an existing file on Windows
+            os.remove(self.zip_path)
+        os.rename(self._part_path, self.zip_path)
+        logging.info('Packaged {} files into {}'.format(len(self.entries), self.zip_path))
+        return self.entries
+
+    def abort(self):
+        """
+        Stops packaging and removes the partial package. Any existing package at `zip_path` is untouched.
+        """
+        self._finish()
+        self._remove_part()
+
+    def _remove_part(self):
+        try:
+            os.remove(self._part_path)
+        except OSError:
+            pass
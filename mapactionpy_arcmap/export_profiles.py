@@ -0,0 +1,102 @@
+from collections import namedtuple, OrderedDict
+
+from export_workers import EXPORT_FORMATS
+
+# Named sets of export settings, which trade the quality of the exported files against the time taken to
+# export them.
+#
+# `pdf_dpi` and `jpeg_dpi` are the resolutions of the PDF and JPEG. If None the `default_pdf_res_dpi` and
+# `default_jpeg_res_dpi` of the event are used. `pdf_options` and `jpeg_options` are passed as keyword
+# arguments to `arcpy.mapping.ExportToPDF` and `arcpy.mapping.ExportToJPEG`. `formats` are those of
+# `export_workers.EXPORT_FORMATS` which are produced, and if `include_atlas` is False the pages of an atlas
+# are not exported. `package_suffix` is added to the name of the product's zip file, so that the package of
+# a proof does not replace the published one.
+ExportProfile = namedtuple('ExportProfile', [
+    'name', 'pdf_dpi', 'jpeg_dpi', 'pdf_options', 'jpeg_options', 'formats', 'include_atlas', 'package_suffix'])
+
+DRAFT_PROFILE = 'draft'
+WEB_PROFILE = 'web'
+PRINT_PROFILE = 'print'
+DEFAULT_EXPORT_PROFILE = PRINT_PROFILE
+
+EXPORT_PROFILES = OrderedDict((profile.name, profile) for profile in (
+    # A quick proof of the main map, so that it can be checked before the full-quality export. Only the PDF
+    # is produced, at screen resolution, with rasters heavily compressed and without the atlas pages.
+    ExportProfile(
+        name=DRAFT_PROFILE,
+        pdf_dpi=96,
+        jpeg_dpi=96,
+        pdf_options={
+            'image_quality': 'FASTEST',
+            'image_compression': 'JPEG',
+            'jpeg_compression_quality': 50,
+            'picture_symbol': 'RASTERIZE_PICTURE',
+            'layers_attributes': 'NONE',
+            'georef_info': False
+        },
+        jpeg_options={'jpeg_quality': 60},
+        formats=('pdf',),
+        include_atlas=False,
+        package_suffix='-draft'
+    ),
+    # For viewing on screen and for quick download. Every format is produced, at a lower resolution and with
+    # more compression than for print.
+    ExportProfile(
+        name=WEB_PROFILE,
+        pdf_dpi=150,
+        jpeg_dpi=96,
+        pdf_options={
+            'image_quality': 'BETTER',
+            'image_compression': 'JPEG',
+            'jpeg_compression_quality': 70
+        },
+        jpeg_options={'jpeg_quality': 80},
+        formats=EXPORT_FORMATS,
+        include_atlas=True,
+        package_suffix=''
+    ),
+    # The full-quality export, at the resolutions of the event and with the ArcMap defaults for everything
+    # else.
+    ExportProfile(
+        name=PRINT_PROFILE,
+        pdf_dpi=None,
+        jpeg_dpi=None,
+        pdf_options={},
+        jpeg_options={},
+        formats=EXPORT_FORMATS,
+        include_atlas=True,
+        package_suffix=''
+    )
+))
+
+
+def get_export_profile(profile_name):
+    """
+    @returns: The ExportProfile called `profile_name`.
+    @raises ValueError: If there is no such profile.
+    """
+    try:
+        return EXPORT_PROFILES[profile_name]
+    except KeyError:
+        raise ValueError('Unknown export profile "{}". The export profiles are: {}'.format(
+            profile_name, ', '.join(EXPORT_PROFILES)))
+
+
+def get_resolutions(profile, hum_event):
+    """
+    @returns: A dict of the resolution of each format which has one.
+    """
+    return {
+        'pdf': profile.pdf_dpi or hum_event.default_pdf_res_dpi,
+        'jpeg': profile.jpeg_dpi or hum_event.default_jpeg_res_dpi
+    }
+
+
+def get_export_options(profile):
+    """
+    @returns: A dict of the keyword arguments for the export function of each format.
+    """
+    return {
+        'pdf': dict(profile.pdf_options),
+        'jpeg': dict(profile.jpeg_options)
+    }
@@ -0,0 +1,134 @@
+import arcpy
+import logging
+import multiprocessing
+import os
+from timeit import default_timer
+from thumbnails import THUMBNAIL_FNAME, save_thumbnail
+
+# The order in which the formats are exported, and in which their results are merged
+EXPORT_FORMATS = ('pdf', 'jpeg', 'thumbnail')
+# The formats which are rendered by ArcMap when the thumbnail is derived from the JPEG. See
+# `derive_png_thumbnail`.
+RENDERED_FORMATS = ('pdf', 'jpeg')
+
+
+def export_pdf(arc_mxd, export_dir, core_file_name, dpi, **options):
+    """
+    Exports `arc_mxd` to PDF. Any `options` (eg `image_quality`) are passed to `arcpy.mapping.ExportToPDF`.
+
+    @returns: A tuple of the path to the PDF and a dict of the export metadata values.
+    """
+    pdf_fname = core_file_name + "-" + str(dpi) + "dpi.pdf"
+    pdf_fpath = os.path.join(export_dir, pdf_fname)
+    arcpy.mapping.ExportToPDF(arc_mxd, pdf_fpath, resolution=int(dpi), **options)
+    return pdf_fpath, {"pdffilename": pdf_fname, "pdffilesize": os.path.getsize(pdf_fpath)}
+
+
+def export_jpeg(arc_mxd, export_dir, core_file_name, dpi, **options):
+    """
+    Exports `arc_mxd` to JPEG at `dpi`. Any `options` (eg `jpeg_quality`) are passed to
+    `arcpy.mapping.ExportToJPEG`.
+
+    @returns: A tuple of the path to the JPEG and a dict of the export metadata values.
+    """
+    jpeg_fname = core_file_name + "-" + str(dpi) + "dpi.jpg"
+    jpeg_fpath = os.path.join(export_dir, jpeg_fname)
+    arcpy.mapping.ExportToJPEG(arc_mxd, jpeg_fpath, resolution=int(dpi), **options)
+    return jpeg_fpath, {"jpgfilename": jpeg_fname, "jpgfilesize": os.path.getsize(jpeg_fpath)}
+
+
+def export_png_thumbnail(arc_mxd, export_dir, core_file_name=None, dpi=None):
+    """
+    Exports `arc_mxd` to a PNG thumbnail. `core_file_name` and `dpi` are not used, but are accepted so
+    that all of the export functions have the same signature.
+
+    @returns: A tuple of the path to the thumbnail and an empty dict.
+    """
+    # PNG Thumbnail.  Need to create a larger image first.
+    # If this isn't done, the thumbnail is pixelated amd doesn't look good
+    tmp_fname = "tmp-thumbnail.png"
+    tmp_fpath = os.path.join(export_dir, tmp_fname)
+    arcpy.mapping.ExportToPNG(arc_mxd, tmp_fpath)
+
+    png_fpath = os.path.join(export_dir, THUMBNAIL_FNAME)
+
+    # Resize the thumbnail
+    save_thumbnail(tmp_fpath, png_fpath)
+
+    # Remove the temporary larger thumbnail
+    os.remove(tmp_fpath)
+    return png_fpath, {}
+
+
+def derive_png_thumbnail(src_path, export_dir):
+    """
+    Makes the PNG thumbnail from an image which has already been exported (normally the JPEG), rather than
+    asking ArcMap to render the layout again. No temporary file is written, and as the JPEG is decoded at a
+    reduced scale (see `thumbnails.save_thumbnail`) this is much quicker than a render.
+
+    @returns: A tuple of the path to the thumbnail and an empty dict.
+    """
+    png_fpath = os.path.join(export_dir, THUMBNAIL_FNAME)
+    save_thumbnail(src_path, png_fpath)
+    return png_fpath, {}
+
+
+EXPORTERS = {
+    'pdf': export_pdf,
+    'jpeg': export_jpeg,
+    'thumbnail': export_png_thumbnail
+}
+
+
+def run_export_job(job):
+    """
+    Carries out a single export in a worker process, which opens its own copy of the MXD.
+
+    @param job: A tuple of (format, MXD path, export directory, core file name, dpi, options), where `options`
+                is a dict of keyword arguments for the export function.
+    @returns: A dict with the keys `format`, `path`, `metadata`, `open_seconds` and `seconds`.
+    """
+    export_format, mxd_path, export_dir, core_file_name, dpi, options = job
+    start = default_timer()
+    arc_mxd = arcpy.mapping.MapDocument(mxd_path)
+    opened = default_timer()
+    f_path, metadata = EXPORTERS[export_format](arc_mxd, export_dir, core_file_name, dpi, **options)
+    return {
+        'format': export_format,
+        'path': f_path,
+        'metadata': metadata,
+        'open_seconds': opened - start,
+        'seconds': default_timer() - opened
+    }
+
+
+def export_in_parallel(mxd_path, export_dir, core_file_name, dpis, processes=len(EXPORT_FORMATS),
+                       formats=EXPORT_FORMATS, options=None):
+    """
+    Exports each of `formats` in a separate worker process.
+
+    @param mxd_path: The path to the MXD. It must have been saved, as each worker opens its own copy.
+    @param export_dir: The directory to export to.
+    @param core_file_name: The core file name of the product.
+    @param dpis: A dict of the resolution to use for each format.
+    @param processes: The maximum number of worker processes.
+    @param formats: The formats to export, from `EXPORT_FORMATS`.
+    @param options: (optional) A dict of the keyword arguments for the export function of each format.
+    @returns: A list of the results (see `run_export_job`), in the order of `formats` regardless of the
+              order in which the workers finish.
+    """
+    options = options or {}
+    jobs = [(fmt, mxd_path, export_dir, core_file_name, dpis.get(fmt), options.get(fmt, {})) for fmt in formats]
+    pool = multiprocessing.Pool(processes=max(1, min(processes, len(jobs))))
+    try:
+        # `map` returns the results in the same order as the jobs
+        results = pool.map(run_export_job, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+    for result in results:
+        logging.info('Exported {} in {:.2f}s (plus {:.2f}s to open the MXD)'.format(
+            result['format'], result['seconds'], result['open_seconds']))
+
+    return results
@@ -0,0 +1,121 @@
+import logging
+import os
+from collections import OrderedDict
+
+DEFAULT_LAYER_CACHE_SIZE = 256
+
+
+class LayerFileCache:
+    """
+    A least-recently-used cache of parsed layer files (eg `.lyr` files).
+
+    Each entry is keyed on the real path, modification time and size of the layer file, so an edited
+    layer file is always re-parsed. Every caller is given its own layer object, so that changes made whilst
+    cooking one recipe (visibility, label classes, definition queries, data sources etc) cannot leak into
+    another.
+
+    Parsed layers are only reused if a `copier` which is known to be safe for the loader's objects is
+    supplied. `arcpy.mapping.Layer` objects wrap a COM object, and `copy.deepcopy` is not known to give copies
+    which are independent of it, so without a `copier` nothing is cached: every call parses the layer file
+    and is counted as a miss.
+    """
+
+    def __init__(self, loader, max_size=DEFAULT_LAYER_CACHE_SIZE, copier=None):
+        """
+        Arguments:
+           loader {callable} -- Parses a layer file. Called with the path of the layer file, eg
+                                `arcpy.mapping.Layer`.
+           max_size {int} -- The maximum number of layer files held. A value of zero disables the cache.
+           copier {callable} -- (optional) Returns an independent copy of a parsed layer. If None, the cache
+                                is disabled and every call to `get_layer` parses the layer file.
+        """
+        self.loader = loader
+        self.max_size = max_size
+        self.copier = copier
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.copy_failures = 0
+
+        self._templates = OrderedDict()
+
+    def _get_key(self, lyr_path):
+        r_path = os.path.realpath(lyr_path)
+        stat_result = os.stat(r_path)
+        return (os.path.normcase(r_path), stat_result.st_mtime, stat_result.st_size)
+
+    def get_layer(self, lyr_path):
+        """
+        Returns a newly parsed layer object for `lyr_path`. If there is a `copier` this is, where possible,
+        a copy of a previously parsed layer, rather than parsing the layer file again.
+        """
+        if not self.max_size or self.copier is None:
+            self.misses += 1
+            return self.loader(lyr_path)
+
+        try:
+            key = self._get_key(lyr_path)
+        except OSError:
+            # Leave it to the loader to raise a more meaningful error
+            self.misses += 1
+            return self.loader(lyr_path)
+
+        if key in self._templates:
+            template = self._templates.pop(key)
+            self._templates[key] = template
+            self.hits += 1
+        else:
+            template = self.loader(lyr_path)
+            self.misses += 1
+            self._store(key, template)
+            # Nothing else has seen this layer yet, so it can be handed out as it is if it cannot be copied
+            return self._copy(template, lyr_path, fresh=True)
+
+        return self._copy(template, lyr_path)
+
+    def _store(self, key, template):
+        # Any entries for an older version of the same file will never be hit again
+        for stale_key in [k for k in self._templates if k[0] == key[0]]:
+            del self._templates[stale_key]
+
+        self._templates[key] = template
+        while len(self._templates) > self.max_size:
+            self._templates.popitem(last=False)
+            self.evictions += 1
+
+    def _copy(self, template, lyr_path, fresh=False):
+        try:
+            return self.copier(template)
+        except Exception as exp:
+            # If the layer objects cannot be copied there is no safe way to share them. Fall back to
+            # parsing every layer file afresh.
+            logging.warning('Unable to copy the parsed layer "{}". The layer file cache has been disabled.'
+                            ' {}'.format(lyr_path, exp))
+            self.copy_failures += 1
+            self.clear()
+            self.max_size = 0
+            return template if fresh else self.loader(lyr_path)
+
+    def clear(self):
+        """
+        Removes all of the cached layers. The hit and miss counts are not reset.
+        """
+        self._templates.clear()
+
+    def __len__(self):
+        return len(self._templates)
+
+    def get_stats(self):
+        """
+        Returns a dict of the cache statistics, suitable for writing to the run report.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'copy_failures': self.copy_failures,
+            'size': len(self._templates),
+            'max_size': self.max_size,
+            'reuses_parsed_layers': self.copier is not None
+        }
@@ -0,0 +1,186 @@
+import arcpy
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import traceback
+
+from change_detection import get_data_source_container, get_related_files, load_manifest, write_manifest
+
+CACHE_VERSION = 1
+CACHE_FNAME = 'layer-extents.json'
+# The key of the extent in the data source's own spatial reference
+NATIVE_EXTENT = 'native'
+
+
+def get_data_source_fingerprint(data_source_path, related_files=None):
+    """
+    Returns a fingerprint of the files which make up `data_source_path`, based on their sizes and mtimes,
+    or None if none of them exist.
+
+    Known limitation: a feature class in a file geodatabase is fingerprinted on the files of the whole
+    geodatabase, since finding its own `aXXXXXXXX.*` files requires reading the geodatabase's system catalog.
+    Editing any feature class in a geodatabase therefore means that all of them are described again.
+
+    @param related_files: (optional) A dict used to memoize `get_related_files`, keyed on the container of
+                          the data source, so that the feature classes in the same file geodatabase share a
+                          single walk of it.
+    """
+    if related_files is None:
+        related_files = {}
+
+    container = get_data_source_container(data_source_path)
+    f_paths = related_files.get(container)
+    if f_paths is None:
+        f_paths = related_files[container] = get_related_files(container)
+    if not f_paths:
+        return None
+
+    stats = []
+    for f_path in f_paths:
+        stat = os.stat(f_path)
+        stats.append([f_path, stat.st_size, stat.st_mtime])
+    return hashlib.md5(json.dumps(stats).encode('utf-8')).hexdigest()
+
+
+def describe_extent(job):
+    """
+    Describes a single data source.
+
+    @param job: A tuple of (data source path, list of EPSG codes).
+    @returns: A tuple of (data source path, extents, error). `extents` is a dict of the JSON of the extent,
+              keyed on `NATIVE_EXTENT` and on each EPSG code (as a string) to which it has been projected.
+    """
+    data_source_path, epsg_codes = job
+    try:
+        extent = arcpy.Describe(data_source_path).extent
+        extents = {NATIVE_EXTENT: extent.JSON}
+        for epsg in epsg_codes:
+            extents[str(epsg)] = extent.projectAs(arcpy.SpatialReference(int(epsg))).JSON
+        return data_source_path, extents, None
+    except Exception:
+        return data_source_path, None, traceback.format_exc()
+
+
+class LayerExtentCache:
+    """
+    A persistent cache of the extents of data sources, stored as a JSON file, so that the same data source
+    is not described again for every layer and recipe which uses it.
+
+    Each entry is keyed on the real path of the data source, and is only used while the fingerprint of its
+    files (see `get_data_source_fingerprint`) is unchanged. Data sources which are not in the cache are
+    described together, in a pool of worker processes if `processes` is greater than 1.
+
+    New entries are held in memory until `save` is called, so that the cache file is written once per
+    batch of lookups (eg once per recipe) rather than once for every layer.
+    """
+
+    def __init__(self, cache_path, processes=1):
+        """
+        Arguments:
+           cache_path {str} -- The path of the cache file. It is created if it does not exist.
+           processes {int} -- The number of worker processes used to describe data sources.
+        """
+        self.cache_path = cache_path
+        self.processes = processes
+        cache = load_manifest(cache_path)
+        if cache and cache.get('version') == CACHE_VERSION:
+            self._extents = cache.get('data_sources', {})
+        else:
+            self._extents = {}
+        self._unsaved = False
+        self.hits = 0
+        self.misses = 0
+
+    def get_extents(self, data_source_paths, epsg=None):
+        """
+        @param data_source_paths: An iterable of data source paths.
+        @param epsg: (optional) An EPSG code. If supplied the extents are projected into that spatial
+                     reference.
+        @returns: A tuple of (extents, errors). `extents` is a dict of the JSON of the extent of each data
+                  source, keyed on the path as given. `errors` is a dict of the error for each data source
+                  which could not be described.
+        """
+        extent_key = str(epsg) if epsg else NATIVE_EXTENT
+        related_files = {}
+        extents = {}
+        stale = {}
+        for data_source_path in set(data_source_paths):
+            key = os.path.realpath(data_source_path)
+            fingerprint = get_data_source_fingerprint(data_source_path, related_files)
+            cached = self._extents.get(key)
+            if fingerprint and cached and cached['fingerprint'] == fingerprint and extent_key in cached['extents']:
+                self.hits += 1
+                extents[data_source_path] = cached['extents'][extent_key]
+            else:
+                stale[data_source_path] = (key, fingerprint)
+
+        errors = {}
+        if not stale:
+            return extents, errors
+
+        self.misses += len(stale)
+        epsg_codes = [epsg] if epsg else []
+        for data_source_path, described, error in self._describe([(path, epsg_codes) for path in sorted(stale)]):
+            if error:
+                errors[data_source_path] = error
+                continue
+
+            extents[data_source_path] = described[extent_key]
+            key, fingerprint = stale[data_source_path]
+            if fingerprint:
+                cached = self._extents.get(key)
+                if cached and cached['fingerprint'] == fingerprint:
+                    # Keep any extents already projected into other spatial references
+                    cached['extents'].update(described)
+                else:
+                    self._extents[key] = {'fingerprint': fingerprint, 'extents': described}
+                self._unsaved = True
+
+        return extents, errors
+
+    def fill(self, recipe_lyrs, epsg=None):
+        """
+        Sets `recipe_lyr.extent` (as a dict parsed from the JSON of the extent) for each of `recipe_lyrs`.
+
+        @raises ValueError: If any of the data sources could not be described. The extents of the others
+                            are still set.
+        """
+        extents, errors = self.get_extents([recipe_lyr.data_source_path for recipe_lyr in recipe_lyrs], epsg)
+        for recipe_lyr in recipe_lyrs:
+            if recipe_lyr.data_source_path in extents:
+                recipe_lyr.extent = json.loads(extents[recipe_lyr.data_source_path])
+
+        if errors:
+            raise ValueError('Unable to get the extent of {} data source(s):\n{}'.format(
+                len(errors), '\n'.join('{}: {}'.format(path, errors[path]) for path in sorted(errors))))
+
+    def _describe(self, jobs):
+        if self.processes < 2 or len(jobs) < 2:
+            return [describe_extent(job) for job in jobs]
+
+        pool = multiprocessing.Pool(processes=min(self.processes, len(jobs)))
+        try:
+            return pool.map(describe_extent, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+    def save(self):
+        """
+        Writes the cache file, if any extents have been added since it was last written.
+        """
+        if not self._unsaved:
+            return
+
+        try:
+            write_manifest(self.cache_path, {'version': CACHE_VERSION, 'data_sources': self._extents})
+            self._unsaved = False
+        except (IOError, OSError) as exp:
+            # The extents are kept in memory for the rest of this run, and the data sources are described
+            # again on the next one
+            logging.warning('Unable to write the layer extent cache {}: {}'.format(self.cache_path, exp))
+
+    def get_stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'data_sources': len(self._extents)}
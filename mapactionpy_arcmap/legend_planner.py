@@ -0,0 +1,96 @@
+from collections import OrderedDict
+
+# The reasons recorded for each legend item which is removed
+EXCLUDED_BY_RECIPE = 'add_to_legend is false in the recipe'
+DUPLICATE_NAME = 'duplicate of an earlier legend entry with the same name'
+
+
+class LegendPlan:
+    """
+    Works out which items should be removed from the legend elements of a map layout.
+
+    The plan is created from the recipe before any layers are added. An item is removed from a legend
+    if either:
+      * the recipe layer with that name has `add_to_legend` set to False, or
+      * an earlier item in the same legend has the same name.
+
+    The names of the layers as they are added to the map (which come from the layer files and may
+    differ from the recipe) are recorded with `note_layer_added`. All lookups are against sets.
+    """
+
+    def __init__(self, excluded_names=None):
+        """
+        Arguments:
+           excluded_names {iterable} -- (optional) The names of layers which should not appear in any
+                                        legend.
+        """
+        self.excluded_names = set(excluded_names or [])
+        self.removed = []
+
+    @classmethod
+    def from_recipe(cls, recipe):
+        """
+        Creates the LegendPlan for `recipe`.
+        """
+        plan = cls()
+        if recipe:
+            for recipe_frame in recipe.map_frames:
+                for recipe_lyr in recipe_frame.layers:
+                    if getattr(recipe_lyr, 'add_to_legend', True) is False:
+                        plan.excluded_names.add(recipe_lyr.name)
+
+        return plan
+
+    def note_layer_added(self, recipe_lyr, arc_lyr_name):
+        """
+        Records the name which a recipe layer was given when it was added to the map.
+        """
+        if getattr(recipe_lyr, 'add_to_legend', True) is False:
+            self.excluded_names.add(arc_lyr_name)
+
+    def get_removal_reason(self, lyr_name, seen_names):
+        """
+        @returns: The reason why `lyr_name` should be removed from a legend which already contains
+                  `seen_names`, or None if it should be kept.
+        """
+        if lyr_name in self.excluded_names:
+            return EXCLUDED_BY_RECIPE
+        if lyr_name in seen_names:
+            return DUPLICATE_NAME
+        return None
+
+    def apply(self, legends, profile=None):
+        """
+        Removes the planned items from each legend element, in a single pass over each legend.
+
+        @param legends: An iterable of LEGEND_ELEMENT layout elements.
+        @param profile: (optional) A CookProfile used to count the arcpy calls.
+        @returns: A list of the items removed. See `get_report`.
+        """
+        removed = []
+        for legend in legends:
+            seen_names = set()
+            if profile is not None:
+                profile.count_calls()
+            for lyr in legend.listLegendItemLayers():
+                reason = self.get_removal_reason(lyr.name, seen_names)
+                if reason is None:
+                    seen_names.add(lyr.name)
+                    continue
+
+                if profile is not None:
+                    profile.count_calls()
+                legend.removeItem(lyr)
+                removed.append(OrderedDict([('legend', legend.name), ('layer', lyr.name), ('reason', reason)]))
+
+        self.removed.extend(removed)
+        return removed
+
+    def get_report(self):
+        """
+        Returns a JSON-serialisable summary of the plan and of the items which were removed.
+        """
+        return OrderedDict([
+            ('excluded_names', sorted(self.excluded_names)),
+            ('removed', list(self.removed))
+        ])
@@ -1,9 +1,18 @@
 import os
 import arcpy
 import logging
-import re
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
+from timeit import default_timer
 import pytz
+from cook_profile import CookProfile
+# ESRI_DATASET_TYPES is imported here for backwards compatibility
+from dataset_types import ESRI_DATASET_TYPES, get_dataset_type, resolve_recipe  # noqa: F401
+from doc_index import DocumentIndex
+from layer_cache import LayerFileCache
+from legend_planner import LegendPlan
+from marginalia import MarginaliaRenderer, create_context
 
 
 # TODO asmith 2020/03/06
@@ -16,51 +25,44 @@ import pytz
 # `cook()` as a public method and why not call it directly from the constructor.
 
 
-ESRI_DATASET_TYPES = [
-    "SHAPEFILE_WORKSPACE",
-    "RASTER_WORKSPACE",
-    "FILEGDB_WORKSPACE",
-    "ACCESS_WORKSPACE",
-    "ARCINFO_WORKSPACE",
-    "CAD_WORKSPACE",
-    "EXCEL_WORKSPACE",
-    "OLEDB_WORKSPACE",
-    "PCCOVERAGE_WORKSPACE",
-    "SDE_WORKSPACE",
-    "TEXT_WORKSPACE",
-    "TIN_WORKSPACE",
-    "VPF_WORKSPACE"
-]
-
-
-def get_map_scale(arc_mxd, recipe):
+def get_map_scale(arc_mxd, recipe, doc_index=None):
     """
     Returns a human-readable string representing the map scale of the
     principal map frame of the mxd.
 
     @param arc_mxd: The MapDocument object of the map being produced.
     @param recipe: The MapRecipe object being used to produced it.
+    @param doc_index: (optional) A DocumentIndex of `arc_mxd`. If supplied the data frames are not
+                      listed again.
     @returns: The string representing the map scale.
     """
+    if doc_index is None:
+        doc_index = DocumentIndex(arc_mxd)
+
     scale_str = ""
-    for df in arcpy.mapping.ListDataFrames(arc_mxd, recipe.principal_map_frame):
+    for df in doc_index.get_frames(recipe.principal_map_frame):
         if df.name == recipe.principal_map_frame:
             scale_str = '1: {:,} (At A3)'.format(int(df.scale))
             break
     return scale_str
 
 
-def get_map_spatial_ref(arc_mxd, recipe):
+def get_map_spatial_ref(arc_mxd, recipe, doc_index=None):
     """
     Returns a human-readable string representing the spatial reference used to display the
     principal map frame of the mxd.
 
     @param arc_mxd: The MapDocument object of the map being produced.
     @param recipe: The MapRecipe object being used to produced it.
+    @param doc_index: (optional) A DocumentIndex of `arc_mxd`. If supplied the data frames are not
+                      listed again.
     @returns: The string representing the spatial reference. If the spatial reference cannot be determined
                 then the value "Unknown" is returned.
     """
-    data_frames = [df for df in arcpy.mapping.ListDataFrames(arc_mxd) if df.name == recipe.principal_map_frame]
+    if doc_index is None:
+        doc_index = DocumentIndex(arc_mxd)
+
+    data_frames = [df for df in doc_index.list_frames() if df.name == recipe.principal_map_frame]
 
     if not data_frames:
         err_msg = 'MXD does not have a MapFrame (aka DataFrame) with the name "{}"'.format(
@@ -83,6 +85,21 @@ def get_map_spatial_ref(arc_mxd, recipe):
     return spatial_ref_str
 
 
+# What a cook already knows about the map, passed to the export so that it does not need to reopen the MXD
+# or scan the document again. `mxd` and `doc_index` are the cooked, in-memory, document. `extent` is a tuple
+# of (xmin, ymin, xmax, ymax) of the principal map frame, or None. `added_layers` is as
+# `MapChef.added_layers`.
+ExportHandoff = namedtuple('ExportHandoff', [
+    'mxd', 'doc_index', 'map_project_path', 'extent', 'scale', 'datum', 'added_layers'])
+
+
+class IncrementalCookError(ValueError):
+    """
+    Raised when an incremental cook cannot be applied to a document.
+    """
+    pass
+
+
 class MapChef:
     """
     Worker which creates a Map based on a predefined "recipe" from a cookbook
@@ -96,19 +113,26 @@ class MapChef:
     #   * Event object
     # It is already known that the various file and directory paths are valid etc. Why not just pass
     # those objects in as parameters to the MapChef constructor?
-    #
-    # Depending on whether or not it is indented that the `cook()` method might be called multiple
-    # times in the life of a MapChef object, it would be worth reviewing
 
     def __init__(self,
                  mxd,
                  crashMoveFolder,
-                 eventConfiguration):
+                 eventConfiguration,
+                 deferred_save=True,
+                 layer_cache=None,
+                 marginalia_handlers=None):
         """
         Arguments:
            mxd {MXD file} -- MXD file.
            crashMoveFolder {CrashMoveFolder} -- CrashMoveFolder Object
            eventConfiguration {Event} -- Event Object
+           deferred_save {bool} -- If True (the default) `cook()` holds all of its edits in memory and
+                                   writes the MXD to disk once at the end. If False the MXD is saved after
+                                   each individual step, as it was historically.
+           layer_cache {LayerFileCache} -- A cache of parsed layer files, which may be shared between
+                                           MapChef objects. If None a new cache is created.
+           marginalia_handlers {dict} -- (optional) Additional or replacement handlers for named text
+                                         elements. See `marginalia.MarginaliaRenderer`.
         """
         # TODO asmith 2020/03/06
         # See comment on the `cook()` method about where and when the `mxd` parameter should be
@@ -118,7 +142,7 @@ class MapChef:
 
         self.eventConfiguration = eventConfiguration
         # self.cookbook = cookbook
-        self.legendEntriesToRemove = list()
+        self.legend_plan = LegendPlan()
 
         self.replaceDataSourceOnly = False
         # It appears that this is not used - therefore should be removed. If it is used, then it
@@ -130,13 +154,147 @@ class MapChef:
         self.dataSources = set()
         self.export = False
 
+        self.deferred_save = deferred_save
+        self.save_count = 0
+        self._in_transaction = False
+        self._pending_save = False
+
+        if layer_cache is None:
+            layer_cache = LayerFileCache(arcpy.mapping.Layer)
+        self.layer_cache = layer_cache
+        self.marginalia = MarginaliaRenderer(marginalia_handlers)
+        self.profile = CookProfile()
+        self.cook_seconds = 0.0
+        # For each data frame, [recipe layer name, arc layer name] for each layer added by the most recent
+        # cook, in the order in which they were added.
+        self.added_layers = OrderedDict()
+        self._doc_index = None
+        # The intended visibility of each layer added by the recipe, keyed on (data frame name, layer name)
+        self._added_visibility = dict()
+
+        # If set, saves are written to this path (using `saveACopy`) rather than back to `self.mxd`.
+        self.output_path = None
+        # If True the MapDocument, its index and its text elements are kept between calls to `cook()`.
+        # See `CookingSession`.
+        self.reuse_document = False
+        # The state of the template which has been changed by the most recent cook, keyed on id(element).
+        self._original_frame_state = OrderedDict()
+        self._original_text = OrderedDict()
+        self._text_elements = None
+        # The MarginaliaContext used by the most recent cook
+        self._marginalia_context = None
+
+    @property
+    def doc_index(self):
+        """
+        The DocumentIndex of `self.mxd`. This is rebuilt at the start of each cook.
+        """
+        if self._doc_index is None:
+            self._doc_index = DocumentIndex(self.mxd, self.profile)
+
+        return self._doc_index
+
+    def save(self):
+        """
+        Writes the MXD to disk. If a transaction is open the save is only recorded as pending and is
+        carried out once, when the transaction is committed.
+        """
+        if self._in_transaction:
+            self._pending_save = True
+            return
+
+        with self.profile.stage('save'):
+            self.profile.count_calls()
+            if self.output_path:
+                # `saveACopy` will not overwrite an existing file
+                if os.path.exists(self.output_path):
+                    os.remove(self.output_path)
+                self.mxd.saveACopy(self.output_path)
+            else:
+                self.mxd.save()
+        self.save_count += 1
+
+    def rollback(self):
+        """
+        Discards any unsaved in-memory edits by reopening the MXD from disk.
+        """
+        logging.warning('Discarding unsaved changes to {}'.format(self.mxd.filePath))
+        self.mxd = arcpy.mapping.MapDocument(self.mxd.filePath)
+        self._doc_index = None
+        self._pending_save = False
+        self._original_frame_state = OrderedDict()
+        self._original_text = OrderedDict()
+        self._text_elements = None
+
+    @contextmanager
+    def transaction(self):
+        """
+        Context manager which defers all saves made within it. On success the MXD is saved once (if
+        anything requested a save). If an exception is raised the edits are rolled back and the
+        exception is re-raised. Nested transactions are folded into the outermost one.
+        """
+        if self._in_transaction:
+            yield
+            return
+
+        self._in_transaction = True
+        self._pending_save = False
+        try:
+            yield
+        except Exception:
+            self._in_transaction = False
+            self.rollback()
+            raise
+
+        self._in_transaction = False
+        if self._pending_save:
+            self._pending_save = False
+            self.save()
+
+    def get_run_report(self):
+        """
+        Returns a dict summarising the most recent cook, suitable for writing to the run report.
+        """
+        return {
+            'mxd_saves': self.save_count,
+            'deferred_save': self.deferred_save,
+            'layer_cache': self.layer_cache.get_stats(),
+            'cook_seconds': self.cook_seconds,
+            'cook_stages': self.profile.as_dict(),
+            'legend': self.legend_plan.get_report(),
+            'added_layers': self.added_layers
+        }
+
+    def get_export_handoff(self, recipe):
+        """
+        Returns an ExportHandoff for the most recent cook of `recipe`. The scale and spatial reference are
+        taken from the marginalia of the cook if they were calculated there.
+        """
+        context = self._marginalia_context or self.get_marginalia_context(recipe)
+        extent = None
+        for arc_df in self.doc_index.get_frames(recipe.principal_map_frame):
+            self.profile.count_calls()
+            ext = arc_df.extent
+            extent = (ext.XMin, ext.YMin, ext.XMax, ext.YMax)
+            break
+
+        return ExportHandoff(
+            mxd=self.mxd,
+            doc_index=self.doc_index,
+            map_project_path=self.output_path or self.mxd.filePath,
+            extent=extent,
+            scale=context['scale'],
+            datum=context['datum'],
+            added_layers=OrderedDict((name, [list(names) for names in added])
+                                     for name, added in self.added_layers.items())
+        )
+
     def disableLayers(self):
         """
         Makes all layers invisible for all data-frames
         """
-        for df in arcpy.mapping.ListDataFrames(self.mxd):
-            for lyr in arcpy.mapping.ListLayers(self.mxd, "", df):
-                lyr.visible = False
+        for df, lyr in self.doc_index.all_layers():
+            lyr.visible = False
 
     # TODO asmith 2020/0306
     # Do we need to accommodate a use case where we would want to add layers but not make them
@@ -145,127 +303,303 @@ class MapChef:
         """
         Makes all layers visible for all data-frames
         """
-        for df in arcpy.mapping.ListDataFrames(self.mxd):
-            for lyr in arcpy.mapping.ListLayers(self.mxd, "", df):
-                lyr.visible = True
+        for df, lyr in self.doc_index.all_layers():
+            lyr.visible = True
 
     def removeLayers(self):
         """
         Removes all layers for all data-frames
         """
-        for df in arcpy.mapping.ListDataFrames(self.mxd):
-            for lyr in arcpy.mapping.ListLayers(self.mxd, "", df):
-                if (lyr.longName != "Data Driven Pages"):
-                    arcpy.mapping.RemoveLayer(df, lyr)
-        self.mxd.save()
+        self.reset_layers()
+
+    def reset_layers(self):
+        """
+        Removes every layer, other than the "Data Driven Pages" layer, from every data frame in a single
+        pass over the document. If the template does not contain any layers then nothing further is done.
+        """
+        with self.profile.stage('layer_reset'):
+            if self.doc_index.is_empty():
+                return
+
+            removed = 0
+            for arc_df in self.doc_index.list_frames():
+                # Iterate over a copy, as the index is updated as each layer is removed
+                for lyr in list(self.doc_index.list_layers(arc_df)):
+                    # Sublayers are removed along with their group layer
+                    if lyr.longName == "Data Driven Pages" or '\\' in lyr.longName:
+                        continue
+                    self.doc_index.remove_layer(arc_df, lyr)
+                    removed += 1
+
+            if removed:
+                self.save()
+
+    def finalise_layer_visibility(self):
+        """
+        Sets the visibility of each layer to its intended final state, touching only those layers whose
+        visibility actually needs to change. Layers added from the recipe take the recipe's `visible`
+        value. All other layers (eg the "Data Driven Pages" layer and sublayers within group layers) are
+        made visible, as they historically were by `enableLayers`.
+        """
+        with self.profile.stage('layer_visibility'):
+            pending = dict((key, list(values)) for key, values in self._added_visibility.items())
+            for arc_df, lyr in self.doc_index.all_layers():
+                desired = True
+                queued = pending.get((arc_df.name, lyr.longName))
+                if queued:
+                    desired = queued.pop(0)
+
+                if lyr.visible != desired:
+                    self.profile.count_calls()
+                    lyr.visible = desired
+
+    def restore_template_state(self):
+        """
+        Reverts the frame spatial references, frame extents and text elements changed by the previous
+        cook back to their values in the template. Nothing else in the document is touched. Layers are
+        dealt with separately by `reset_layers`.
+        """
+        with self.profile.stage('template_restore'):
+            for arc_df, spatial_ref, extent in self._original_frame_state.values():
+                self.profile.count_calls(2)
+                arc_df.spatialReference = spatial_ref
+                arc_df.extent = extent
+
+            for elm, text in self._original_text.values():
+                self.profile.count_calls()
+                elm.text = text
+
+        self._original_frame_state = OrderedDict()
+        self._original_text = OrderedDict()
+
+    def _remember_frame_state(self, arc_data_frame):
+        if self.reuse_document and id(arc_data_frame) not in self._original_frame_state:
+            self.profile.count_calls(2)
+            self._original_frame_state[id(arc_data_frame)] = (
+                arc_data_frame, arc_data_frame.spatialReference, arc_data_frame.extent)
 
-    # TODO asmith 2020/03/06
-    # I would suggest that:
-    #   * If `cook()` only gets called once in the life of a MapChef object, then it should be
-    #     entire procedural, with no parameters (everything set via the constructor) and
-    #     subsequent attempt to call `cook()` should result in an exception
-    #   * If `cook()` can be called multiple times, then the `mxd` and the `map_version_number`
-    #     should be parameters for the cook method and not for the constructor.
     def cook(self, recipe):
+        """
+        Cooks `recipe`. This may be called more than once. If `self.reuse_document` is True then the
+        template state changed by the previous cook is restored first, otherwise `self.mxd` is assumed to
+        be freshly opened.
+        """
+        self._run_cook(recipe, self._cook)
+
+    def cook_incremental(self, recipe, recipe_diff):
+        """
+        Updates `self.mxd`, which must be a copy of the MXD created from the previous version of the
+        recipe, by applying only the changes in `recipe_diff` (a RecipeDiff which `is_safe()`). Layers
+        are not removed or re-added.
+
+        @raises IncrementalCookError: If the document does not match the previous recipe. In this case
+                                      the changes are rolled back and a full cook should be used instead.
+        """
+        self._run_cook(recipe, lambda r: self._cook_incremental(r, recipe_diff))
+
+    def _run_cook(self, recipe, cook_func):
+        start = default_timer()
+        self.save_count = 0
+        self.added_layers = OrderedDict()
+        self._marginalia_context = None
+        self.profile = CookProfile()
+        # Worked out before any layers are added, and applied once they have all been added
+        self.legend_plan = LegendPlan.from_recipe(recipe)
+        if self._doc_index is not None:
+            self._doc_index.profile = self.profile
+
+        # Fail before the document is touched if any of the data sources are of an unsupported type
+        if recipe:
+            with self.profile.stage('preflight'):
+                resolve_recipe(recipe)
+
+        if self.deferred_save:
+            with self.transaction():
+                cook_func(recipe)
+        else:
+            cook_func(recipe)
+
+        self.cook_seconds = default_timer() - start
+        logging.info('Cook complete in {:.2f}s. The MXD was saved {} time(s)'.format(
+            self.cook_seconds, self.save_count))
+
+    def _cook(self, recipe):
         arcpy.env.addOutputsToMap = False
+        if self.reuse_document:
+            self.restore_template_state()
+        else:
+            self._doc_index = DocumentIndex(self.mxd, self.profile)
+            self._text_elements = None
+        self._added_visibility = dict()
 
-        self.disableLayers()
-        self.removeLayers()
+        self.reset_layers()
 
         # self.mapReport = MapReport(recipe.product)
         if recipe:
             recipe.creation_time_stamp = datetime.now(pytz.utc)
 
             for recipe_frame in recipe.map_frames:
-                arc_data_frame = arcpy.mapping.ListDataFrames(self.mxd, recipe_frame.name).pop()
+                arc_data_frame = self.doc_index.get_frame(recipe_frame.name)
 
                 for recipe_lyr in recipe_frame.layers:
                     # Do things at an individual layer level
                     self.process_layer(recipe_lyr, arc_data_frame)
 
                 # Do things at an map/data frame level
-                self.apply_frame_crs_and_extent(arc_data_frame, recipe_frame)
+                with self.profile.stage('frame_crs_extent'):
+                    self.apply_frame_crs_and_extent(arc_data_frame, recipe_frame)
 
         # Do things at a map layout level
-        self.enableLayers()
-        arcpy.RefreshTOC()
-        arcpy.RefreshActiveView()
+        self.finalise_layer_visibility()
+        with self.profile.stage('refresh'):
+            self.profile.count_calls(2)
+            arcpy.RefreshTOC()
+            arcpy.RefreshActiveView()
         arcpy.env.addOutputsToMap = True
-        self.showLegendEntries()
-        self.mxd.save()
+        with self.profile.stage('legend'):
+            self.showLegendEntries()
 
         if recipe:
+            with self.profile.stage('marginalia'):
+                self.updateTextElements(recipe)
+
+        logging.debug('arcpy calls by stage: {}'.format(dict(self.profile.as_dict())))
+
+    def _cook_incremental(self, recipe, recipe_diff):
+        arcpy.env.addOutputsToMap = False
+        self._doc_index = DocumentIndex(self.mxd, self.profile)
+        self._text_elements = None
+        self.added_layers = OrderedDict(
+            (frame_name, [list(names) for names in added])
+            for frame_name, added in recipe_diff.previous_added_layers.items())
+        recipe.creation_time_stamp = datetime.now(pytz.utc)
+
+        for recipe_frame in recipe.map_frames:
+            added_names = set(recipe_name for recipe_name, arc_name in self.added_layers.get(recipe_frame.name, []))
+            for recipe_lyr in recipe_frame.layers:
+                recipe_lyr.success = recipe_lyr.name in added_names
+
+        for change in recipe_diff.changed_layers:
+            with self.profile.stage('update_layer'):
+                arc_data_frame = self.doc_index.get_frame(change.frame_name)
+                arc_lyr = self.get_added_layer(arc_data_frame, change.position, change.arc_lyr_name)
+                self.update_layer(arc_lyr, change.recipe_lyr, change.fields)
+
+        for recipe_frame in recipe_diff.changed_frames:
+            with self.profile.stage('frame_crs_extent'):
+                self.apply_frame_crs_and_extent(self.doc_index.get_frame(recipe_frame.name), recipe_frame)
+
+        if recipe_diff.has_changes():
+            with self.profile.stage('refresh'):
+                self.profile.count_calls(2)
+                arcpy.RefreshTOC()
+                arcpy.RefreshActiveView()
+        arcpy.env.addOutputsToMap = True
+
+        with self.profile.stage('marginalia'):
             self.updateTextElements(recipe)
-            self.mxd.save()
+
+    def get_added_layer(self, arc_data_frame, position, arc_lyr_name):
+        """
+        Returns the layer which was the `position`th to be added to `arc_data_frame` by the previous cook.
+
+        @raises IncrementalCookError: If the layers in the data frame do not match those recorded by the
+                                      previous cook.
+        """
+        added_lyrs = [lyr for lyr in self.doc_index.list_layers(arc_data_frame)
+                      if lyr.longName != "Data Driven Pages" and '\\' not in lyr.longName]
+        expected = self.added_layers.get(arc_data_frame.name, [])
+        if [lyr.name for lyr in added_lyrs] != [arc_name for recipe_name, arc_name in expected]:
+            raise IncrementalCookError(
+                'The layers in data frame "{}" do not match those added by the previous cook'.format(
+                    arc_data_frame.name))
+
+        arc_lyr = added_lyrs[position]
+        if arc_lyr.name != arc_lyr_name:
+            raise IncrementalCookError('Expected layer "{}" but found "{}"'.format(arc_lyr_name, arc_lyr.name))
+
+        return arc_lyr
+
+    def update_layer(self, arc_lyr, recipe_lyr, fields):
+        """
+        Updates `fields` (see `recipe_diff.IN_PLACE_LAYER_FIELDS`) of a layer which is already in the map.
+
+        @raises IncrementalCookError: If the layer cannot be updated (eg its new data source cannot be
+                                      applied). A full cook then handles the layer as `addLayer` does,
+                                      rather than leaving it in the map with its previous settings.
+        """
+        try:
+            if ('data_source_path' in fields or 'data_name' in fields) and arc_lyr.supports("DATASOURCE"):
+                self.replace_data_source(arc_lyr, recipe_lyr)
+
+            if 'definition_query' in fields and arc_lyr.supports('DEFINITIONQUERY'):
+                with self.profile.stage('definition_query'):
+                    self.profile.count_calls()
+                    # An empty string removes a definition query which is no longer required
+                    arc_lyr.definitionQuery = recipe_lyr.definition_query or ''
+
+            if 'label_classes' in fields:
+                with self.profile.stage('label_classes'):
+                    self.apply_label_classes(arc_lyr, recipe_lyr)
+
+            if 'visible' in fields:
+                self.profile.count_calls()
+                arc_lyr.visible = getattr(recipe_lyr, 'visible', True)
+        except Exception as exp:
+            raise IncrementalCookError('Unable to update layer "{}": {}'.format(recipe_lyr.name, exp))
+
+        recipe_lyr.success = True
+        self.save()
 
     def process_layer(self, recipe_lyr, arc_data_frame):
         """
         Updates or Adds a layer of data.  Maintains the Map Report.
         """
         # Try just using add Layer (currently no update layer option)
-        self.addLayer(recipe_lyr, arc_data_frame)
+        with self.profile.stage('add_layer'):
+            self.addLayer(recipe_lyr, arc_data_frame)
+
+    def get_marginalia_context(self, recipe):
+        """
+        Returns the MarginaliaContext for `recipe`. The scale and spatial reference are only calculated
+        if they are required, and then only once.
+        """
+        return create_context(
+            recipe,
+            self.eventConfiguration,
+            self.output_path or self.mxd.filePath,
+            self.dataSources,
+            scale=lambda: get_map_scale(self.mxd, recipe, self.doc_index),
+            datum=lambda: get_map_spatial_ref(self.mxd, recipe, self.doc_index)
+        )
 
     def updateTextElements(self, recipe):
         """
         Updates Text Elements in Marginalia
         """
-        for elm in arcpy.mapping.ListLayoutElements(self.mxd, "TEXT_ELEMENT"):
-            if elm.name == "country":
-                elm.text = self.eventConfiguration.country_name
-            if elm.name == "title":
-                elm.text = recipe.product
-            if elm.name == "create_date_time":
-                elm.text = recipe.creation_time_stamp.strftime("%d-%b-%Y %H:%M")
-            if elm.name == "summary":
-                elm.text = recipe.summary
-            if elm.name == "map_no":
-                elm.text = recipe.mapnumber
-            if elm.name == "mxd_name":
-                elm.text = os.path.basename(self.mxd.filePath)
-            if elm.name == "scale":
-                elm.text = get_map_scale(self.mxd, recipe)
-            if elm.name == "data_sources":
-                iter = 0
-                dataSourcesString = "<BOL>Data Sources:</BOL>" + os.linesep + os.linesep
-                for ds in self.dataSources:
-                    if (iter > 0):
-                        dataSourcesString = dataSourcesString + ", "
-                    dataSourcesString = dataSourcesString + ds
-                    iter = iter + 1
-                elm.text = dataSourcesString
-            if elm.name == "map_version":
-                versionNumberString = "v" + str(recipe.version_num).zfill(2)
-                elm.text = versionNumberString
-            if elm.name == "spatial_reference":
-                elm.text = get_map_spatial_ref(self.mxd, recipe)
-            if elm.name == "glide_no":
-                if self.eventConfiguration and self.eventConfiguration.glide_number:
-                    elm.text = self.eventConfiguration.glide_number
-            if elm.name == "donor_credit":
-                if self.eventConfiguration:
-                    elm.text = self.eventConfiguration.default_donor_credits
-            if elm.name == "disclaimer":
-                if self.eventConfiguration:
-                    elm.text = self.eventConfiguration.default_disclaimer_text
-            if elm.name == "map_producer":
-                if self.eventConfiguration:
-                    elm.text = "Produced by " + \
-                        self.eventConfiguration.default_source_organisation + \
-                        os.linesep + \
-                        self.eventConfiguration.deployment_primary_email + \
-                        os.linesep + \
-                        self.eventConfiguration.default_source_organisation_url
-        self.mxd.save()
+        context = self.get_marginalia_context(recipe)
+        self._marginalia_context = context
+        if self._text_elements is None:
+            self.profile.count_calls()
+            self._text_elements = arcpy.mapping.ListLayoutElements(self.mxd, "TEXT_ELEMENT")
+
+        originals = self._original_text if self.reuse_document else None
+        updated = self.marginalia.render(self._text_elements, context, self.profile, originals)
+        logging.debug('Updated text elements: {}'.format(updated))
+        if updated:
+            self.save()
 
     def showLegendEntries(self):
-        for legend in arcpy.mapping.ListLayoutElements(self.mxd, "LEGEND_ELEMENT"):
-            layerNames = list()
-            for lyr in legend.listLegendItemLayers():
-                if ((lyr.name in self.legendEntriesToRemove) or (lyr.name in layerNames)):
-                    legend.removeItem(lyr)
-                else:
-                    layerNames.append(lyr.name)
-        self.mxd.save()
+        """
+        Applies `self.legend_plan` to each of the legend elements in the layout.
+        """
+        self.profile.count_calls()
+        legends = arcpy.mapping.ListLayoutElements(self.mxd, "LEGEND_ELEMENT")
+        removed = self.legend_plan.apply(legends, self.profile)
+        for item in removed:
+            logging.debug('Removed "{layer}" from legend "{legend}": {reason}'.format(**item))
+        if removed:
+            self.save()
 
     # TODO asmith 2020/03/06
     # Please don't hard code size and location of elements on the template
@@ -276,14 +610,14 @@ class MapChef:
                 legend.elementWidth = 60
                 legend.elementPositionX = 248.9111
                 legend.elementPositionY = 40
-        self.mxd.save()
+        self.save()
 
     # TODO asmith 2020/03/06
     # Please don't hard code size and location of elements on the template
     def resizeScaleBar(self):
         elm = arcpy.mapping.ListLayoutElements(self.mxd, "MAPSURROUND_ELEMENT", "Scale Bar")[0]
         elm.elementWidth = 51.1585
-        self.mxd.save()
+        self.save()
 
     def apply_frame_crs_and_extent(self, arc_data_frame, recipe_frame):
         """
@@ -295,18 +629,23 @@ class MapChef:
                 recipe_frame.crs))
 
         prj_wkid = int(recipe_frame.crs[5:])
-        arc_data_frame.spatialReference = arcpy.SpatialReference(prj_wkid)
+        self._remember_frame_state(arc_data_frame)
+        self.profile.count_calls()
+        arc_data_frame.spatialReference = self.doc_index.get_spatial_reference(prj_wkid)
 
         if recipe_frame.extent:
+            self.profile.count_calls(2)
             new_extent = arcpy.Extent(*recipe_frame.extent)
             arc_data_frame.extent = new_extent
-        self.mxd.save()
+        self.save()
 
-    def addLayer(self, recipe_lyr, recipe_frame):
+    def addLayer(self, recipe_lyr, arc_data_frame):
         # addLayer(recipe_lyr, recipe_lyr.layer_file_path, recipe_lyr.name)
         # mapResult = MapResult(recipe_lyr.name)
         logging.debug('Attempting to add layer; {}'.format(recipe_lyr.layer_file_path))
-        arc_lyr_to_add = arcpy.mapping.Layer(recipe_lyr.layer_file_path)
+        with self.profile.stage('layer_parse'):
+            self.profile.count_calls()
+            arc_lyr_to_add = self.layer_cache.get_layer(recipe_lyr.layer_file_path)
         # if (".gdb/" not in recipe_lyr.reg_exp):
         #     mapResult = self.addLayerWithFile(recipe_lyr, arc_lyr_to_add,  recipe_frame)
         # else:
@@ -315,10 +654,12 @@ class MapChef:
         # Apply Label Classes
         try:
             self.apply_layer_visiblity(arc_lyr_to_add, recipe_lyr)
-            self.apply_label_classes(arc_lyr_to_add, recipe_lyr)
+            with self.profile.stage('label_classes'):
+                self.apply_label_classes(arc_lyr_to_add, recipe_lyr)
             # Apply Definition Query
-            self.apply_definition_query(arc_lyr_to_add, recipe_lyr)
-            self.addLayerWithFile(arc_lyr_to_add, recipe_lyr, recipe_frame)
+            with self.profile.stage('definition_query'):
+                self.apply_definition_query(arc_lyr_to_add, recipe_lyr)
+            self.addLayerWithFile(arc_lyr_to_add, recipe_lyr, arc_data_frame)
             recipe_lyr.success = True
         except Exception:
             recipe_lyr.success = False
@@ -326,6 +667,7 @@ class MapChef:
     def apply_layer_visiblity(self, arc_lyr_to_add, recipe_lyr):
         if arc_lyr_to_add.supports('VISIBLE'):
             try:
+                self.profile.count_calls()
                 arc_lyr_to_add.visible = recipe_lyr.visible
             except Exception as exp:
                 recipe_lyr.error_messages.append('Error whilst applying layer visiblity: {}'.format(
@@ -336,6 +678,7 @@ class MapChef:
             for labelClass in recipe_lyr.label_classes:
                 for lblClass in arc_lyr_to_add.labelClasses:
                     if (lblClass.className == labelClass.class_name):
+                        self.profile.count_calls(3)
                         lblClass.SQLQuery = labelClass.sql_query
                         lblClass.expression = labelClass.expression
                         lblClass.showClassLabels = labelClass.show_class_labels
@@ -347,6 +690,7 @@ class MapChef:
         if recipe_lyr.definition_query and arc_lyr_to_add.supports('DEFINITIONQUERY'):
             try:
                 logging.debug('  Attempting to apply definition query')
+                self.profile.count_calls()
                 arc_lyr_to_add.definitionQuery = recipe_lyr.definition_query
             except Exception as exp:
                 logging.error('Error whilst applying definition query: "{}"\n{}'.format(
@@ -356,40 +700,35 @@ class MapChef:
 
     def get_dataset_type_from_path(self, f_path):
         """
-        * '.shp' at the end of a path name
-        * '.img' at the end of a path name
-        * '.tif' at the end of a path name
-        * '.gdb\' in the middle of a path name
-        """
-        dataset_type_lookup = [
-            (r'\.shp$', 'SHAPEFILE_WORKSPACE'),
-            (r'\.img$', 'RASTER_WORKSPACE'),
-            (r'\.tif$', 'RASTER_WORKSPACE'),
-            (r'\.gdb\\.+', 'FILEGDB_WORKSPACE')
-        ]
+        Returns the ESRI dataset type of `f_path`. See `dataset_types.DATASET_TYPE_PATTERNS` for the
+        supported formats.
 
-        for reg_ex, dataset_type in dataset_type_lookup:
-            if re.search(reg_ex, f_path):
-                return dataset_type
+        @raises UnsupportedDatasetTypeError: (a subclass of ValueError) if the type is not recognised.
+        """
+        return get_dataset_type(f_path)
 
-        raise ValueError('"Unsupported dataset type with path: {}'.format(f_path))
+    def replace_data_source(self, arc_lyr, recipe_lyr):
+        """
+        Points `arc_lyr` at the data source of `recipe_lyr`.
+        """
+        r_path = os.path.realpath(recipe_lyr.data_source_path)
+        data_src_dir = os.path.dirname(r_path)
+        dataset_type = self.get_dataset_type_from_path(r_path)
+        with self.profile.stage('replace_data_source'):
+            self.profile.count_calls()
+            arc_lyr.replaceDataSource(data_src_dir, dataset_type, recipe_lyr.data_name)
 
-    def addLayerWithFile(self, arc_lyr_to_add, recipe_lyr, recipe_frame):
+    def addLayerWithFile(self, arc_lyr_to_add, recipe_lyr, arc_data_frame):
         # Skip past any layer which didn't already have a source file located
         try:
             recipe_lyr.data_source_path
         except AttributeError:
             return
 
-        r_path = os.path.realpath(recipe_lyr.data_source_path)
-        data_src_dir = os.path.dirname(r_path)
-        dataset_type = self.get_dataset_type_from_path(r_path)
-
         # Apply Data Source
         if arc_lyr_to_add.supports("DATASOURCE"):
             try:
-                arc_lyr_to_add.replaceDataSource(data_src_dir, dataset_type, recipe_lyr.data_name)
-                arc_data_frame = arcpy.mapping.ListDataFrames(self.mxd, recipe_frame.name)[0]
+                self.replace_data_source(arc_lyr_to_add, recipe_lyr)
                 # TODO add proper fix for applyZoom in line with these two cards
                 # https: // trello.com/c/Bs70ru1s/145-design-criteria-for-selecting-zoom-extent
                 # https://trello.com/c/piE3tKRp/146-implenment-rules-for-selection-zoom-extent
@@ -398,8 +737,13 @@ class MapChef:
                 # Is this even required after adding each layer?
                 # self.apply_frame_crs_and_extent(arc_data_frame, recipe_frame)
 
-                if recipe_lyr.add_to_legend is False:
-                    self.legendEntriesToRemove.append(arc_lyr_to_add.name)
-                arcpy.mapping.AddLayer(arc_data_frame, arc_lyr_to_add, "BOTTOM")
+                self.legend_plan.note_layer_added(recipe_lyr, arc_lyr_to_add.name)
+                self._added_visibility.setdefault((arc_data_frame.name, arc_lyr_to_add.name), []).append(
+                    getattr(recipe_lyr, 'visible', True))
+                with self.profile.stage('add_layer_to_frame'):
+                    self.profile.count_calls()
+                    arcpy.mapping.AddLayer(arc_data_frame, arc_lyr_to_add, "BOTTOM")
+                    self.doc_index.note_layer_added(arc_data_frame)
+                self.added_layers.setdefault(arc_data_frame.name, []).append([recipe_lyr.name, arc_lyr_to_add.name])
             finally:
-                self.mxd.save()
+                self.save()
@@ -0,0 +1,192 @@
+import os
+
+
+class MarginaliaContext:
+    """
+    The values used to populate the text elements of a map layout.
+
+    Expensive values (eg the map scale) can be registered with `set_lazy`, in which case they are only
+    calculated if the layout contains an element which uses them, and then only once.
+    """
+
+    def __init__(self, **values):
+        self._values = dict(values)
+        self._factories = dict()
+
+    def __setitem__(self, key, value):
+        self._factories.pop(key, None)
+        self._values[key] = value
+
+    def set_lazy(self, key, factory):
+        """
+        Registers a zero-argument callable which is called to calculate the value of `key` the first
+        time that it is requested.
+        """
+        self._values.pop(key, None)
+        self._factories[key] = factory
+
+    def __getitem__(self, key):
+        if key not in self._values:
+            # Raises KeyError if `key` is unknown
+            self._values[key] = self._factories.pop(key)()
+
+        return self._values[key]
+
+    def __contains__(self, key):
+        return key in self._values or key in self._factories
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def derive(self, **overrides):
+        """
+        Returns a new context containing all of the values of this one, with `overrides` applied. Any
+        values already calculated are shared rather than recalculated.
+        """
+        derived = MarginaliaContext()
+        derived._values.update(self._values)
+        derived._factories.update(self._factories)
+        for key, value in overrides.items():
+            derived[key] = value
+        return derived
+
+
+def create_context(recipe, hum_event, mxd_path, data_sources=(), scale=None, datum=None):
+    """
+    Creates the MarginaliaContext for a single cook of `recipe`.
+
+    @param recipe: The MapRecipe being cooked.
+    @param hum_event: The Event object (may be None).
+    @param mxd_path: The path of the MXD being produced.
+    @param data_sources: An iterable of data source credits.
+    @param scale: The scale string, or a callable which returns it.
+    @param datum: The spatial reference string, or a callable which returns it.
+    @returns: A MarginaliaContext.
+    """
+    context = MarginaliaContext(
+        recipe=recipe,
+        event=hum_event,
+        mxd_path=mxd_path,
+        timestamp=recipe.creation_time_stamp,
+        data_sources=list(data_sources)
+    )
+
+    for key, value in (('scale', scale), ('datum', datum)):
+        if callable(value):
+            context.set_lazy(key, value)
+        else:
+            context[key] = value
+
+    return context
+
+
+def _event_value(attribute):
+    def _handler(ctx):
+        if ctx['event']:
+            return getattr(ctx['event'], attribute)
+        return None
+    return _handler
+
+
+def _glide_no(ctx):
+    if ctx['event'] and ctx['event'].glide_number:
+        return ctx['event'].glide_number
+    return None
+
+
+def _data_sources(ctx):
+    return "<BOL>Data Sources:</BOL>" + os.linesep + os.linesep + ", ".join(ctx['data_sources'])
+
+
+def _map_producer(ctx):
+    hum_event = ctx['event']
+    if not hum_event:
+        return None
+
+    return os.linesep.join([
+        "Produced by " + hum_event.default_source_organisation,
+        hum_event.deployment_primary_email,
+        hum_event.default_source_organisation_url
+    ])
+
+
+# Each handler takes a MarginaliaContext and returns the new text for the element, or None to leave the
+# element unchanged.
+DEFAULT_HANDLERS = {
+    "country": lambda ctx: ctx['event'].country_name,
+    "title": lambda ctx: ctx['recipe'].product,
+    "create_date_time": lambda ctx: ctx['timestamp'].strftime("%d-%b-%Y %H:%M"),
+    "summary": lambda ctx: ctx['recipe'].summary,
+    "map_no": lambda ctx: ctx['recipe'].mapnumber,
+    "mxd_name": lambda ctx: os.path.basename(ctx['mxd_path']),
+    "scale": lambda ctx: ctx['scale'],
+    "data_sources": _data_sources,
+    "map_version": lambda ctx: "v" + str(ctx['recipe'].version_num).zfill(2),
+    "spatial_reference": lambda ctx: ctx['datum'],
+    "glide_no": _glide_no,
+    "donor_credit": _event_value('default_donor_credits'),
+    "disclaimer": _event_value('default_disclaimer_text'),
+    "map_producer": _map_producer
+}
+
+
+# Used for each page of an atlas. These expect the context to include a `region` value.
+ATLAS_PAGE_HANDLERS = {
+    "title": lambda ctx: (ctx['recipe'].category + " map of " + ctx['event'].country_name + '\n' +
+                          "<CLR red = '255'>Sheet - " + ctx['region'] + "</CLR>"),
+    "map_no": lambda ctx: ctx['recipe'].mapnumber + "_Sheet_" + ctx['region'].replace(' ', '_')
+}
+
+
+class MarginaliaRenderer:
+    """
+    Updates the text elements of a map layout by looking up a handler for each element by name.
+    """
+
+    def __init__(self, handlers=None, include_defaults=True):
+        """
+        Arguments:
+           handlers {dict} -- (optional) Additional or replacement handlers, keyed on text element name.
+           include_defaults {bool} -- If True `DEFAULT_HANDLERS` are included.
+        """
+        self.handlers = dict(DEFAULT_HANDLERS) if include_defaults else dict()
+        if handlers:
+            self.handlers.update(handlers)
+
+    def register(self, element_name, handler):
+        """
+        Registers (or replaces) the handler for the text element `element_name`. `handler` is called with
+        a MarginaliaContext and should return the new text, or None to leave the element unchanged.
+        """
+        self.handlers[element_name] = handler
+
+    def render(self, text_elements, context, profile=None, originals=None):
+        """
+        Updates each element in `text_elements` which has a handler. Elements whose text would not
+        change are not written to.
+
+        @param text_elements: An iterable of TEXT_ELEMENT layout elements.
+        @param context: The MarginaliaContext.
+        @param profile: (optional) A CookProfile used to count the number of elements written.
+        @param originals: (optional) A dict. The text of each element, before it is first updated, is
+                          recorded here as `originals[id(elm)] = (elm, text)` so that it can be restored.
+        @returns: A list of the names of the elements which were updated.
+        """
+        updated = []
+        for elm in text_elements:
+            handler = self.handlers.get(elm.name)
+            if handler is None:
+                continue
+
+            new_text = handler(context)
+            if new_text is None or elm.text == new_text:
+                continue
+
+            if profile is not None:
+                profile.count_calls()
+            if originals is not None and id(elm) not in originals:
+                originals[id(elm)] = (elm, elm.text)
+            elm.text = new_text
+            updated.append(elm.name)
+
+        return updated
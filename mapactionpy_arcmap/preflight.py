@@ -0,0 +1,189 @@
+import logging
+import os
+import re
+from collections import namedtuple, OrderedDict
+from multiprocessing.pool import ThreadPool
+
+from dataset_types import get_default_resolver
+
+# Layer files are OLE2 compound documents
+LAYER_FILE_SIGNATURE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+DEFAULT_PREFLIGHT_THREADS = 8
+
+# Datasets which live inside a container (eg a feature class in a file geodatabase) are checked by
+# checking that the container exists.
+_CONTAINER_REGEX = re.compile(r'^(.*?\.(gdb|mdb|sde|odc|xlsx?|dwg|dxf|dgn))([\\/].*)?$', re.IGNORECASE)
+
+PreflightIssue = namedtuple('PreflightIssue', ['map_frame', 'layer', 'path', 'message', 'fatal'])
+
+
+class PreflightError(ValueError):
+    """
+    Raised when the pre-flight checks for a recipe find one or more fatal problems.
+    """
+
+    def __init__(self, report):
+        self.report = report
+        super(PreflightError, self).__init__(
+            'Pre-flight checks failed for "{}":\n\t{}'.format(
+                report.product, '\n\t'.join(issue.message for issue in report.get_fatal_issues())))
+
+
+class PreflightReport:
+    """
+    The outcome of the pre-flight checks for a single recipe.
+    """
+
+    def __init__(self, product):
+        self.product = product
+        self.issues = []
+        self.layers_checked = 0
+
+    def add_issue(self, map_frame, layer, path, message, fatal=True):
+        self.issues.append(PreflightIssue(map_frame, layer, path, message, fatal))
+
+    def get_fatal_issues(self):
+        return [issue for issue in self.issues if issue.fatal]
+
+    def is_ok(self):
+        """
+        Returns True if there are no fatal issues. There may still be warnings.
+        """
+        return not self.get_fatal_issues()
+
+    def raise_for_fatal(self):
+        """
+        @raises PreflightError: If there are any fatal issues.
+        """
+        if not self.is_ok():
+            raise PreflightError(self)
+
+    def as_dict(self):
+        """
+        Returns the report as a dict, suitable for writing to the run report.
+        """
+        return OrderedDict([
+            ('product', self.product),
+            ('ok', self.is_ok()),
+            ('layers_checked', self.layers_checked),
+            ('issues', [issue._asdict() for issue in self.issues])
+        ])
+
+
+def check_layer_file(lyr_path):
+    """
+    Checks that `lyr_path` exists, can be opened and looks like a layer file.
+
+    @returns: A list of error messages. Empty if there are no problems.
+    """
+    if not lyr_path:
+        return ['No layer file specified']
+
+    try:
+        with open(lyr_path, 'rb') as lyr_file:
+            header = lyr_file.read(len(LAYER_FILE_SIGNATURE))
+    except (IOError, OSError) as exp:
+        return ['Unable to open layer file "{}": {}'.format(lyr_path, exp)]
+
+    if header != LAYER_FILE_SIGNATURE:
+        return ['"{}" is not a valid layer file'.format(lyr_path)]
+
+    return []
+
+
+def check_data_source(data_source_path, resolver):
+    """
+    Checks that `data_source_path` (or the geodatabase, spreadsheet etc which contains it) exists,
+    that its dataset type is supported and, for shapefiles, that the mandatory sidecar files exist.
+
+    @returns: A list of error messages. Empty if there are no problems.
+    """
+    r_path = os.path.realpath(data_source_path)
+    _, unsupported = resolver.classify([r_path])
+    if unsupported:
+        return ['Unsupported dataset type with path: {}'.format(r_path)]
+
+    container = _CONTAINER_REGEX.match(r_path)
+    check_path = container.group(1) if container else r_path
+    if not os.path.exists(check_path):
+        return ['Data source "{}" does not exist'.format(check_path)]
+
+    errors = []
+    if r_path.lower().endswith('.shp'):
+        base_path = r_path[:-4]
+        for ext in ('.shx', '.dbf'):
+            if not (os.path.exists(base_path + ext) or os.path.exists(base_path + ext.upper())):
+                errors.append('Shapefile "{}" is missing its {} file'.format(r_path, ext))
+
+    return errors
+
+
+def _check_path(args):
+    kind, f_path, resolver = args
+    try:
+        if kind == 'layer_file':
+            return check_layer_file(f_path)
+        return check_data_source(f_path, resolver)
+    except Exception as exp:
+        return ['Unexpected error whilst checking "{}": {}'.format(f_path, exp)]
+
+
+def run_preflight(recipes, num_threads=DEFAULT_PREFLIGHT_THREADS, resolver=None):
+    """
+    Checks every layer file and data source used by `recipes`, without using arcpy. Each distinct
+    path is only checked once, even if it is used by several recipes, and the checks are spread over
+    a pool of threads since they are almost entirely I/O.
+
+    @param recipes: An iterable of MapRecipe objects.
+    @param num_threads: The number of threads used to carry out the checks.
+    @param resolver: (optional) The DatasetTypeResolver used to check the dataset types. Defaults to the
+                     resolver shared with the cook (see `dataset_types.get_default_resolver`).
+    @returns: A list of PreflightReport objects, one for each recipe, in the same order as `recipes`.
+    """
+    resolver = resolver or get_default_resolver()
+    recipes = list(recipes)
+
+    to_check = OrderedDict()
+    for recipe in recipes:
+        for recipe_frame in recipe.map_frames:
+            for recipe_lyr in recipe_frame.layers:
+                to_check[('layer_file', recipe_lyr.layer_file_path)] = None
+                data_source_path = getattr(recipe_lyr, 'data_source_path', None)
+                if data_source_path:
+                    to_check[('data_source', data_source_path)] = None
+
+    if to_check:
+        pool = ThreadPool(max(1, min(num_threads, len(to_check))))
+        try:
+            results = pool.map(_check_path, [(kind, f_path, resolver) for kind, f_path in to_check])
+        finally:
+            pool.close()
+            pool.join()
+        to_check = OrderedDict(zip(to_check.keys(), results))
+
+    reports = []
+    for recipe in recipes:
+        report = PreflightReport(recipe.product)
+        for recipe_frame in recipe.map_frames:
+            for recipe_lyr in recipe_frame.layers:
+                report.layers_checked += 1
+                for msg in to_check[('layer_file', recipe_lyr.layer_file_path)]:
+                    report.add_issue(recipe_frame.name, recipe_lyr.name, recipe_lyr.layer_file_path, msg)
+
+                data_source_path = getattr(recipe_lyr, 'data_source_path', None)
+                if not data_source_path:
+                    report.add_issue(recipe_frame.name, recipe_lyr.name, None,
+                                     'No data source has been located for layer "{}". It will not be added to '
+                                     'the map'.format(recipe_lyr.name), fatal=False)
+                    continue
+
+                for msg in to_check[('data_source', data_source_path)]:
+                    report.add_issue(recipe_frame.name, recipe_lyr.name, data_source_path, msg)
+
+        for issue in report.issues:
+            log = logging.error if issue.fatal else logging.warning
+            log('Pre-flight ({}): {}'.format(report.product, issue.message))
+
+        reports.append(report)
+
+    return reports
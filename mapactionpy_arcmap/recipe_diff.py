@@ -0,0 +1,134 @@
+import json
+import os
+from collections import namedtuple
+
+# The properties of a recipe layer which can be updated in place on a layer which is already in the map.
+# A change to any other property (eg `layer_file_path` or `add_to_legend`) requires a full cook.
+IN_PLACE_LAYER_FIELDS = ('data_source_path', 'data_name', 'definition_query', 'label_classes', 'visible')
+FULL_COOK_LAYER_FIELDS = ('layer_file_path', 'add_to_legend')
+FRAME_FIELDS = ('crs', 'extent')
+
+LayerChange = namedtuple('LayerChange', ['frame_name', 'position', 'recipe_lyr', 'arc_lyr_name', 'fields'])
+
+
+def as_plain(value):
+    """
+    Converts `value` into plain lists, dicts and scalars, so that an object from the current recipe can be
+    compared with the same value loaded from the JSON of the previous recipe. jsonpickle's type tags are
+    discarded.
+    """
+    if isinstance(value, dict):
+        if 'py/tuple' in value:
+            return as_plain(value['py/tuple'])
+        return dict((k, as_plain(v)) for k, v in value.items() if not k.startswith('py/'))
+    if isinstance(value, (list, tuple)):
+        return [as_plain(v) for v in value]
+    if hasattr(value, '__dict__'):
+        return as_plain(vars(value))
+    return value
+
+
+def _get(obj, key, default=None):
+    if isinstance(obj, dict):
+        return obj.get(key, default)
+    return getattr(obj, key, default)
+
+
+def load_recipe_json(recipe_json_path):
+    """
+    Loads the recipe written alongside an MXD by `ArcMapRunner.build_project_files`, as plain dicts
+    and lists.
+    """
+    with open(recipe_json_path, 'r') as recipe_file:
+        return as_plain(json.load(recipe_file))
+
+
+class RecipeDiff:
+    """
+    The differences between the recipe used to create the previous version of a product, and the recipe
+    for the new version.
+
+    The diff is "safe" (ie can be applied to a copy of the previous MXD in place of a full cook) only if
+    both recipes use the same template and the same data frames, and the same layers would be added to
+    each frame, in the same order, from the same layer files.
+    """
+
+    def __init__(self, previous_recipe, current_recipe, previous_added_layers):
+        """
+        Arguments:
+           previous_recipe {dict} -- The previous recipe, as returned by `load_recipe_json`.
+           current_recipe {MapRecipe} -- The recipe for the new version.
+           previous_added_layers {dict} -- For each frame name, a list of [recipe layer name, arc layer name]
+                                           pairs for the layers actually added to the previous MXD, in the
+                                           order in which they were added. See `MapChef.added_layers`.
+        """
+        self.unsafe_reasons = []
+        self.changed_frames = []
+        self.changed_layers = []
+        self.previous_added_layers = previous_added_layers or {}
+        self._compare(previous_recipe, current_recipe, self.previous_added_layers)
+
+    def is_safe(self):
+        return not self.unsafe_reasons
+
+    def has_changes(self):
+        return bool(self.changed_frames or self.changed_layers)
+
+    def _unsafe(self, msg):
+        self.unsafe_reasons.append(msg)
+
+    def _compare(self, previous, current, previous_added_layers):
+        if os.path.basename(_get(previous, 'template_path') or '') != \
+                os.path.basename(_get(current, 'template_path') or ''):
+            self._unsafe('The template has changed')
+
+        prev_frames = dict((f['name'], f) for f in previous.get('map_frames', []))
+        current_names = [recipe_frame.name for recipe_frame in current.map_frames]
+        if sorted(prev_frames.keys()) != sorted(current_names):
+            self._unsafe('The map frames have changed')
+            return
+
+        for recipe_frame in current.map_frames:
+            prev_frame = prev_frames[recipe_frame.name]
+            if any(as_plain(_get(recipe_frame, f)) != prev_frame.get(f) for f in FRAME_FIELDS):
+                self.changed_frames.append(recipe_frame)
+
+            self._compare_layers(recipe_frame, prev_frame, previous_added_layers.get(recipe_frame.name, []))
+
+    def _compare_layers(self, recipe_frame, prev_frame, prev_added):
+        # Only layers with a data source are added to the map. See `MapChef.addLayerWithFile`
+        to_add = [lyr for lyr in recipe_frame.layers if _get(lyr, 'data_source_path')]
+        if [lyr.name for lyr in to_add] != [recipe_name for recipe_name, arc_name in prev_added]:
+            self._unsafe('The layers added to "{}" have changed'.format(recipe_frame.name))
+            return
+
+        prev_lyrs = dict((lyr['name'], lyr) for lyr in prev_frame.get('layers', []) if isinstance(lyr, dict))
+        for position, recipe_lyr in enumerate(to_add):
+            prev_lyr = prev_lyrs.get(recipe_lyr.name)
+            if prev_lyr is None:
+                self._unsafe('Layer "{}" is not in the previous recipe'.format(recipe_lyr.name))
+                return
+
+            for field in FULL_COOK_LAYER_FIELDS:
+                if as_plain(_get(recipe_lyr, field)) != prev_lyr.get(field):
+                    self._unsafe('The {} of layer "{}" has changed'.format(field, recipe_lyr.name))
+                    return
+
+            changed = [f for f in IN_PLACE_LAYER_FIELDS if as_plain(_get(recipe_lyr, f)) != prev_lyr.get(f)]
+            if changed:
+                self.changed_layers.append(
+                    LayerChange(recipe_frame.name, position, recipe_lyr, prev_added[position][1], changed))
+
+    def get_report(self):
+        """
+        Returns a JSON-serialisable summary of the diff.
+        """
+        return {
+            'safe': self.is_safe(),
+            'unsafe_reasons': list(self.unsafe_reasons),
+            'changed_frames': [recipe_frame.name for recipe_frame in self.changed_frames],
+            'changed_layers': [
+                {'frame': c.frame_name, 'layer': c.recipe_lyr.name, 'fields': list(c.fields)}
+                for c in self.changed_layers
+            ]
+        }
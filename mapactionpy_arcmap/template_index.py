@@ -0,0 +1,246 @@
+import argparse
+import arcpy
+import glob
+import logging
+import multiprocessing
+import os
+import traceback
+
+from change_detection import load_manifest, write_manifest
+from doc_index import matches_wildcard
+from mapactionpy_controller.crash_move_folder import CrashMoveFolder
+
+# Increment whenever the contents of an entry change, so that existing indexes are rebuilt
+INDEX_VERSION = 2
+INDEX_FNAME = 'template-index.json'
+
+
+def get_template_key(template_path):
+    return os.path.normcase(os.path.realpath(template_path))
+
+
+def _has_data_driven_pages(mxd):
+    try:
+        # Raises an exception if Data Driven Pages is not enabled
+        return mxd.dataDrivenPages is not None
+    except Exception:
+        return False
+
+
+def read_template(template_path):
+    """
+    Opens the template and reads everything about it which is recorded in the index.
+
+    @returns: A dict with the keys:
+              `data_frames`: A list of dicts (one per data frame, in document order) with the keys `name`,
+                             `element_width`, `element_height` and `crs` (the factory code and name of the
+                             spatial reference).
+              `text_elements`, `legend_elements` and `map_surround_elements`: Lists of the names of the
+                             layout elements of each type.
+              `data_driven_pages`: True if Data Driven Pages is enabled.
+    """
+    mxd = arcpy.mapping.MapDocument(template_path)
+    data_frames = []
+    for arc_df in arcpy.mapping.ListDataFrames(mxd):
+        spatial_ref = arc_df.spatialReference
+        data_frames.append({
+            'name': arc_df.name,
+            'element_width': arc_df.elementWidth,
+            'element_height': arc_df.elementHeight,
+            'crs': {'factory_code': spatial_ref.factoryCode, 'name': spatial_ref.name}
+        })
+
+    return {
+        'data_frames': data_frames,
+        'text_elements': [elm.name for elm in arcpy.mapping.ListLayoutElements(mxd, "TEXT_ELEMENT")],
+        'legend_elements': [elm.name for elm in arcpy.mapping.ListLayoutElements(mxd, "LEGEND_ELEMENT")],
+        'map_surround_elements': [elm.name for elm in arcpy.mapping.ListLayoutElements(mxd, "MAPSURROUND_ELEMENT")],
+        'data_driven_pages': _has_data_driven_pages(mxd)
+    }
+
+
+def _read_template_job(template_path):
+    try:
+        return template_path, read_template(template_path), None
+    except Exception:
+        return template_path, None, traceback.format_exc()
+
+
+def get_frames(entry, frame_name):
+    """
+    Returns the data frames in the index `entry` for a template whose names match `frame_name`, by the same
+    rules as `arcpy.mapping.ListDataFrames` and `DocumentIndex.get_frames` (see `matches_wildcard`).
+    """
+    return [df for df in entry['data_frames'] if matches_wildcard(df['name'], frame_name)]
+
+
+def check_template(entry, recipe):
+    """
+    Checks that the template described by the index `entry` can be used to cook `recipe`, without opening
+    the template.
+
+    @returns: A list of descriptions of the problems. Empty if there are none.
+    """
+    problems = []
+    principal_frames = get_frames(entry, recipe.principal_map_frame)
+    if not principal_frames:
+        problems.append('The template does not have a MapFrame (aka DataFrame) with the name "{}"'.format(
+            recipe.principal_map_frame))
+    elif len(principal_frames) > 1:
+        problems.append('The template has more than one MapFrame (aka DataFrame) with the name "{}"'.format(
+            recipe.principal_map_frame))
+
+    for recipe_frame in recipe.map_frames:
+        if recipe_frame.name != recipe.principal_map_frame and not get_frames(entry, recipe_frame.name):
+            problems.append('The template does not have a MapFrame (aka DataFrame) with the name "{}"'.format(
+                recipe_frame.name))
+
+    return problems
+
+
+class TemplateIndex:
+    """
+    A persistent index of the contents of each template (see `read_template`), stored as a JSON file, so
+    that templates do not need to be opened just to answer questions about them.
+
+    Each entry is keyed on the real path of the template, and is only used if the mtime and size of the
+    template are unchanged. Templates which are not in the index, or which have changed, are read (in a
+    pool of worker processes if `processes` is greater than 1) and the index is rewritten.
+    """
+
+    def __init__(self, index_path, processes=1):
+        """
+        Arguments:
+           index_path {str} -- The path of the index file. It is created if it does not exist.
+           processes {int} -- The number of worker processes used to read templates.
+        """
+        self.index_path = index_path
+        self.processes = processes
+        index = load_manifest(index_path)
+        if index and index.get('version') == INDEX_VERSION:
+            self._templates = index.get('templates', {})
+        else:
+            self._templates = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_entries(self, template_paths):
+        """
+        @returns: A dict of the index entry for each of `template_paths`, keyed on the path as given.
+                  Templates which do not exist or which could not be read are omitted.
+        """
+        entries = {}
+        stale = []
+        for template_path in template_paths:
+            try:
+                stat = os.stat(template_path)
+            except OSError:
+                continue
+
+            stamp = [stat.st_mtime, stat.st_size]
+            cached = self._templates.get(get_template_key(template_path))
+            if cached and cached['stamp'] == stamp:
+                self.hits += 1
+                entries[template_path] = cached
+            else:
+                stale.append((template_path, stamp))
+
+        if not stale:
+            return entries
+
+        self.misses += len(stale)
+        stamps = dict(stale)
+        for template_path, entry, error in self._read_templates([item[0] for item in stale]):
+            if error:
+                logging.warning('Unable to index template {}:\n{}'.format(template_path, error))
+                continue
+
+            entry['path'] = template_path
+            # The stamp from before the template was read, so that a change made while it was being read is
+            # picked up next time
+            entry['stamp'] = stamps[template_path]
+            self._templates[get_template_key(template_path)] = entry
+            entries[template_path] = entry
+
+        self.save()
+        return entries
+
+    def _read_templates(self, template_paths):
+        if self.processes < 2 or len(template_paths) < 2:
+            return [_read_template_job(template_path) for template_path in template_paths]
+
+        pool = multiprocessing.Pool(processes=min(self.processes, len(template_paths)))
+        try:
+            return pool.map(_read_template_job, template_paths)
+        finally:
+            pool.close()
+            pool.join()
+
+    def get_entry(self, template_path):
+        """
+        @returns: The index entry for `template_path`, or None if it does not exist or could not be read.
+        """
+        return self.get_entries([template_path]).get(template_path)
+
+    def scan(self, template_dir):
+        """
+        Indexes every template in `template_dir`. Entries for templates in that directory which no longer
+        exist are removed.
+
+        @returns: A dict of the index entry for each template, keyed on path.
+        """
+        template_paths = sorted(glob.glob(os.path.join(template_dir, '*.mxd')))
+        current = set(get_template_key(template_path) for template_path in template_paths)
+        dir_key = get_template_key(template_dir)
+        removed = [key for key in self._templates
+                   if os.path.dirname(key) == dir_key and key not in current]
+        for key in removed:
+            del self._templates[key]
+
+        entries = self.get_entries(template_paths)
+        if removed:
+            self.save()
+        return entries
+
+    def save(self):
+        try:
+            write_manifest(self.index_path, {'version': INDEX_VERSION, 'templates': self._templates})
+        except (IOError, OSError) as exp:
+            # The templates are read again on the next run, so this need not stop the run
+            logging.warning('Unable to write the template index {}: {}'.format(self.index_path, exp))
+
+    def get_stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'templates': len(self._templates)}
+
+
+def main(args):
+    cmf = CrashMoveFolder(args.cmf)
+    index = TemplateIndex(os.path.join(cmf.map_projects, INDEX_FNAME), processes=args.processes)
+    entries = index.scan(cmf.map_templates)
+
+    # Print one row per template:
+    print("template|dataFrames|textElements|legendElements|mapSurroundElements|dataDrivenPages")
+    for template_path in sorted(entries):
+        entry = entries[template_path]
+        print("|".join(map(str, (
+            os.path.basename(template_path),
+            ', '.join('{} ({}x{}, {})'.format(df['name'], df['element_width'], df['element_height'],
+                                              df['crs']['name']) for df in entry['data_frames']),
+            ', '.join(entry['text_elements']),
+            ', '.join(entry['legend_elements']),
+            ', '.join(entry['map_surround_elements']),
+            entry['data_driven_pages']))))
+
+    print("{hits} template(s) unchanged, {misses} indexed".format(**index.get_stats()))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Builds the index of the map templates in a crash move folder, and lists their contents.',
+    )
+    parser.add_argument("-cmf", "--cmfDescription", dest="cmf", required=True,
+                        help="path to the cmf_description.json file", metavar="FILE")
+    parser.add_argument("-p", "--processes", dest="processes", type=int, default=1,
+                        help="number of worker processes used to read templates")
+    args = parser.parse_args()
+    main(args)
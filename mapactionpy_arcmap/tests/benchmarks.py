@@ -0,0 +1,446 @@
+"""
+Times `MapChef.cook`, `ArcMapRunner._do_export` and `ArcMapRunner._export_atlas` at several recipe sizes,
+using the arcpy stand-in in `fake_arcpy`, so that they can be measured on a machine without ArcMap.
+
+The results are written as JSON, which can be passed back in as the baseline for a later run:
+
+    python -m mapactionpy_arcmap.tests.benchmarks -o baseline.json
+    python -m mapactionpy_arcmap.tests.benchmarks -b baseline.json -o latest.json
+
+The time taken by each benchmark is mostly the latency simulated for each arcpy call, plus the Python
+overhead of this package. The number of arcpy calls of each kind is also recorded, and unlike the timings
+does not vary between runs.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from collections import OrderedDict
+from datetime import datetime
+from timeit import default_timer
+
+import pytz
+from mock import patch
+
+from mapactionpy_arcmap.tests import fake_arcpy
+
+fake_arcpy.ensure_importable()
+
+from mapactionpy_arcmap import arcmap_runner  # noqa: E402
+from mapactionpy_arcmap.atlas_checkpoint import get_checkpoint_path  # noqa: E402
+from mapactionpy_arcmap.layer_cache import LayerFileCache  # noqa: E402
+from mapactionpy_arcmap.map_chef import MapChef  # noqa: E402
+from mapactionpy_controller.plugin_base import BaseRunnerPlugin  # noqa: E402
+
+RESULTS_VERSION = 1
+
+# Nominal latencies, in seconds. These are not measurements of ArcMap. They are chosen so that the
+# relative costs of the operations are plausible, whilst keeping the whole suite to a few seconds.
+DEFAULT_LATENCIES = {
+    'open': 0.02,
+    'save': 0.02,
+    'layer_parse': 0.005,
+    'add_layer': 0.003,
+    'remove_layer': 0.001,
+    'replace_data_source': 0.002,
+    'list': 0.0005,
+    'export_pdf': 0.05,
+    'export_jpeg': 0.04,
+    'export_png': 0.03,
+    'cursor_row': 0.0001
+}
+
+# The number of layers in the recipe and the number of regions (pages) in the atlas for each size
+RECIPE_SIZES = OrderedDict([
+    ('small', {'layers': 5, 'regions': 4}),
+    ('medium', {'layers': 20, 'regions': 16}),
+    ('large', {'layers': 60, 'regions': 48})
+])
+
+BENCHMARKS = ('cook', 'do_export', 'export_atlas')
+
+MAIN_FRAME = 'Main map'
+TEXT_ELEMENTS = ('title', 'summary', 'map_no', 'mxd_name', 'scale', 'data_sources', 'map_version',
+                 'spatial_reference', 'country', 'create_date_time', 'glide_no', 'donor_credit', 'disclaimer',
+                 'map_producer')
+
+
+class BenchEvent:
+    country_name = 'Atlantis'
+    glide_number = 'EQ-2020-000001-ATL'
+    default_source_organisation = 'MapAction'
+    deployment_primary_email = 'info@example.org'
+    default_source_organisation_url = 'www.example.org'
+    default_donor_credits = 'Supported by the donors'
+    default_disclaimer_text = 'The depiction and use of boundaries are not warranted to be error free'
+    default_pdf_res_dpi = 300
+    default_jpeg_res_dpi = 100
+
+
+class BenchCrashMoveFolder:
+
+    def __init__(self, root_dir):
+        self.path = root_dir
+        self.map_projects = os.path.join(root_dir, 'map_projects')
+        self.map_templates = os.path.join(root_dir, 'map_templates')
+        self.export_dir = os.path.join(root_dir, 'export')
+
+
+class BenchLabelClass:
+
+    def __init__(self):
+        self.class_name = 'Default'
+        self.sql_query = ''
+        self.expression = '[NAME]'
+        self.show_class_labels = True
+
+
+class BenchLayer:
+
+    def __init__(self, name, layer_file_path, data_source_path):
+        self.name = name
+        self.layer_file_path = layer_file_path
+        self.data_source_path = data_source_path
+        self.data_name = os.path.splitext(os.path.basename(data_source_path))[0]
+        self.visible = True
+        self.add_to_legend = True
+        self.label_classes = [BenchLabelClass()]
+        self.definition_query = None
+        self.error_messages = []
+        self.success = None
+
+
+class BenchFrame:
+
+    def __init__(self, name, layers):
+        self.name = name
+        self.layers = layers
+        self.crs = 'epsg:4326'
+        self.extent = (30.0, -20.0, 40.0, -10.0)
+
+    def get_layer(self, layer_name):
+        return [lyr for lyr in self.layers if lyr.name == layer_name][0]
+
+
+class BenchAtlas:
+
+    def __init__(self, layer_name):
+        self.map_frame = MAIN_FRAME
+        self.layer_name = layer_name
+        self.column_name = 'ADM1_NAME'
+
+
+class BenchRecipe:
+    """
+    Has the attributes of a MapRecipe which are used by the cook and the export.
+    """
+
+    def __init__(self, frame, map_project_path, export_path, atlas=None):
+        self.product = 'Benchmark reference map'
+        self.summary = 'A map with many layers'
+        self.category = 'Reference'
+        self.mapnumber = 'MA001'
+        self.version_num = 1
+        self.principal_map_frame = frame.name
+        self.map_frames = [frame]
+        self.atlas = atlas
+        self.map_project_path = map_project_path
+        self.export_path = export_path
+        self.core_file_name = 'ma001-v01-benchmark-reference-map'
+        self.creation_time_stamp = datetime.now(pytz.utc)
+        self.export_metadata = {}
+        self.zip_file_contents = []
+
+    def get_frame(self, frame_name):
+        return [frame for frame in self.map_frames if frame.name == frame_name][0]
+
+
+class BenchFixture:
+    """
+    A crash move folder in a temporary directory, with a template, layer files and atlas features
+    registered with the stand-in, for a recipe of the given size.
+    """
+
+    def __init__(self, arcpy_stand_in, num_layers, num_regions):
+        self.arcpy = arcpy_stand_in
+        self.cmf = BenchCrashMoveFolder(tempfile.mkdtemp(prefix='mapactionpy-bench-'))
+        for dir_path in (self.cmf.map_projects, self.cmf.map_templates, self.cmf.export_dir):
+            os.makedirs(dir_path)
+
+        self.template_path = os.path.join(self.cmf.map_templates, 'arcgis_10_6_reference_landscape_bottom.mxd')
+        arcpy_stand_in.create_template(self.template_path, [(MAIN_FRAME, 27.0, 25.0), ('Location map', 6.0, 5.0)],
+                                       TEXT_ELEMENTS, [('Legend', MAIN_FRAME)], ['Scale Bar', 'North Arrow'])
+
+        lyr_dir = os.path.join(self.cmf.path, 'layer_files')
+        os.makedirs(lyr_dir)
+        layers = []
+        for i in range(num_layers):
+            name = 'mainmap-lyr{:03d}-py-s0-reference'.format(i)
+            lyr_path = os.path.join(lyr_dir, name + '.lyr')
+            with open(lyr_path, 'w') as f:
+                f.write('layer file')
+            layers.append(BenchLayer(name, lyr_path, os.path.join(self.cmf.path, 'data', name + '.shp')))
+        self.frame = BenchFrame(MAIN_FRAME, layers)
+
+        # The atlas is of the first layer
+        self.atlas_layer = layers[0]
+        features = []
+        for i in range(num_regions):
+            region = u'Region {:03d}'.format(i)
+            x = 30.0 + (i % 8)
+            y = -20.0 + (i // 8)
+            # Two features per region
+            features.extend([(region, (x, y, x + 0.6, y + 1.0)), (region, (x + 0.4, y, x + 1.0, y + 0.8))])
+        arcpy_stand_in.add_features(self.atlas_layer.data_source_path, features)
+
+    def new_recipe(self, name, with_atlas=False):
+        """
+        Copies the template to a new MXD, and returns a recipe for it.
+        """
+        map_project_path = os.path.join(self.cmf.map_projects, name + '.mxd')
+        shutil.copyfile(self.template_path, map_project_path)
+        export_path = os.path.join(self.cmf.export_dir, name)
+        if not os.path.isdir(export_path):
+            os.makedirs(export_path)
+
+        for lyr in self.frame.layers:
+            lyr.success = None
+            lyr.error_messages = []
+        atlas = BenchAtlas(self.atlas_layer.name) if with_atlas else None
+        return BenchRecipe(self.frame, map_project_path, export_path, atlas)
+
+    def cook(self, recipe):
+        mxd = self.arcpy.MapDocument(recipe.map_project_path)
+        chef = MapChef(mxd, self.cmf, BenchEvent(), layer_cache=LayerFileCache(self.arcpy.Layer))
+        chef.cook(recipe)
+        return chef
+
+    def create_runner(self):
+        def _init(runner, hum_event):
+            # The controller reads the crash move folder from the event's `cmf_descriptor_path`
+            runner.hum_event = hum_event
+            runner.cmf = self.cmf
+
+        with patch.object(BaseRunnerPlugin, '__init__', _init):
+            return arcmap_runner.ArcMapRunner(BenchEvent())
+
+    def close(self):
+        shutil.rmtree(self.cmf.path, ignore_errors=True)
+
+
+def _time_repeats(arcpy_stand_in, repeats, setup, func):
+    """
+    Calls `setup()` and then `func(setup_result)` `repeats` times, timing only `func`.
+
+    @returns: A tuple of the sorted timings, the arcpy calls made by the final call of `func` and the
+              final result of `func`.
+    """
+    timings = []
+    result = None
+    for _ in range(repeats):
+        state = setup()
+        arcpy_stand_in.reset_calls()
+        start = default_timer()
+        result = func(state)
+        timings.append(default_timer() - start)
+
+    return sorted(timings), dict(arcpy_stand_in.calls), result
+
+
+def _summarise(timings, arcpy_calls, stages=None):
+    summary = OrderedDict([
+        ('repeats', len(timings)),
+        ('min_seconds', timings[0]),
+        ('median_seconds', timings[len(timings) // 2]),
+        ('max_seconds', timings[-1]),
+        ('arcpy_calls', OrderedDict(sorted(arcpy_calls.items())))
+    ])
+    if stages is not None:
+        summary['stages'] = OrderedDict(
+            (stage, round(values['seconds'], 6)) for stage, values in sorted(stages.items()))
+    return summary
+
+
+def bench_cook(fixture, arcpy_stand_in, repeats):
+    timings, calls, chef = _time_repeats(
+        arcpy_stand_in, repeats, lambda: fixture.new_recipe('cook'), fixture.cook)
+    return _summarise(timings, calls, chef.profile.as_dict())
+
+
+def bench_do_export(fixture, arcpy_stand_in, repeats):
+    runner = fixture.create_runner()
+    recipe = fixture.new_recipe('export')
+    fixture.cook(recipe)
+
+    def _setup():
+        recipe.export_metadata = {}
+        recipe.zip_file_contents = []
+        return recipe
+
+    def _export(recipe):
+        # As `export_maps`, which can not be called directly as it also writes the export XML
+        runner._open_package(recipe)
+        try:
+            runner._do_export(recipe)
+            runner.zip_exported_files(recipe)
+        finally:
+            runner._abort_package()
+
+    timings, calls, _ = _time_repeats(arcpy_stand_in, repeats, _setup, _export)
+    return _summarise(timings, calls, runner.export_profile.as_dict())
+
+
+def bench_export_atlas(fixture, arcpy_stand_in, repeats):
+    runner = fixture.create_runner()
+    recipe = fixture.new_recipe('atlas', with_atlas=True)
+    fixture.cook(recipe)
+
+    def _setup():
+        # Otherwise every page would be resumed from the checkpoint of the previous repeat
+        checkpoint_path = get_checkpoint_path(recipe.map_project_path)
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        recipe.zip_file_contents = []
+        return arcpy_stand_in.MapDocument(recipe.map_project_path)
+
+    timings, calls, _ = _time_repeats(
+        arcpy_stand_in, repeats, _setup, lambda arc_mxd: runner._export_atlas(recipe, arc_mxd, recipe.export_path))
+    summary = _summarise(timings, calls)
+    summary['pages'] = runner.atlas_report['pages']
+    return summary
+
+
+BENCHMARK_FUNCS = {
+    'cook': bench_cook,
+    'do_export': bench_do_export,
+    'export_atlas': bench_export_atlas
+}
+
+
+def run_benchmarks(sizes=None, benchmarks=BENCHMARKS, repeats=5, latencies=None):
+    """
+    Runs each of `benchmarks` at each of `sizes` (keys of `RECIPE_SIZES`).
+
+    @param latencies: (optional) The simulated latency of each arcpy call. Defaults to `DEFAULT_LATENCIES`.
+    @returns: A dict of the results, keyed on `<benchmark>/<size>`, together with the settings used.
+    """
+    if latencies is None:
+        latencies = DEFAULT_LATENCIES
+    sizes = sizes or list(RECIPE_SIZES)
+    arcpy_stand_in = fake_arcpy.ArcpyStandIn(latencies)
+
+    results = OrderedDict()
+    with fake_arcpy.installed(arcpy_stand_in):
+        for size in sizes:
+            fixture = BenchFixture(arcpy_stand_in, RECIPE_SIZES[size]['layers'], RECIPE_SIZES[size]['regions'])
+            try:
+                for benchmark in benchmarks:
+                    key = '{}/{}'.format(benchmark, size)
+                    results[key] = BENCHMARK_FUNCS[benchmark](fixture, arcpy_stand_in, repeats)
+                    logging.info('{}: median {:.3f}s'.format(key, results[key]['median_seconds']))
+            finally:
+                fixture.close()
+
+    return OrderedDict([
+        ('version', RESULTS_VERSION),
+        ('python', sys.version.split()[0]),
+        ('repeats', repeats),
+        ('latencies', OrderedDict(sorted(latencies.items()))),
+        ('recipe_sizes', OrderedDict((size, RECIPE_SIZES[size]) for size in sizes)),
+        ('results', results)
+    ])
+
+
+def compare_results(baseline, latest):
+    """
+    Compares two sets of results from `run_benchmarks`. Only the benchmarks in both are compared.
+
+    @returns: A list of dicts with the keys `benchmark`, `baseline_seconds`, `latest_seconds`, `ratio` (of the
+              median timings) and `changed_calls` (a dict of (baseline, latest) for each kind of arcpy call
+              whose count has changed).
+    """
+    if baseline.get('latencies') != latest.get('latencies'):
+        logging.warning('The baseline was run with different latencies, so the timings are not comparable')
+
+    comparison = []
+    for key, result in latest['results'].items():
+        base = baseline['results'].get(key)
+        if base is None:
+            continue
+
+        call_names = set(base['arcpy_calls']) | set(result['arcpy_calls'])
+        changed_calls = dict(
+            (name, (base['arcpy_calls'].get(name, 0), result['arcpy_calls'].get(name, 0))) for name in call_names
+            if base['arcpy_calls'].get(name, 0) != result['arcpy_calls'].get(name, 0))
+        comparison.append({
+            'benchmark': key,
+            'baseline_seconds': base['median_seconds'],
+            'latest_seconds': result['median_seconds'],
+            'ratio': result['median_seconds'] / base['median_seconds'] if base['median_seconds'] else None,
+            'changed_calls': changed_calls
+        })
+
+    return comparison
+
+
+def main(args):
+    latencies = dict(DEFAULT_LATENCIES)
+    if args.latencies:
+        with open(args.latencies) as f:
+            latencies.update(json.load(f))
+
+    results = run_benchmarks(args.sizes, args.benchmarks, args.repeats, latencies)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    print("benchmark|medianSeconds|arcpyCalls")
+    for key, result in results['results'].items():
+        print("|".join((key, '{:.3f}'.format(result['median_seconds']), str(sum(result['arcpy_calls'].values())))))
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    regressions = 0
+    print("")
+    print("benchmark|baselineSeconds|latestSeconds|ratio|changedCalls")
+    for row in compare_results(baseline, results):
+        ratio = row['ratio']
+        if ratio is not None and ratio > 1 + args.tolerance:
+            regressions += 1
+        print("|".join((row['benchmark'], '{:.3f}'.format(row['baseline_seconds']),
+                        '{:.3f}'.format(row['latest_seconds']), '{:.2f}'.format(ratio) if ratio else '-',
+                        ', '.join('{}: {} -> {}'.format(name, *counts)
+                                  for name, counts in sorted(row['changed_calls'].items())))))
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    # The package configures logging at INFO when it is imported
+    logging.getLogger().setLevel(logging.WARNING)
+    parser = argparse.ArgumentParser(
+        description='Times the cook and export against an arcpy stand-in with simulated latencies.',
+    )
+    parser.add_argument("-o", "--output", dest="output", metavar="FILE",
+                        help="path to write the results to, as JSON")
+    parser.add_argument("-b", "--baseline", dest="baseline", metavar="FILE",
+                        help="path to the results of an earlier run to compare with")
+    parser.add_argument("-t", "--tolerance", dest="tolerance", type=float, default=0.1,
+                        help="fail if any median timing is slower than the baseline by more than this fraction")
+    parser.add_argument("-s", "--sizes", dest="sizes", nargs='+', choices=list(RECIPE_SIZES),
+                        help="recipe sizes to run (defaults to all)")
+    parser.add_argument("--benchmarks", dest="benchmarks", nargs='+', choices=BENCHMARKS, default=BENCHMARKS,
+                        help="benchmarks to run (defaults to all)")
+    parser.add_argument("-r", "--repeats", dest="repeats", type=int, default=5,
+                        help="number of times to run each benchmark")
+    parser.add_argument("-l", "--latencies", dest="latencies", metavar="FILE",
+                        help="path to a JSON file of latencies (in seconds) to use in place of the defaults")
+    args = parser.parse_args()
+    sys.exit(main(args))
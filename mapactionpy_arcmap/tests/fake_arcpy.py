@@ -0,0 +1,451 @@
+"""
+An in-memory stand-in for the parts of `arcpy` which are used by this package, so that MapChef and
+ArcMapRunner can be run (and timed) on a machine without ArcMap.
+
+Map documents are held in memory. Each MXD on disk is a small placeholder file which names the saved state
+of the document, so copying an MXD (eg `create_ouput_map_project`), `save`, `saveACopy` and reopening a
+document all behave as they do with ArcMap. Exports write small, valid, PDF/JPEG/PNG files.
+
+Every call is counted in `ArcpyStandIn.calls`, and a latency (in seconds) can be set for each of
+`LATENCY_KEYS`, which is slept on every call to simulate the cost of the same operation in ArcMap.
+
+The state is held in this process, so the stand-in cannot be used with the worker process options (eg
+`export_processes`).
+"""
+import copy
+import io
+import itertools
+import json
+import os
+import sys
+import time
+import types
+from collections import Counter
+from contextlib import contextmanager
+from PIL import Image
+
+# The operations whose latency can be simulated
+LATENCY_KEYS = (
+    'open',                 # MapDocument
+    'save',                 # MapDocument.save and MapDocument.saveACopy
+    'layer_parse',          # Layer
+    'add_layer',            # AddLayer
+    'remove_layer',         # RemoveLayer
+    'replace_data_source',  # Layer.replaceDataSource
+    'list',                 # ListDataFrames, ListLayers and ListLayoutElements
+    'export_pdf',           # ExportToPDF
+    'export_jpeg',          # ExportToJPEG
+    'export_png',           # ExportToPNG
+    'cursor_row'            # Each row read from a da.SearchCursor
+)
+
+_DOCUMENT_HEADER = 'arcpy stand-in document '
+_PAGE_SIZE = (420, 297)
+
+
+class _SharesStandIn(object):
+    """
+    Base class for the document objects. A deep copy shares the stand-in rather than copying it, so that
+    `LayerFileCache` and `save` can copy layers and documents.
+    """
+
+    def __deepcopy__(self, memo):
+        clone = self.__class__.__new__(self.__class__)
+        memo[id(self)] = clone
+        for key, value in self.__dict__.items():
+            setattr(clone, key, value if key == '_arcpy' else copy.deepcopy(value, memo))
+        return clone
+
+
+class FakeExtent(object):
+
+    def __init__(self, XMin=0.0, YMin=0.0, XMax=1.0, YMax=1.0):
+        self.XMin, self.YMin, self.XMax, self.YMax = XMin, YMin, XMax, YMax
+
+    @property
+    def width(self):
+        return self.XMax - self.XMin
+
+    @property
+    def height(self):
+        return self.YMax - self.YMin
+
+    @property
+    def JSON(self):
+        return json.dumps({'xmin': self.XMin, 'ymin': self.YMin, 'xmax': self.XMax, 'ymax': self.YMax})
+
+    def projectAs(self, spatial_reference):
+        return FakeExtent(self.XMin, self.YMin, self.XMax, self.YMax)
+
+
+class FakeSpatialReference(object):
+
+    def __init__(self, factory_code=4326):
+        self.factoryCode = int(factory_code)
+        self.name = 'EPSG_{}'.format(self.factoryCode)
+        self.datumName = 'D_WGS_1984'
+
+
+class FakeGeometry(object):
+
+    def __init__(self, extent):
+        self.extent = extent
+
+
+class FakeDescription(object):
+
+    def __init__(self, extent):
+        self.extent = extent
+
+
+class FakeLabelClass(object):
+
+    def __init__(self, className):
+        self.className = className
+        self.SQLQuery = ''
+        self.expression = ''
+        self.showClassLabels = True
+
+
+class FakeLayer(_SharesStandIn):
+
+    SUPPORTS = ('NAME', 'LONGNAME', 'VISIBLE', 'DATASOURCE', 'DEFINITIONQUERY', 'LABELCLASSES')
+
+    def __init__(self, arcpy_stand_in, lyr_path):
+        self._arcpy = arcpy_stand_in
+        self.name = os.path.splitext(os.path.basename(lyr_path))[0]
+        self.longName = self.name
+        self.isGroupLayer = False
+        self.visible = True
+        self.definitionQuery = ''
+        self.dataSource = ''
+        self.labelClasses = [FakeLabelClass('Default')]
+
+    def supports(self, layer_property):
+        return layer_property.upper() in self.SUPPORTS
+
+    def replaceDataSource(self, workspace_path, workspace_type, dataset_name=None, validate=True):
+        self._arcpy._call('replace_data_source')
+        self.dataSource = os.path.join(workspace_path, dataset_name or '')
+
+
+class FakeDataFrame(_SharesStandIn):
+
+    def __init__(self, document, name, element_width, element_height):
+        self._document = document
+        self.name = name
+        self.elementWidth = element_width
+        self.elementHeight = element_height
+        self.spatialReference = FakeSpatialReference()
+        self.extent = FakeExtent()
+        self.layers = []
+
+    @property
+    def scale(self):
+        # Assuming degrees and a frame measured in cm
+        return round(self.extent.width * 111319.5 * 100 / self.elementWidth)
+
+
+class FakeTextElement(object):
+    type = 'TEXT_ELEMENT'
+
+    def __init__(self, name, text=''):
+        self.name = name
+        self.text = text
+
+
+class FakeLegendElement(object):
+    """
+    A legend which, as with the default ArcMap legend, adds an item for each layer added to its data frame.
+    """
+    type = 'LEGEND_ELEMENT'
+
+    def __init__(self, name, frame_name):
+        self.name = name
+        self.frame_name = frame_name
+        self.items = []
+
+    def listLegendItemLayers(self):
+        return list(self.items)
+
+    def removeItem(self, lyr):
+        self.items = [item for item in self.items if item is not lyr]
+
+
+class FakeMapSurroundElement(object):
+    type = 'MAPSURROUND_ELEMENT'
+
+    def __init__(self, name):
+        self.name = name
+        self.elementWidth = 50
+
+
+class FakeMapDocument(_SharesStandIn):
+
+    def __init__(self, arcpy_stand_in, file_path):
+        self._arcpy = arcpy_stand_in
+        self.filePath = os.path.abspath(file_path)
+        self.frames = []
+        self.elements = []
+
+    def save(self):
+        self._arcpy._call('save')
+        self._arcpy._write_document(self, self.filePath)
+
+    def saveACopy(self, file_name):
+        self._arcpy._call('save')
+        if os.path.exists(file_name):
+            raise IOError('{} already exists'.format(file_name))
+        self._arcpy._write_document(self, file_name)
+
+
+class _SearchCursor(object):
+
+    def __init__(self, arcpy_stand_in, rows):
+        self._arcpy = arcpy_stand_in
+        self._rows = rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __iter__(self):
+        for row in self._rows:
+            self._arcpy._call('cursor_row')
+            yield row
+
+
+def _matches(name, wildcard):
+    # Imported here as `doc_index` imports `arcpy`, which may be this stand-in
+    from mapactionpy_arcmap.doc_index import matches_wildcard
+    return matches_wildcard(name, wildcard)
+
+
+def _image_bytes(img_format):
+    buf = io.BytesIO()
+    Image.new('RGB', _PAGE_SIZE, (240, 240, 230)).save(buf, img_format)
+    return buf.getvalue()
+
+
+class ArcpyStandIn:
+    """
+    The stand-in. `module` is an object which may be used in place of the `arcpy` module, eg by `installed`.
+    """
+
+    def __init__(self, latencies=None):
+        """
+        Arguments:
+           latencies {dict} -- (optional) The latency, in seconds, of each of `LATENCY_KEYS`. Any which are
+                               not given have no latency.
+        """
+        self.latencies = dict((key, 0) for key in LATENCY_KEYS)
+        self.set_latencies(latencies or {})
+        self.calls = Counter()
+        # The saved state of each document, keyed on the id written to its placeholder file
+        self._saved = {}
+        self._next_id = itertools.count(1)
+        # The rows returned by da.SearchCursor for each data source, keyed on `_data_source_key`
+        self._features = {}
+        self._images = {}
+        self.module = self._create_module()
+
+    def set_latencies(self, latencies):
+        unknown = set(latencies) - set(LATENCY_KEYS)
+        if unknown:
+            raise ValueError('Unknown latencies: {}. The latencies are: {}'.format(
+                ', '.join(sorted(unknown)), ', '.join(LATENCY_KEYS)))
+        self.latencies.update(latencies)
+
+    def reset_calls(self):
+        self.calls = Counter()
+
+    def _call(self, name):
+        self.calls[name] += 1
+        latency = self.latencies.get(name)
+        if latency:
+            time.sleep(latency)
+
+    def _create_module(self):
+        module = types.ModuleType('arcpy')
+        module.mapping = types.ModuleType('arcpy.mapping')
+        module.da = types.ModuleType('arcpy.da')
+        module.env = types.ModuleType('arcpy.env')
+        module.env.addOutputsToMap = True
+
+        for name in ('MapDocument', 'Layer', 'ListDataFrames', 'ListLayers', 'ListLayoutElements', 'AddLayer',
+                     'RemoveLayer', 'ExportToPDF', 'ExportToJPEG', 'ExportToPNG'):
+            setattr(module.mapping, name, getattr(self, name))
+        module.da.SearchCursor = self.SearchCursor
+        module.Extent = FakeExtent
+        module.SpatialReference = self.SpatialReference
+        module.Describe = self.Describe
+        module.RefreshTOC = lambda: self._call('RefreshTOC')
+        module.RefreshActiveView = lambda: self._call('RefreshActiveView')
+        return module
+
+    # Documents
+
+    def create_template(self, mxd_path, frames, text_elements=(), legends=(), map_surrounds=()):
+        """
+        Writes a new template to `mxd_path`.
+
+        @param frames: A list of tuples of (name, element width, element height).
+        @param text_elements: The names of the text elements.
+        @param legends: A list of tuples of (legend name, data frame name).
+        @param map_surrounds: The names of the map surround elements.
+        """
+        mxd = FakeMapDocument(self, mxd_path)
+        mxd.frames = [FakeDataFrame(mxd, name, width, height) for name, width, height in frames]
+        mxd.elements = [FakeTextElement(name) for name in text_elements]
+        mxd.elements.extend(FakeLegendElement(name, frame_name) for name, frame_name in legends)
+        mxd.elements.extend(FakeMapSurroundElement(name) for name in map_surrounds)
+        self._write_document(mxd, mxd_path)
+
+    def _write_document(self, mxd, file_path):
+        doc_id = next(self._next_id)
+        self._saved[doc_id] = copy.deepcopy(mxd)
+        with open(file_path, 'w') as f:
+            f.write(_DOCUMENT_HEADER + str(doc_id))
+
+    def MapDocument(self, mxd_path):
+        self._call('open')
+        with open(mxd_path) as f:
+            content = f.read()
+        if not content.startswith(_DOCUMENT_HEADER):
+            raise AssertionError('{} is not a map document'.format(mxd_path))
+
+        mxd = copy.deepcopy(self._saved[int(content[len(_DOCUMENT_HEADER):])])
+        mxd.filePath = os.path.abspath(mxd_path)
+        return mxd
+
+    def Layer(self, lyr_path):
+        self._call('layer_parse')
+        if not os.path.exists(lyr_path):
+            raise ValueError(lyr_path)
+        return FakeLayer(self, lyr_path)
+
+    def ListDataFrames(self, mxd, wildcard=''):
+        self._call('list')
+        return [arc_df for arc_df in mxd.frames if _matches(arc_df.name, wildcard)]
+
+    def ListLayers(self, mxd, wildcard='', data_frame=None):
+        self._call('list')
+        frames = [data_frame] if data_frame else mxd.frames
+        return [lyr for arc_df in frames for lyr in arc_df.layers if _matches(lyr.name, wildcard)]
+
+    def ListLayoutElements(self, mxd, element_type='', wildcard=''):
+        self._call('list')
+        return [elm for elm in mxd.elements
+                if (not element_type or elm.type == element_type) and _matches(elm.name, wildcard)]
+
+    def AddLayer(self, data_frame, add_layer, add_position='AUTO_ARRANGE'):
+        self._call('add_layer')
+        # As with ArcMap, the layer in the map is not the object which was passed in
+        lyr = copy.deepcopy(add_layer)
+        if add_position == 'TOP':
+            data_frame.layers.insert(0, lyr)
+        else:
+            data_frame.layers.append(lyr)
+
+        for elm in data_frame._document.elements:
+            if elm.type == 'LEGEND_ELEMENT' and elm.frame_name == data_frame.name:
+                elm.items.append(lyr)
+
+    def RemoveLayer(self, data_frame, remove_layer):
+        self._call('remove_layer')
+        data_frame.layers = [lyr for lyr in data_frame.layers if lyr is not remove_layer]
+        for elm in data_frame._document.elements:
+            if elm.type == 'LEGEND_ELEMENT':
+                elm.removeItem(remove_layer)
+
+    # Exports
+
+    def _get_image(self, img_format):
+        if img_format not in self._images:
+            self._images[img_format] = _image_bytes(img_format)
+        return self._images[img_format]
+
+    def ExportToPDF(self, map_document, out_pdf, *args, **kwargs):
+        self._call('export_pdf')
+        texts = dict((elm.name, elm.text) for elm in map_document.elements if elm.type == 'TEXT_ELEMENT')
+        with open(out_pdf, 'wb') as f:
+            f.write(b'%PDF-1.4\n% arcpy stand-in\n')
+            f.write(json.dumps({'texts': texts, 'options': kwargs}, sort_keys=True).encode('utf-8'))
+            f.write(b'\n%%EOF\n')
+
+    def ExportToJPEG(self, map_document, out_jpeg, *args, **kwargs):
+        self._call('export_jpeg')
+        with open(out_jpeg, 'wb') as f:
+            f.write(self._get_image('JPEG'))
+
+    def ExportToPNG(self, map_document, out_png, *args, **kwargs):
+        self._call('export_png')
+        with open(out_png, 'wb') as f:
+            f.write(self._get_image('PNG'))
+
+    # Data
+
+    def _data_source_key(self, data_source):
+        return os.path.splitext(os.path.normcase(os.path.abspath(data_source)))[0]
+
+    def add_features(self, data_source, features):
+        """
+        Sets the features of `data_source`, for `da.SearchCursor` and `Describe`.
+
+        @param features: A list of tuples of (value, (xmin, ymin, xmax, ymax)).
+        """
+        self._features[self._data_source_key(data_source)] = [
+            (value, FakeGeometry(FakeExtent(*extent))) for value, extent in features]
+
+    def SearchCursor(self, in_table, field_names, where_clause=None, spatial_reference=None, **kwargs):
+        rows = self._features.get(self._data_source_key(in_table), [])
+        return _SearchCursor(self, list(rows))
+
+    def SpatialReference(self, item=4326):
+        return FakeSpatialReference(item)
+
+    def Describe(self, value):
+        self._call('describe')
+        extents = [geometry.extent for v, geometry in self._features.get(self._data_source_key(value), [])]
+        if not extents:
+            return FakeDescription(FakeExtent())
+
+        return FakeDescription(FakeExtent(min(ext.XMin for ext in extents), min(ext.YMin for ext in extents),
+                                          max(ext.XMax for ext in extents), max(ext.YMax for ext in extents)))
+
+
+def ensure_importable():
+    """
+    If the real `arcpy` is not available, registers a stand-in as `arcpy` so that the modules of this
+    package can be imported. Use `installed` to choose which stand-in is used.
+    """
+    try:
+        import arcpy  # noqa: F401
+    except ImportError:
+        sys.modules['arcpy'] = ArcpyStandIn().module
+
+
+@contextmanager
+def installed(arcpy_stand_in):
+    """
+    Context manager which makes `arcpy_stand_in` the `arcpy` used by every module of this package (even
+    those which have already imported the real `arcpy`) until it exits.
+    """
+    previous = sys.modules.get('arcpy')
+    sys.modules['arcpy'] = arcpy_stand_in.module
+    patched = []
+    for name, module in list(sys.modules.items()):
+        if module is not None and name.startswith('mapactionpy_arcmap.') and hasattr(module, 'arcpy'):
+            patched.append((module, module.arcpy))
+            module.arcpy = arcpy_stand_in.module
+    try:
+        yield arcpy_stand_in
+    finally:
+        for module, arcpy_module in patched:
+            module.arcpy = arcpy_module
+        if previous is None:
+            del sys.modules['arcpy']
+        else:
+            sys.modules['arcpy'] = previous
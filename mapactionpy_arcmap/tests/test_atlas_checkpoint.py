@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mapactionpy_arcmap.atlas_checkpoint import AtlasCheckpoint, get_checkpoint_path
+from mapactionpy_arcmap.atlas_export import AtlasPage
+
+
+class TestAtlasCheckpoint(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.mxd_path = os.path.join(self.tmp_dir, 'ma001-v01-admin1.mxd')
+        self._write(self.mxd_path, 'mxd')
+        self.checkpoint_path = get_checkpoint_path(self.mxd_path)
+        self.pages = [
+            AtlasPage(i, region, os.path.join(self.tmp_dir, region.lower() + '.pdf'), {'map_no': region}, (i, 0, 1, 1))
+            for i, region in enumerate([u'North', u'South', u'West'])]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, f_path, content):
+        with open(f_path, 'w') as f:
+            f.write(content)
+
+    def _export(self, checkpoint, pages, fail_region=None):
+        for page in pages:
+            error = 'Failed' if page.region == fail_region else None
+            if not error:
+                self._write(page.pdf_path, 'pdf ' + page.region)
+            checkpoint.record({'index': page.index, 'region': page.region, 'path': page.pdf_path, 'seconds': 0,
+                               'error': error})
+
+    def test_interrupted_export_is_resumed(self):
+        checkpoint = AtlasCheckpoint(self.checkpoint_path, self.mxd_path, 300)
+        pending = checkpoint.get_pending(self.pages)
+        self.assertEqual(pending, self.pages)
+        # Interrupted after the first page, with the second page failed
+        self._export(checkpoint, pending[:2], fail_region=u'South')
+
+        checkpoint = AtlasCheckpoint(self.checkpoint_path, self.mxd_path, 300)
+        self.assertEqual([p.region for p in checkpoint.get_pending(self.pages)], [u'South', u'West'])
+
+    def test_stale_pages_are_exported_again(self):
+        checkpoint = AtlasCheckpoint(self.checkpoint_path, self.mxd_path, 300)
+        self._export(checkpoint, checkpoint.get_pending(self.pages))
+        self.assertEqual(AtlasCheckpoint(self.checkpoint_path, self.mxd_path, 300).get_pending(self.pages), [])
+
+        # A PDF modified since it was exported, and a page whose text has changed
+        self._write(self.pages[0].pdf_path, 'pdf nORTH')
+        pages = list(self.pages)
+        pages[2] = pages[2]._replace(texts={'map_no': u'West_2'})
+        checkpoint = AtlasCheckpoint(self.checkpoint_path, self.mxd_path, 300)
+        self.assertEqual([p.region for p in checkpoint.get_pending(pages)], [u'North', u'West'])
+
+        # Every page is stale once the MXD has changed
+        self._write(self.mxd_path, 'mxd v2')
+        checkpoint = AtlasCheckpoint(self.checkpoint_path, self.mxd_path, 300)
+        self.assertEqual(len(checkpoint.get_pending(pages)), 3)
+
+    def test_pages_are_exported_again_with_different_pdf_options(self):
+        checkpoint = AtlasCheckpoint(self.checkpoint_path, self.mxd_path, 300)
+        self._export(checkpoint, checkpoint.get_pending(self.pages))
+
+        checkpoint = AtlasCheckpoint(self.checkpoint_path, self.mxd_path, 300, {'image_quality': 'FASTEST'})
+        self.assertEqual(len(checkpoint.get_pending(self.pages)), 3)
@@ -0,0 +1,97 @@
+import six
+from unittest import TestCase
+
+import mapactionpy_arcmap.atlas_export as atlas_export
+from mapactionpy_arcmap.marginalia import MarginaliaContext, MarginaliaRenderer, ATLAS_PAGE_HANDLERS
+
+# works differently for python 2.7 and python 3.x
+if six.PY2:
+    import mock  # noqa: F401
+else:
+    from unittest import mock  # noqa: F401
+
+
+class _Obj(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class _InProcessPool(object):
+    """
+    Stands in for multiprocessing.Pool, with a single worker which completes the jobs in the reverse order.
+    """
+
+    def __init__(self, processes, initializer=None, initargs=()):
+        self.processes = processes
+        if initializer:
+            initializer(*initargs)
+
+    def imap_unordered(self, func, jobs):
+        for job in reversed(jobs):
+            yield func(job)
+
+    def close(self):
+        pass
+
+    def join(self):
+        pass
+
+
+class TestAtlasExport(TestCase):
+
+    def setUp(self):
+        recipe = _Obj(category='Reference', mapnumber='MA001')
+        event = _Obj(country_name='Atlantis')
+        self.regions = [u'North', u'South East', u'West', u'Central', u'Far East']
+        region_extents = atlas_export.plan_atlas_regions((r, (i, i, i + 1, i + 1)) for i, r in enumerate(self.regions))
+        self.pages = atlas_export.plan_atlas_pages(
+            region_extents, '/exports', 'ma001-v01-admin1', 300, ['title', 'map_no', 'scale'],
+            MarginaliaRenderer(ATLAS_PAGE_HANDLERS, include_defaults=False),
+            MarginaliaContext(recipe=recipe, event=event))
+
+    def test_plan_atlas_pages(self):
+        page = self.pages[1]
+        self.assertEqual(page.index, 1)
+        self.assertEqual(page.pdf_path, '/exports/ma001-v01-admin1-south-east-300dpi.pdf')
+        self.assertEqual(sorted(page.texts), ['map_no', 'title'])
+        self.assertEqual(page.texts['map_no'], 'MA001_Sheet_South_East')
+        self.assertEqual(page.extent, (1, 1, 2, 2))
+
+    @mock.patch('mapactionpy_arcmap.atlas_export.arcpy.da.SearchCursor')
+    def test_plan_atlas_regions(self, mock_SearchCursor):
+        def _feature(region, xmin, ymin, xmax, ymax):
+            return region, _Obj(extent=_Obj(XMin=xmin, YMin=ymin, XMax=xmax, YMax=ymax))
+
+        rows = [_feature(u'North', 0, 5, 2, 6), _feature(u'South', 0, 0, 1, 1), (None, None),
+                _feature(u'North', 1, 4, 3, 5), (u'West', None)]
+        mock_SearchCursor.return_value.__enter__.return_value = iter(rows)
+
+        regions = atlas_export.plan_atlas_regions(
+            atlas_export.iter_region_features('/data/admin1.shp', 'ADM1_EN', where_clause='"ADM1_EN" <> \'\''))
+
+        self.assertEqual(list(regions.items()), [(u'North', (0, 4, 3, 6)), (u'South', (0, 0, 1, 1))])
+        args, kwargs = mock_SearchCursor.call_args
+        self.assertEqual(args, ('/data/admin1.shp', ['ADM1_EN', 'SHAPE@']))
+        self.assertEqual(kwargs['where_clause'], '"ADM1_EN" <> \'\'')
+
+    @mock.patch('mapactionpy_arcmap.atlas_export.render_atlas_page')
+    @mock.patch('mapactionpy_arcmap.atlas_export.DocumentIndex')
+    @mock.patch('mapactionpy_arcmap.atlas_export.arcpy')
+    @mock.patch('mapactionpy_arcmap.atlas_export.multiprocessing.Pool', new=_InProcessPool)
+    def test_parallel_export_is_merged_in_page_order(self, mock_arcpy, mock_DocumentIndex, mock_render):
+        def _render(arc_mxd, arc_df, page, text_elements, dpi, pdf_options=None):
+            if page.region == 'West':
+                raise RuntimeError('ExportToPDF failed')
+        mock_render.side_effect = _render
+
+        completed = []
+        results = atlas_export.export_atlas_in_parallel(
+            '/maps/ma001-v01-admin1.mxd', 'Main map', self.pages, 300, 2, completed.append)
+
+        self.assertEqual([r['region'] for r in results], self.regions)
+        self.assertEqual([r['region'] for r in completed], list(reversed(self.regions)))
+        self.assertEqual(mock_arcpy.mapping.MapDocument.call_count, 1)
+        # The failed page does not stop the others
+        self.assertEqual(mock_render.call_count, len(self.regions))
+        self.assertEqual([r['region'] for r in results if r['error']], ['West'])
+        self.assertIn('ExportToPDF failed', results[2]['error'])
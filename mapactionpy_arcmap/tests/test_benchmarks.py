@@ -0,0 +1,21 @@
+from unittest import TestCase
+
+from mapactionpy_arcmap.tests import benchmarks
+
+
+class TestBenchmarks(TestCase):
+
+    def test_run_and_compare(self):
+        results = benchmarks.run_benchmarks(['small'], repeats=1, latencies={})
+        self.assertEqual(list(results['results']),
+                         ['cook/small', 'do_export/small', 'export_atlas/small'])
+        self.assertEqual(results['results']['export_atlas/small']['pages'],
+                         benchmarks.RECIPE_SIZES['small']['regions'])
+        self.assertEqual(results['results']['cook/small']['arcpy_calls']['add_layer'],
+                         benchmarks.RECIPE_SIZES['small']['layers'])
+
+        latest = {'results': {'cook/small': dict(results['results']['cook/small'])}}
+        latest['results']['cook/small']['arcpy_calls'] = {'add_layer': 6}
+        comparison = benchmarks.compare_results(results, latest)
+        self.assertEqual(len(comparison), 1)
+        self.assertEqual(comparison[0]['changed_calls']['add_layer'], (5, 6))
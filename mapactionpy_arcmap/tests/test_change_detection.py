@@ -0,0 +1,117 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mapactionpy_arcmap.change_detection import ChangeDetector, get_related_files, hash_file
+
+
+class _Obj(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class TestChangeDetection(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.shp_path = os.path.join(self.tmp_dir, 'ago_tran_rds_ln_s1_osm_pp.shp')
+        for ext, content in (('.shp', 'shp'), ('.shx', 'shx'), ('.dbf', 'dbf'), ('.prj', 'prj')):
+            self._write(self.shp_path[:-4] + ext, content)
+
+        self.lyr_path = os.path.join(self.tmp_dir, 'mainmap-tran-rds-ln-s1-allmaps.lyr')
+        self._write(self.lyr_path, 'lyr')
+
+        recipe_lyr = _Obj(name='mainmap-tran-rds-ln-s1-allmaps', layer_file_path=self.lyr_path,
+                          data_source_path=self.shp_path, data_name='ago_tran_rds_ln_s1_osm_pp',
+                          definition_query='', label_classes=[], add_to_legend=True, visible=True)
+        recipe_frame = _Obj(name='Main map', crs='EPSG:4326', extent=[1, 2, 3, 4], layers=[recipe_lyr])
+        self.recipe = _Obj(product='Roads', summary='Roads of Atlantis', category='Reference', atlas=None,
+                           template_path=None, map_frames=[recipe_frame])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, f_path, content, mtime=None):
+        with open(f_path, 'w') as f:
+            f.write(content)
+        if mtime:
+            os.utime(f_path, (mtime, mtime))
+
+    def test_related_files(self):
+        self.assertEqual([os.path.basename(f) for f in get_related_files(self.shp_path)], [
+            'ago_tran_rds_ln_s1_osm_pp.dbf', 'ago_tran_rds_ln_s1_osm_pp.prj', 'ago_tran_rds_ln_s1_osm_pp.shp',
+            'ago_tran_rds_ln_s1_osm_pp.shx'])
+
+        # Schema locks only exist while the shapefile is open, and other files which share its name are unrelated
+        self._write(self.shp_path + '.DESKTOP-1234.5678.sr.lock', 'lock')
+        self._write(self.shp_path[:-4] + '.backup.zip', 'zip')
+        self._write(self.shp_path + '.xml', 'metadata')
+        self.assertEqual([os.path.basename(f) for f in get_related_files(self.shp_path)], [
+            'ago_tran_rds_ln_s1_osm_pp.dbf', 'ago_tran_rds_ln_s1_osm_pp.prj', 'ago_tran_rds_ln_s1_osm_pp.shp',
+            'ago_tran_rds_ln_s1_osm_pp.shp.xml', 'ago_tran_rds_ln_s1_osm_pp.shx'])
+
+        gdb_path = os.path.join(self.tmp_dir, 'ago.gdb')
+        os.mkdir(gdb_path)
+        self._write(os.path.join(gdb_path, 'a00000001.gdbtable'), 'table')
+        self._write(os.path.join(gdb_path, 'a00000001.sr.lock'), 'lock')
+        self.assertEqual(get_related_files(os.path.join(gdb_path, 'ago_tran_rds_ln_s1_osm_pp')),
+                         [os.path.join(os.path.realpath(gdb_path), 'a00000001.gdbtable')])
+
+    def test_unchanged_inputs(self):
+        detector = ChangeDetector()
+        manifest = detector.build_manifest(self.recipe)
+        hashed = detector.files_hashed
+
+        self.assertEqual(ChangeDetector().get_changes(self.recipe, manifest), [])
+        self.assertEqual(detector.files_hashed, hashed)
+
+    def test_touched_file_is_hashed_lazily(self):
+        manifest = ChangeDetector().build_manifest(self.recipe)
+        dbf_path = self.shp_path[:-4] + '.dbf'
+        self._write(dbf_path, 'dbf', mtime=1000000000)
+
+        # There is no hash to compare with yet, so the touched file counts as modified
+        detector = ChangeDetector()
+        self.assertEqual(len(detector.get_changes(self.recipe, manifest)), 1)
+        self.assertEqual(detector.files_hashed, 1)
+
+        # The hash calculated above is recorded, so touching the file again is not a change
+        manifest = detector.build_manifest(self.recipe)
+        self.assertEqual(detector.files_hashed, 1)
+        self._write(dbf_path, 'dbf', mtime=1100000000)
+        self.assertEqual(ChangeDetector().get_changes(self.recipe, manifest), [])
+
+    def test_changed_inputs(self):
+        manifest = ChangeDetector().build_manifest(self.recipe)
+
+        # Same size, different content
+        self._write(self.shp_path[:-4] + '.dbf', 'DBF', mtime=1000000000)
+        self.assertEqual(len(ChangeDetector().get_changes(self.recipe, manifest)), 1)
+
+        # New sidecar file
+        self._write(self.shp_path[:-4] + '.cpg', 'UTF-8')
+        self.assertEqual(len(ChangeDetector().get_changes(self.recipe, manifest)), 2)
+
+        # Recipe change
+        self.recipe.map_frames[0].layers[0].definition_query = '"TYPE" = \'primary\''
+        self.assertIn('The recipe has changed', ChangeDetector().get_changes(self.recipe, manifest))
+
+    def test_event_change_is_a_recipe_change(self):
+        hum_event = _Obj(glide_number='EQ-2020-000001-ATL', default_disclaimer_text='Disclaimer',
+                         default_donor_credits='Donors', default_pdf_res_dpi=300, default_jpeg_res_dpi=200)
+        manifest = ChangeDetector(hum_event).build_manifest(self.recipe)
+        self.assertEqual(ChangeDetector(hum_event).get_changes(self.recipe, manifest), [])
+
+        hum_event.default_donor_credits = 'Other donors'
+        self.assertEqual(ChangeDetector(hum_event).get_changes(self.recipe, manifest), ['The recipe has changed'])
+
+    def test_build_manifest_does_not_hash(self):
+        detector = ChangeDetector()
+        manifest = detector.build_manifest(self.recipe)
+        self.assertEqual(detector.files_hashed, 0)
+        self.assertEqual(ChangeDetector().get_changes(self.recipe, manifest), [])
+
+    def test_hash_file(self):
+        self.assertEqual(hash_file(self.lyr_path, chunk_size=2), hashlib.md5(b'lyr').hexdigest())
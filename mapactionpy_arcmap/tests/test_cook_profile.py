@@ -0,0 +1,61 @@
+import six
+from unittest import TestCase
+
+from mapactionpy_arcmap.cook_profile import CookProfile, DEFAULT_STAGE
+
+# works differently for python 2.7 and python 3.x
+if six.PY2:
+    import mock  # noqa: F401
+else:
+    from unittest import mock  # noqa: F401
+
+
+class TestCookProfile(TestCase):
+
+    def test_calls_are_attributed_to_the_innermost_stage(self):
+        profile = CookProfile()
+        with profile.stage('add_layer'):
+            profile.count_calls()
+            with profile.stage('save'):
+                profile.count_calls()
+            profile.count_calls(2)
+
+        self.assertEqual(profile.get_calls('add_layer'), 3)
+        self.assertEqual(profile.get_calls('save'), 1)
+        self.assertEqual(profile.get_total_calls(), 4)
+
+    def test_calls_outside_a_stage(self):
+        profile = CookProfile()
+        profile.count_calls()
+        profile.count_calls(stage='legend')
+
+        self.assertEqual(profile.get_calls(DEFAULT_STAGE), 1)
+        self.assertEqual(profile.get_calls('legend'), 1)
+        self.assertEqual(profile.get_calls('not_a_stage'), 0)
+
+    def test_stage_is_closed_when_an_exception_is_raised(self):
+        profile = CookProfile()
+        try:
+            with profile.stage('layer_reset'):
+                raise ValueError()
+        except ValueError:
+            pass
+
+        profile.count_calls()
+        self.assertEqual(profile.get_calls('layer_reset'), 0)
+        self.assertEqual(profile.as_dict()['layer_reset']['entries'], 1)
+
+    @mock.patch('mapactionpy_arcmap.cook_profile.default_timer')
+    def test_nested_stage_time_is_excluded_from_the_outer_stage(self, mock_timer):
+        # add_layer starts at 0, layer_parse runs from 1 to 4, add_layer ends at 10
+        mock_timer.side_effect = [0.0, 1.0, 4.0, 10.0]
+        profile = CookProfile()
+        with profile.stage('add_layer'):
+            with profile.stage('layer_parse'):
+                pass
+
+        stages = profile.as_dict()
+        self.assertEqual(stages['add_layer']['seconds'], 7.0)
+        self.assertEqual(stages['add_layer']['total_seconds'], 10.0)
+        self.assertEqual(profile.get_seconds('layer_parse'), 3.0)
+        self.assertEqual(profile.get_total_seconds(), 10.0)
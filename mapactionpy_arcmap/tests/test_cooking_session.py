@@ -0,0 +1,71 @@
+import os
+import shutil
+import six
+import tempfile
+from unittest import TestCase
+
+from mapactionpy_arcmap.cooking_session import CookingSession
+
+# works differently for python 2.7 and python 3.x
+if six.PY2:
+    import mock  # noqa: F401
+else:
+    from unittest import mock  # noqa: F401
+
+
+class TestCookingSession(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.template_path = os.path.join(self.tmp_dir, 'arcgis_10_2_ma9999_allmaps_landscape_bottom.mxd')
+        with open(self.template_path, 'w') as f:
+            f.write('template')
+
+        self.layer_cache = mock.Mock(name='layer_cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _make_recipe(self, mapnumber, template_path=None):
+        recipe = mock.Mock(name=mapnumber)
+        recipe.template_path = template_path or self.template_path
+        recipe.map_project_path = os.path.join(self.tmp_dir, mapnumber + '-v01.mxd')
+        return recipe
+
+    @mock.patch('mapactionpy_arcmap.cooking_session.MapChef')
+    @mock.patch('mapactionpy_arcmap.cooking_session.arcpy.mapping.MapDocument')
+    def test_template_is_opened_once(self, mock_MapDocument, mock_MapChef):
+        session = CookingSession(None, None, layer_cache=self.layer_cache)
+        recipes = [self._make_recipe('MA001'), self._make_recipe('MA002')]
+
+        cooked = list(session.cook_all(recipes))
+
+        self.assertEqual(cooked, recipes)
+        mock_MapDocument.assert_called_once_with(self.template_path)
+        chef = mock_MapChef.return_value
+        self.assertTrue(chef.reuse_document)
+        self.assertEqual(chef.cook.call_count, 2)
+        self.assertEqual(chef.output_path, recipes[1].map_project_path)
+        self.assertEqual(session.get_stats()['documents_opened'], 1)
+
+    @mock.patch('mapactionpy_arcmap.cooking_session.MapChef')
+    @mock.patch('mapactionpy_arcmap.cooking_session.arcpy.mapping.MapDocument')
+    def test_template_is_reopened_after_a_failed_cook(self, mock_MapDocument, mock_MapChef):
+        session = CookingSession(None, None, layer_cache=self.layer_cache)
+        mock_MapChef.return_value.cook.side_effect = [ValueError(), None]
+
+        self.assertRaises(ValueError, session.cook, self._make_recipe('MA001'))
+        session.cook(self._make_recipe('MA002'))
+
+        self.assertEqual(mock_MapDocument.call_count, 2)
+
+    @mock.patch('mapactionpy_arcmap.cooking_session.MapChef')
+    @mock.patch('mapactionpy_arcmap.cooking_session.arcpy.mapping.MapDocument')
+    def test_recipe_without_a_template_uses_the_project_file(self, mock_MapDocument, mock_MapChef):
+        session = CookingSession(None, None, layer_cache=self.layer_cache)
+        recipe = self._make_recipe('MA001', template_path=os.path.join(self.tmp_dir, 'missing.mxd'))
+
+        session.cook(recipe)
+
+        mock_MapDocument.assert_called_once_with(recipe.map_project_path)
+        self.assertEqual(session.get_stats()['open_templates'], 0)
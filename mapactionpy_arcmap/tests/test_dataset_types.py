@@ -0,0 +1,62 @@
+import six
+from unittest import TestCase
+
+from mapactionpy_arcmap.dataset_types import (DatasetTypeResolver, UnsupportedDatasetTypeError, ESRI_DATASET_TYPES,
+                                              DATASET_TYPE_PATTERNS, resolve_recipe)
+
+# works differently for python 2.7 and python 3.x
+if six.PY2:
+    import mock  # noqa: F401
+else:
+    from unittest import mock  # noqa: F401
+
+
+class TestDatasetTypes(TestCase):
+
+    def test_get_dataset_type(self):
+        resolver = DatasetTypeResolver()
+        cases = [
+            (r'D:\cmf\data\ago_admn_ad1_py_s1_pp.shp', 'SHAPEFILE_WORKSPACE'),
+            ('/cmf/data/ago_elev_dem_ras_s1_srtm.tif', 'RASTER_WORKSPACE'),
+            ('/cmf/data/ago_elev_dem_ras_s1_srtm.TIFF', 'RASTER_WORKSPACE'),
+            ('/cmf/data/ago_elev_dem_ras_s1_srtm.img', 'RASTER_WORKSPACE'),
+            (r'D:\cmf\data\ago.gdb\ago_admn_ad1_py_s1_pp', 'FILEGDB_WORKSPACE'),
+            ('/cmf/data/ago.gdb/ago_admn_ad1_py_s1_pp', 'FILEGDB_WORKSPACE'),
+            ('/cmf/data/ago.gdb/ago_stle_ppl_pt_s1_v1.0', 'FILEGDB_WORKSPACE'),
+            ('/cmf/data/ago.mdb/ago_admn_ad1_py_s1_pp', 'ACCESS_WORKSPACE'),
+            ('/cmf/data/ago_tran_rds_ln_s1.dwg', 'CAD_WORKSPACE'),
+            ('/cmf/data/ago_stle_ppl_pt_s1.csv', 'TEXT_WORKSPACE'),
+            ('/cmf/data/ago_stle_ppl_pt_s1.xls/Sheet1$', 'EXCEL_WORKSPACE')
+        ]
+        for f_path, expected in cases:
+            self.assertEqual(resolver.get_dataset_type(f_path), expected, f_path)
+
+    def test_all_patterns_are_esri_dataset_types(self):
+        for reg_ex, dataset_type in DATASET_TYPE_PATTERNS:
+            self.assertIn(dataset_type, ESRI_DATASET_TYPES)
+
+    def test_unsupported_dataset_type(self):
+        resolver = DatasetTypeResolver()
+        self.assertRaises(ValueError, resolver.get_dataset_type, '/cmf/data/readme.pdf')
+        self.assertRaises(UnsupportedDatasetTypeError, resolver.get_dataset_type, '/cmf/data/readme.pdf')
+        # Their workspace is not the directory which contains them, or they are not datasets themselves
+        for f_path in ('/cmf/data/ago_elev_grid/hdr.adf', '/cmf/data/ago_elev_tin/tdenv.adf',
+                       '/cmf/data/ago_stle_ppl_pt_s1.tab', '/cmf/data/ago_admn_ad1_py_s1.e00',
+                       '/cmf/data/ago_stle_ppl_pt_s1.xls'):
+            self.assertRaises(UnsupportedDatasetTypeError, resolver.get_dataset_type, f_path)
+
+    def test_resolve_recipe_reports_every_unsupported_path(self):
+        def _lyr(data_source_path):
+            lyr = mock.Mock()
+            lyr.data_source_path = data_source_path
+            return lyr
+
+        recipe_frame = mock.Mock()
+        recipe_frame.layers = [_lyr('/data/a.shp'), _lyr('/data/b.pdf'), _lyr(None), _lyr('/data/c.kmz')]
+        recipe = mock.Mock()
+        recipe.map_frames = [recipe_frame]
+
+        with self.assertRaises(UnsupportedDatasetTypeError) as cm:
+            resolve_recipe(recipe)
+
+        self.assertEqual(cm.exception.paths, ['/data/b.pdf', '/data/c.kmz'])
@@ -0,0 +1,118 @@
+import six
+from unittest import TestCase
+
+from mapactionpy_arcmap.doc_index import DocumentIndex, matches_wildcard
+
+# works differently for python 2.7 and python 3.x
+if six.PY2:
+    import mock  # noqa: F401
+else:
+    from unittest import mock  # noqa: F401
+
+
+def _make_lyr(name, group=False, long_name=None):
+    lyr = mock.Mock(name=name)
+    lyr.name = name
+    lyr.longName = long_name or name
+    lyr.isGroupLayer = group
+    return lyr
+
+
+class TestDocumentIndex(TestCase):
+
+    def setUp(self):
+        self.main_df = mock.Mock(name='main_df')
+        self.main_df.name = 'Main map'
+        self.inset_df = mock.Mock(name='inset_df')
+        self.inset_df.name = 'Location map'
+
+        self.group_lyr = _make_lyr('roads', group=True)
+        self.sub_lyr = _make_lyr('primary', long_name='roads\\primary')
+        self.main_lyrs = [self.group_lyr, self.sub_lyr, _make_lyr('rivers')]
+        self.inset_lyrs = [_make_lyr('coastline')]
+
+    def _list_layers(self, mxd, wildcard, arc_df):
+        return {
+            id(self.main_df): list(self.main_lyrs),
+            id(self.inset_df): list(self.inset_lyrs)
+        }[id(arc_df)]
+
+    @mock.patch('mapactionpy_arcmap.doc_index.arcpy.mapping.ListLayers')
+    @mock.patch('mapactionpy_arcmap.doc_index.arcpy.mapping.ListDataFrames')
+    def test_frames_and_layers_are_only_listed_once(self, mock_ListDataFrames, mock_ListLayers):
+        mock_ListDataFrames.return_value = [self.main_df, self.inset_df]
+        mock_ListLayers.side_effect = self._list_layers
+
+        doc_index = DocumentIndex(None)
+        for _ in range(3):
+            self.assertIs(doc_index.get_frame('Main map'), self.main_df)
+            self.assertEqual(len(list(doc_index.all_layers())), 4)
+            self.assertEqual(doc_index.get_layers(self.main_df, 'rivers'), [self.main_lyrs[2]])
+
+        self.assertEqual(mock_ListDataFrames.call_count, 1)
+        self.assertEqual(mock_ListLayers.call_count, 2)
+
+    @mock.patch('mapactionpy_arcmap.doc_index.arcpy.mapping.ListDataFrames')
+    def test_missing_frame(self, mock_ListDataFrames):
+        mock_ListDataFrames.return_value = [self.main_df]
+        doc_index = DocumentIndex(None)
+
+        self.assertEqual(doc_index.get_frames('Location map'), [])
+        self.assertRaises(ValueError, doc_index.get_frame, 'Location map')
+
+    @mock.patch('mapactionpy_arcmap.doc_index.arcpy.mapping.ListDataFrames')
+    def test_frames_are_matched_as_by_list_data_frames(self, mock_ListDataFrames):
+        mock_ListDataFrames.return_value = [self.main_df, self.inset_df]
+        doc_index = DocumentIndex(None)
+
+        self.assertIs(doc_index.get_frame('MAIN MAP'), self.main_df)
+        self.assertEqual(doc_index.get_frames('*map'), [self.main_df, self.inset_df])
+        self.assertIs(doc_index.get_frame('*map'), self.inset_df)
+
+    def test_matches_wildcard(self):
+        self.assertTrue(matches_wildcard('Main map', ''))
+        self.assertTrue(matches_wildcard('Main map', 'main*'))
+        self.assertFalse(matches_wildcard('Main map', 'main'))
+        # Only `*` is a wildcard
+        self.assertTrue(matches_wildcard('Main map [inset]', 'main map [inset]'))
+        self.assertFalse(matches_wildcard('Main mop', 'Main m?p'))
+
+    @mock.patch('mapactionpy_arcmap.doc_index.arcpy.mapping.RemoveLayer')
+    @mock.patch('mapactionpy_arcmap.doc_index.arcpy.mapping.ListLayers')
+    @mock.patch('mapactionpy_arcmap.doc_index.arcpy.mapping.ListDataFrames')
+    def test_removing_a_group_layer_removes_its_sublayers(self, mock_ListDataFrames, mock_ListLayers,
+                                                          mock_RemoveLayer):
+        mock_ListDataFrames.return_value = [self.main_df, self.inset_df]
+        mock_ListLayers.side_effect = self._list_layers
+
+        doc_index = DocumentIndex(None)
+        doc_index.list_layers(self.main_df)
+        doc_index.remove_layer(self.main_df, self.group_lyr)
+
+        mock_RemoveLayer.assert_called_once_with(self.main_df, self.group_lyr)
+        self.assertEqual(doc_index.list_layers(self.main_df), [self.main_lyrs[2]])
+        self.assertFalse(doc_index.contains_layer(self.main_df, self.sub_lyr))
+
+    @mock.patch('mapactionpy_arcmap.doc_index.arcpy.mapping.ListLayers')
+    @mock.patch('mapactionpy_arcmap.doc_index.arcpy.mapping.ListDataFrames')
+    def test_adding_a_layer_relists_only_that_frame(self, mock_ListDataFrames, mock_ListLayers):
+        mock_ListDataFrames.return_value = [self.main_df, self.inset_df]
+        mock_ListLayers.side_effect = self._list_layers
+
+        doc_index = DocumentIndex(None)
+        list(doc_index.all_layers())
+        self.inset_lyrs.append(_make_lyr('airports'))
+        doc_index.note_layer_added(self.inset_df)
+
+        self.assertEqual(len(doc_index.list_layers(self.inset_df)), 2)
+        self.assertEqual(mock_ListLayers.call_count, 3)
+
+    @mock.patch('mapactionpy_arcmap.doc_index.arcpy.SpatialReference')
+    def test_spatial_references_are_cached(self, mock_SpatialReference):
+        doc_index = DocumentIndex(None)
+        sr1 = doc_index.get_spatial_reference(4326)
+        sr2 = doc_index.get_spatial_reference(4326)
+        doc_index.get_spatial_reference(3857)
+
+        self.assertIs(sr1, sr2)
+        self.assertEqual(mock_SpatialReference.call_count, 2)
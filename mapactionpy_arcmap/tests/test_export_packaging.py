@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+import zipfile
+from unittest import TestCase
+
+from mapactionpy_arcmap.change_detection import hash_file
+from mapactionpy_arcmap.export_packaging import StreamingPackage, get_package_path
+from mapactionpy_arcmap.export_profiles import DRAFT_PROFILE, get_export_profile
+
+
+class TestStreamingPackage(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.zip_path = os.path.join(self.tmp_dir, 'ma001-v01-example.zip')
+        self.f_paths = []
+        for fname, size in (('ma001-v01-example-300dpi.pdf', 5000), ('ma001-v01-example-300dpi.jpg', 3000),
+                            ('thumbnail.png', 100)):
+            f_path = os.path.join(self.tmp_dir, fname)
+            with open(f_path, 'wb') as f:
+                f.write(os.urandom(size))
+            self.f_paths.append(f_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_close_writes_every_file_with_checksums(self):
+        package = StreamingPackage(self.zip_path, buffer_size=1)
+        for f_path in self.f_paths:
+            self.assertTrue(package.add(f_path))
+        # The same name again is ignored
+        self.assertFalse(package.add(self.f_paths[0]))
+        entries = package.close()
+
+        self.assertFalse(os.path.exists(self.zip_path + '.part'))
+        with zipfile.ZipFile(self.zip_path) as zip_file:
+            self.assertIsNone(zip_file.testzip())
+            self.assertEqual(sorted(zip_file.namelist()), sorted(os.path.basename(f) for f in self.f_paths))
+
+        self.assertEqual([e['name'] for e in entries], [os.path.basename(f) for f in self.f_paths])
+        for entry, f_path in zip(entries, self.f_paths):
+            self.assertEqual(entry['size'], os.path.getsize(f_path))
+            self.assertEqual(entry['md5'], hash_file(f_path))
+
+    def test_failed_package_does_not_replace_existing_package(self):
+        with open(self.zip_path, 'wb') as f:
+            f.write(b'previous package')
+
+        package = StreamingPackage(self.zip_path)
+        package.add(self.f_paths[0])
+        package.add(os.path.join(self.tmp_dir, 'missing.pdf'))
+        package.add(self.f_paths[1])
+        self.assertRaises(IOError, package.close)
+
+        self.assertFalse(os.path.exists(self.zip_path + '.part'))
+        with open(self.zip_path, 'rb') as f:
+            self.assertEqual(f.read(), b'previous package')
+
+    def test_abort_removes_partial_package(self):
+        package = StreamingPackage(self.zip_path)
+        package.add(self.f_paths[0])
+        package.abort()
+        self.assertFalse(os.path.exists(self.zip_path))
+        self.assertFalse(os.path.exists(self.zip_path + '.part'))
+        self.assertFalse(package.add(self.f_paths[1]))
+
+
+class TestRunnerPackaging(TestCase):
+
+    def setUp(self):
+        # Imported here as it registers an arcpy stand-in if arcpy is not available
+        from mapactionpy_arcmap.tests import benchmarks, fake_arcpy
+
+        self.arcpy = fake_arcpy.ArcpyStandIn()
+        self.installed = fake_arcpy.installed(self.arcpy)
+        self.installed.__enter__()
+        self.fixture = benchmarks.BenchFixture(self.arcpy, num_layers=2, num_regions=3)
+        self.runner = self.fixture.create_runner()
+        self.recipe = self.fixture.new_recipe('export', with_atlas=True)
+        self.fixture.cook(self.recipe)
+
+    def tearDown(self):
+        self.fixture.close()
+        self.installed.__exit__(None, None, None)
+
+    def test_export_on_its_own_does_not_leave_a_package_open(self):
+        self.runner._do_export(self.recipe)
+
+        self.assertIsNone(self.runner._package)
+        self.assertFalse(os.path.exists(get_package_path(self.recipe) + '.part'))
+
+    def test_streamed_package_contains_each_file_once(self):
+        self.runner._open_package(self.recipe)
+        self.runner._do_export(self.recipe)
+        self.runner.zip_exported_files(self.recipe)
+
+        # The PDF, JPEG, thumbnail and three atlas pages
+        self.assertEqual(len(self.recipe.zip_file_contents), 6)
+        self.assertEqual(len(set(self.recipe.zip_file_contents)), 6)
+        with zipfile.ZipFile(get_package_path(self.recipe)) as zip_file:
+            self.assertEqual(sorted(zip_file.namelist()),
+                             sorted(os.path.basename(f) for f in self.recipe.zip_file_contents))
+
+    def test_draft_package_does_not_replace_the_product_package(self):
+        self.runner.export_settings = get_export_profile(DRAFT_PROFILE)
+        for stream_packaging in (True, False):
+            self.runner.stream_packaging = stream_packaging
+            self.recipe.zip_file_contents = []
+            self.runner._open_package(self.recipe)
+            self.runner._do_export(self.recipe)
+            self.runner.zip_exported_files(self.recipe)
+
+            self.assertFalse(os.path.exists(get_package_path(self.recipe)))
+            with zipfile.ZipFile(get_package_path(self.recipe, '-draft')) as zip_file:
+                self.assertEqual(len(zip_file.namelist()), 1)
+                self.assertTrue(zip_file.namelist()[0].endswith('-96dpi.pdf'))
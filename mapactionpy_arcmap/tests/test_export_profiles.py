@@ -0,0 +1,35 @@
+import six
+from unittest import TestCase
+
+from mapactionpy_arcmap import export_profiles
+
+# works differently for python 2.7 and python 3.x
+if six.PY2:
+    import mock  # noqa: F401
+else:
+    from unittest import mock  # noqa: F401
+
+
+class TestExportProfiles(TestCase):
+
+    def setUp(self):
+        self.hum_event = mock.Mock(default_pdf_res_dpi=300, default_jpeg_res_dpi=200)
+
+    def test_get_export_profile(self):
+        draft = export_profiles.get_export_profile('draft')
+        self.assertEqual(draft.formats, ('pdf',))
+        self.assertFalse(draft.include_atlas)
+        self.assertRaises(ValueError, export_profiles.get_export_profile, 'poster')
+
+    def test_print_profile_uses_the_event_resolutions(self):
+        print_profile = export_profiles.get_export_profile(export_profiles.DEFAULT_EXPORT_PROFILE)
+        self.assertEqual(export_profiles.get_resolutions(print_profile, self.hum_event), {'pdf': 300, 'jpeg': 200})
+        self.assertEqual(export_profiles.get_export_options(print_profile), {'pdf': {}, 'jpeg': {}})
+
+        draft = export_profiles.get_export_profile('draft')
+        self.assertEqual(export_profiles.get_resolutions(draft, self.hum_event), {'pdf': 96, 'jpeg': 96})
+
+    def test_export_options_are_copies(self):
+        web = export_profiles.get_export_profile('web')
+        export_profiles.get_export_options(web)['pdf']['image_quality'] = 'BEST'
+        self.assertEqual(web.pdf_options['image_quality'], 'BETTER')
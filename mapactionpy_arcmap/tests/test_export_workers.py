@@ -0,0 +1,91 @@
+import os
+import shutil
+import six
+import tempfile
+from unittest import TestCase
+from PIL import Image
+
+import mapactionpy_arcmap.export_workers as export_workers
+
+# works differently for python 2.7 and python 3.x
+if six.PY2:
+    import mock  # noqa: F401
+else:
+    from unittest import mock  # noqa: F401
+
+
+class _InProcessPool(object):
+    """
+    Stands in for multiprocessing.Pool, but completes the jobs in the reverse order.
+    """
+
+    def __init__(self, processes):
+        self.processes = processes
+
+    def map(self, func, jobs):
+        results = [func(job) for job in reversed(jobs)]
+        return list(reversed(results))
+
+    def close(self):
+        pass
+
+    def join(self):
+        pass
+
+
+def _fake_exporter(suffix):
+    def _export(arc_mxd, export_dir, core_file_name, dpi):
+        fname = '{}-{}dpi.{}'.format(core_file_name, dpi, suffix)
+        return export_dir + '/' + fname, {suffix + 'filename': fname}
+    return _export
+
+
+class TestExportWorkers(TestCase):
+
+    @mock.patch('mapactionpy_arcmap.export_workers.arcpy.mapping.MapDocument')
+    @mock.patch('mapactionpy_arcmap.export_workers.multiprocessing.Pool', new=_InProcessPool)
+    def test_results_are_returned_in_a_fixed_order(self, mock_MapDocument):
+        exporters = {
+            'pdf': _fake_exporter('pdf'),
+            'jpeg': _fake_exporter('jpg'),
+            'thumbnail': _fake_exporter('png')
+        }
+        with mock.patch.dict(export_workers.EXPORTERS, exporters):
+            results = export_workers.export_in_parallel(
+                '/maps/ma001-v01.mxd', '/exports', 'ma001-v01', {'pdf': 300, 'jpeg': 100})
+
+        self.assertEqual([r['format'] for r in results], ['pdf', 'jpeg', 'thumbnail'])
+        self.assertEqual(results[0]['path'], '/exports/ma001-v01-300dpi.pdf')
+        self.assertEqual(results[1]['metadata'], {'jpgfilename': 'ma001-v01-100dpi.jpg'})
+        self.assertEqual(mock_MapDocument.call_count, 3)
+
+    @mock.patch('mapactionpy_arcmap.export_workers.arcpy.mapping.MapDocument')
+    @mock.patch('mapactionpy_arcmap.export_workers.multiprocessing.Pool', new=_InProcessPool)
+    def test_only_the_rendered_formats_are_exported(self, mock_MapDocument):
+        exporters = {
+            'pdf': _fake_exporter('pdf'),
+            'jpeg': _fake_exporter('jpg'),
+            'thumbnail': _fake_exporter('png')
+        }
+        with mock.patch.dict(export_workers.EXPORTERS, exporters):
+            results = export_workers.export_in_parallel(
+                '/maps/ma001-v01.mxd', '/exports', 'ma001-v01', {'pdf': 300, 'jpeg': 100},
+                formats=export_workers.RENDERED_FORMATS)
+
+        self.assertEqual([r['format'] for r in results], ['pdf', 'jpeg'])
+        self.assertEqual(mock_MapDocument.call_count, 2)
+
+    @mock.patch('mapactionpy_arcmap.export_workers.arcpy.mapping.ExportToPNG')
+    def test_derive_png_thumbnail(self, mock_ExportToPNG):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            jpeg_path = os.path.join(tmp_dir, 'ma001-v01-100dpi.jpg')
+            Image.new('RGB', (1169, 827), (200, 100, 50)).save(jpeg_path, 'JPEG')
+            png_fpath, metadata = export_workers.derive_png_thumbnail(jpeg_path, tmp_dir)
+
+            self.assertEqual(png_fpath, os.path.join(tmp_dir, 'thumbnail.png'))
+            self.assertEqual(Image.open(png_fpath).size, (140, 99))
+            self.assertEqual(sorted(os.listdir(tmp_dir)), ['ma001-v01-100dpi.jpg', 'thumbnail.png'])
+            mock_ExportToPNG.assert_not_called()
+        finally:
+            shutil.rmtree(tmp_dir)
@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mapactionpy_arcmap.tests import fake_arcpy
+
+
+class TestFakeArcpy(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.mxd_path = os.path.join(self.tmp_dir, 'template.mxd')
+        self.arcpy = fake_arcpy.ArcpyStandIn()
+        self.arcpy.create_template(self.mxd_path, [('Main map', 27.0, 25.0)], ['title'], [('Legend', 'Main map')])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_saved_document_is_reopened(self):
+        lyr_path = os.path.join(self.tmp_dir, 'roads.lyr')
+        with open(lyr_path, 'w') as f:
+            f.write('layer file')
+
+        mxd = self.arcpy.MapDocument(self.mxd_path)
+        df = self.arcpy.ListDataFrames(mxd, 'Main map')[0]
+        self.arcpy.AddLayer(df, self.arcpy.Layer(lyr_path), 'TOP')
+        mxd.save()
+
+        reopened = self.arcpy.MapDocument(self.mxd_path)
+        self.assertEqual([lyr.name for lyr in self.arcpy.ListLayers(reopened)], ['roads'])
+        legend = self.arcpy.ListLayoutElements(reopened, 'LEGEND_ELEMENT')[0]
+        self.assertEqual([lyr.name for lyr in legend.listLegendItemLayers()], ['roads'])
+
+    def test_calls_are_counted(self):
+        self.arcpy.MapDocument(self.mxd_path)
+        self.arcpy.MapDocument(self.mxd_path)
+        self.assertEqual(self.arcpy.calls['open'], 2)
+        self.arcpy.reset_calls()
+        self.assertEqual(self.arcpy.calls['open'], 0)
+
+    def test_unknown_latency(self):
+        self.assertRaises(ValueError, self.arcpy.set_latencies, {'export_tiff': 0.1})
+
+    def test_installed_is_restored(self):
+        from mapactionpy_arcmap import layer_extents
+        original = layer_extents.arcpy
+        with fake_arcpy.installed(self.arcpy):
+            self.assertIs(layer_extents.arcpy, self.arcpy.module)
+        self.assertIs(layer_extents.arcpy, original)
@@ -0,0 +1,109 @@
+import copy
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+
+from mapactionpy_arcmap.layer_cache import LayerFileCache
+
+
+class FakeLayer(object):
+    def __init__(self, lyr_path):
+        self.lyr_path = lyr_path
+        self.visible = True
+
+
+class TestLayerFileCache(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.lyr_paths = []
+        for n in range(3):
+            lyr_path = os.path.join(self.tmp_dir, 'layer{}.lyr'.format(n))
+            with open(lyr_path, 'w') as lyr_file:
+                lyr_file.write('layer {}'.format(n))
+            self.lyr_paths.append(lyr_path)
+
+        self.parse_count = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _loader(self, lyr_path):
+        self.parse_count += 1
+        return FakeLayer(lyr_path)
+
+    def test_each_use_is_parsed_by_default(self):
+        cache = LayerFileCache(self._loader)
+        lyr1 = cache.get_layer(self.lyr_paths[0])
+        lyr2 = cache.get_layer(self.lyr_paths[0])
+
+        self.assertIsNot(lyr1, lyr2)
+        self.assertEqual(self.parse_count, 2)
+        # Nothing was saved, so nothing is reported as a hit
+        self.assertEqual(cache.hits, 0)
+        self.assertEqual(cache.misses, 2)
+        self.assertEqual(len(cache), 0)
+        self.assertFalse(cache.get_stats()['reuses_parsed_layers'])
+
+    def test_repeated_layers_are_only_parsed_once(self):
+        cache = LayerFileCache(self._loader, copier=copy.deepcopy)
+        for _ in range(5):
+            cache.get_layer(self.lyr_paths[0])
+
+        self.assertEqual(self.parse_count, 1)
+        self.assertEqual(cache.hits, 4)
+        self.assertEqual(cache.misses, 1)
+
+    def test_each_caller_gets_an_independent_copy(self):
+        cache = LayerFileCache(self._loader, copier=copy.deepcopy)
+        lyr1 = cache.get_layer(self.lyr_paths[0])
+        lyr1.visible = False
+        lyr2 = cache.get_layer(self.lyr_paths[0])
+
+        self.assertIsNot(lyr1, lyr2)
+        self.assertTrue(lyr2.visible)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = LayerFileCache(self._loader, max_size=2, copier=copy.deepcopy)
+        cache.get_layer(self.lyr_paths[0])
+        cache.get_layer(self.lyr_paths[1])
+        # Touch layer0 so that layer1 is the least recently used
+        cache.get_layer(self.lyr_paths[0])
+        cache.get_layer(self.lyr_paths[2])
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.evictions, 1)
+
+        cache.get_layer(self.lyr_paths[0])
+        self.assertEqual(self.parse_count, 3)
+        cache.get_layer(self.lyr_paths[1])
+        self.assertEqual(self.parse_count, 4)
+
+    def test_modified_layer_file_is_parsed_again(self):
+        cache = LayerFileCache(self._loader, copier=copy.deepcopy)
+        cache.get_layer(self.lyr_paths[0])
+
+        with open(self.lyr_paths[0], 'w') as lyr_file:
+            lyr_file.write('a modified layer file')
+        future = time.time() + 10
+        os.utime(self.lyr_paths[0], (future, future))
+
+        cache.get_layer(self.lyr_paths[0])
+        self.assertEqual(self.parse_count, 2)
+        self.assertEqual(len(cache), 1)
+
+    def test_uncopyable_layers_disable_the_cache(self):
+        def _bad_copier(lyr):
+            raise TypeError('cannot copy')
+
+        cache = LayerFileCache(self._loader, copier=_bad_copier)
+        lyr1 = cache.get_layer(self.lyr_paths[0])
+        lyr2 = cache.get_layer(self.lyr_paths[0])
+
+        self.assertIsNot(lyr1, lyr2)
+        # The first layer is not parsed twice
+        self.assertEqual(self.parse_count, 2)
+        self.assertEqual(cache.get_stats()['copy_failures'], 1)
+        self.assertEqual(cache.get_stats()['max_size'], 0)
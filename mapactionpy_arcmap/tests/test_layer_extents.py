@@ -0,0 +1,113 @@
+import json
+import os
+import shutil
+import six
+import tempfile
+from unittest import TestCase
+
+from mapactionpy_arcmap.change_detection import get_related_files
+from mapactionpy_arcmap.layer_extents import LayerExtentCache
+
+# works differently for python 2.7 and python 3.x
+if six.PY2:
+    import mock  # noqa: F401
+else:
+    from unittest import mock  # noqa: F401
+
+
+class _Obj(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+_NATIVE_JSON = '{"xmin":11.6,"ymin":-18.0,"xmax":24.1,"ymax":-4.4,"spatialReference":{"wkid":4326}}'
+_PROJECTED_JSON = '{"xmin":1291000,"ymin":-2035000,"xmax":2682000,"ymax":-490000,"spatialReference":{"wkid":3857}}'
+
+
+class TestLayerExtentCache(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.tmp_dir, 'layer-extents.json')
+        self.shp_path = os.path.join(self.tmp_dir, 'ago_admn_ad1_py_s1_gadm_pp.shp')
+        for ext in ('.shp', '.shx', '.dbf'):
+            with open(self.shp_path[:-4] + ext, 'w') as f:
+                f.write(ext)
+
+        extent = mock.Mock(JSON=_NATIVE_JSON)
+        extent.projectAs.return_value = mock.Mock(JSON=_PROJECTED_JSON)
+        self.describe = mock.patch('mapactionpy_arcmap.layer_extents.arcpy.Describe').start()
+        self.describe.return_value = mock.Mock(extent=extent)
+        mock.patch('mapactionpy_arcmap.layer_extents.arcpy.SpatialReference').start()
+
+    def tearDown(self):
+        mock.patch.stopall()
+        shutil.rmtree(self.tmp_dir)
+
+    def _make_layers(self):
+        return [_Obj(name='mainmap-admn-ad1-py-s1', data_source_path=self.shp_path),
+                _Obj(name='locationmap-admn-ad1-py-s1', data_source_path=self.shp_path)]
+
+    def test_extents_are_cached(self):
+        recipe_lyrs = self._make_layers()
+        cache = LayerExtentCache(self.cache_path)
+        cache.fill(recipe_lyrs)
+        self.assertEqual(recipe_lyrs[0].extent, json.loads(_NATIVE_JSON))
+        self.assertEqual(recipe_lyrs[1].extent, json.loads(_NATIVE_JSON))
+        self.assertEqual(self.describe.call_count, 1)
+        cache.save()
+
+        cache = LayerExtentCache(self.cache_path)
+        recipe_lyrs = self._make_layers()
+        cache.fill(recipe_lyrs)
+        self.assertEqual(recipe_lyrs[0].extent, json.loads(_NATIVE_JSON))
+        self.assertEqual(self.describe.call_count, 1)
+
+        cache.fill(recipe_lyrs, epsg=3857)
+        self.assertEqual(recipe_lyrs[0].extent, json.loads(_PROJECTED_JSON))
+        self.assertEqual(self.describe.call_count, 2)
+        self.assertEqual(cache.get_stats(), {'hits': 1, 'misses': 1, 'data_sources': 1})
+
+    def test_cache_is_only_written_by_save(self):
+        cache = LayerExtentCache(self.cache_path)
+        cache.fill(self._make_layers())
+        self.assertFalse(os.path.exists(self.cache_path))
+
+        cache.save()
+        os.utime(self.cache_path, (1000000000, 1000000000))
+        cache.fill(self._make_layers())
+        cache.save()
+        self.assertEqual(os.path.getmtime(self.cache_path), 1000000000)
+
+    def test_changed_data_source_is_described_again(self):
+        cache = LayerExtentCache(self.cache_path)
+        cache.fill(self._make_layers())
+        cache.save()
+        with open(self.shp_path, 'a') as f:
+            f.write('more features')
+
+        LayerExtentCache(self.cache_path).fill(self._make_layers())
+        self.assertEqual(self.describe.call_count, 2)
+
+    def test_failures_are_reported(self):
+        missing_lyr = _Obj(name='mainmap-tran-rds-ln-s1', data_source_path='/does/not/exist.shp')
+        recipe_lyrs = self._make_layers() + [missing_lyr]
+        self.describe.side_effect = lambda path: self.describe.return_value if path == self.shp_path else 1 / 0
+
+        self.assertRaises(ValueError, LayerExtentCache(self.cache_path).fill, recipe_lyrs)
+        self.assertEqual(recipe_lyrs[0].extent, json.loads(_NATIVE_JSON))
+        self.assertFalse(hasattr(missing_lyr, 'extent'))
+
+    def test_geodatabase_is_walked_once(self):
+        gdb_path = os.path.join(self.tmp_dir, 'ago.gdb')
+        os.mkdir(gdb_path)
+        with open(os.path.join(gdb_path, 'a00000001.gdbtable'), 'w') as f:
+            f.write('table')
+        data_source_paths = [os.path.join(gdb_path, 'ago_admn_ad1_py_s1_gadm_pp'),
+                             os.path.join(gdb_path, 'ago_tran_rds_ln_s1_osm_pp')]
+
+        with mock.patch('mapactionpy_arcmap.layer_extents.get_related_files',
+                        side_effect=get_related_files) as mock_related:
+            extents, errors = LayerExtentCache(self.cache_path).get_extents(data_source_paths)
+        self.assertEqual(sorted(extents), sorted(data_source_paths))
+        self.assertEqual(mock_related.call_count, 1)
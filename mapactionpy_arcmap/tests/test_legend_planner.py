@@ -0,0 +1,66 @@
+import six
+from unittest import TestCase
+
+from mapactionpy_arcmap.legend_planner import LegendPlan, EXCLUDED_BY_RECIPE, DUPLICATE_NAME
+
+# works differently for python 2.7 and python 3.x
+if six.PY2:
+    import mock  # noqa: F401
+else:
+    from unittest import mock  # noqa: F401
+
+
+def _make_named(name):
+    obj = mock.Mock(name=name)
+    obj.name = name
+    return obj
+
+
+def _make_recipe_lyr(name, add_to_legend):
+    recipe_lyr = _make_named(name)
+    recipe_lyr.add_to_legend = add_to_legend
+    return recipe_lyr
+
+
+class TestLegendPlan(TestCase):
+
+    def setUp(self):
+        recipe_frame = mock.Mock()
+        recipe_frame.layers = [
+            _make_recipe_lyr('mainmap-stle-stl-pt-s0-allmaps', True),
+            _make_recipe_lyr('mainmap-elev-hsh-ras-s2-allmaps', False),
+            _make_recipe_lyr('mainmap-tran-rds-ln-s0-allmaps', True)
+        ]
+        self.recipe = mock.Mock()
+        self.recipe.map_frames = [recipe_frame]
+
+    def _make_legend(self, name, item_names):
+        legend = _make_named(name)
+        legend.listLegendItemLayers.return_value = [_make_named(n) for n in item_names]
+        return legend
+
+    def test_plan_is_created_from_the_recipe(self):
+        plan = LegendPlan.from_recipe(self.recipe)
+        self.assertEqual(plan.excluded_names, set(['mainmap-elev-hsh-ras-s2-allmaps']))
+
+    def test_apply(self):
+        plan = LegendPlan.from_recipe(self.recipe)
+        plan.note_layer_added(self.recipe.map_frames[0].layers[1], 'Hillshade')
+        legend = self._make_legend('Legend', [
+            'mainmap-stle-stl-pt-s0-allmaps', 'Hillshade', 'mainmap-tran-rds-ln-s0-allmaps',
+            'mainmap-stle-stl-pt-s0-allmaps'])
+
+        removed = plan.apply([legend])
+
+        self.assertEqual([(item['layer'], item['reason']) for item in removed], [
+            ('Hillshade', EXCLUDED_BY_RECIPE),
+            ('mainmap-stle-stl-pt-s0-allmaps', DUPLICATE_NAME)
+        ])
+        self.assertEqual(legend.removeItem.call_count, 2)
+        self.assertEqual(plan.get_report()['removed'], removed)
+
+    def test_duplicates_are_only_checked_within_a_legend(self):
+        plan = LegendPlan()
+        legends = [self._make_legend('Legend', ['roads']), self._make_legend('Inset legend', ['roads'])]
+
+        self.assertEqual(plan.apply(legends), [])
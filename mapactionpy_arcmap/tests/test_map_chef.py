@@ -1,8 +1,9 @@
 import arcpy
 import os
+import six
 # import unittest
 from unittest import TestCase, skip
-from mapactionpy_arcmap.map_chef import MapChef
+from mapactionpy_arcmap.map_chef import IncrementalCookError, MapChef
 from mapactionpy_controller.crash_move_folder import CrashMoveFolder
 from mapactionpy_controller.map_cookbook import MapCookbook
 from mapactionpy_controller.event import Event
@@ -11,6 +12,12 @@ from mapactionpy_controller.map_recipe import MapRecipe
 
 import fixtures
 
+# works differently for python 2.7 and python 3.x
+if six.PY2:
+    import mock  # noqa: F401
+else:
+    from unittest import mock  # noqa: F401
+
 
 class TestMapChef(TestCase):
 
@@ -54,6 +61,38 @@ class TestMapChef(TestCase):
         mc.cook(test_recipe)
         self.assertTrue(True)
 
+    def test_map_chef_cook_saves_once(self):
+        my_mxd = arcpy.mapping.MapDocument(self.my_mxd_fpath)
+
+        mc = MapChef(
+            my_mxd,
+            self.cmf,
+            self.event
+        )
+
+        test_recipe = MapRecipe(fixtures.fixture_recipe_processed_by_controller, self.layer_props)
+        mc.cook(test_recipe)
+        self.assertEqual(mc.save_count, 1)
+        self.assertEqual(mc.get_run_report()['mxd_saves'], 1)
+
+    def test_map_chef_export_handoff(self):
+        my_mxd = arcpy.mapping.MapDocument(self.my_mxd_fpath)
+
+        mc = MapChef(
+            my_mxd,
+            self.cmf,
+            self.event
+        )
+
+        test_recipe = MapRecipe(fixtures.fixture_recipe_processed_by_controller, self.layer_props)
+        mc.cook(test_recipe)
+        handoff = mc.get_export_handoff(test_recipe)
+        self.assertIs(handoff.mxd, my_mxd)
+        self.assertEqual(handoff.map_project_path, my_mxd.filePath)
+        self.assertEqual(len(handoff.extent), 4)
+        self.assertTrue(handoff.scale.startswith('1: '))
+        self.assertEqual(handoff.added_layers, mc.added_layers)
+
     def test_apply_frame_crs_and_extent(self):
         """
         Because the test can't assume what starting extent the mxd is, the test applies to different
@@ -133,3 +172,25 @@ class TestMapChef(TestCase):
         # feature count with DQ
 
         self.fail()
+
+
+class TestMapChefUpdateLayer(TestCase):
+
+    def setUp(self):
+        self.chef = MapChef(mock.Mock(name='mxd'), None, None, layer_cache=mock.Mock(name='layer_cache'))
+        self.recipe_lyr = mock.Mock(name='recipe_lyr', data_source_path='/data/ago_tran_rds_ln_s1_osm_pp.shp',
+                                    data_name='ago_tran_rds_ln_s1_osm_pp', success=None)
+        self.recipe_lyr.name = 'mainmap-tran-rds-ln-s1-allmaps'
+
+    def test_failed_update_requires_a_full_cook(self):
+        arc_lyr = mock.Mock(name='arc_lyr')
+        arc_lyr.replaceDataSource.side_effect = ValueError('Unable to find the data source')
+
+        self.assertRaises(IncrementalCookError, self.chef.update_layer, arc_lyr, self.recipe_lyr,
+                          ['data_source_path'])
+        self.assertIsNone(self.recipe_lyr.success)
+
+    def test_unsupported_data_source_requires_a_full_cook(self):
+        self.recipe_lyr.data_source_path = '/data/ago_tran_rds_ln_s1_osm_pp.unknown'
+        self.assertRaises(IncrementalCookError, self.chef.update_layer, mock.Mock(name='arc_lyr'), self.recipe_lyr,
+                          ['data_source_path'])
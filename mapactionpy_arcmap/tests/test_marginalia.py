@@ -0,0 +1,106 @@
+import os
+import six
+from datetime import datetime
+from unittest import TestCase
+
+from mapactionpy_arcmap.marginalia import MarginaliaContext, MarginaliaRenderer, ATLAS_PAGE_HANDLERS, create_context
+
+# works differently for python 2.7 and python 3.x
+if six.PY2:
+    import mock  # noqa: F401
+else:
+    from unittest import mock  # noqa: F401
+
+
+def _make_elm(name, text=''):
+    elm = mock.Mock(name=name)
+    elm.name = name
+    elm.text = text
+    return elm
+
+
+class TestMarginalia(TestCase):
+
+    def setUp(self):
+        self.recipe = mock.Mock(name='recipe')
+        self.recipe.product = 'Atlantis: Overview Map'
+        self.recipe.summary = 'Overview of Atlantis'
+        self.recipe.mapnumber = 'MA001'
+        self.recipe.category = 'Reference'
+        self.recipe.version_num = 3
+        self.recipe.creation_time_stamp = datetime(2020, 3, 6, 12, 30)
+
+        self.event = mock.Mock(name='event')
+        self.event.country_name = 'Atlantis'
+        self.event.glide_number = None
+        self.event.default_donor_credits = 'Kind donors'
+        self.event.default_disclaimer_text = 'Test only'
+        self.event.default_source_organisation = 'MapAction'
+        self.event.deployment_primary_email = 'test@mapaction.org'
+        self.event.default_source_organisation_url = 'mapaction.org'
+
+        self.scale_calls = []
+
+    def _scale(self):
+        self.scale_calls.append(1)
+        return '1: 250,000 (At A3)'
+
+    def _context(self):
+        return create_context(self.recipe, self.event, '/maps/ma001-v03.mxd', ['OSM', 'GADM'],
+                              scale=self._scale, datum='WGS 1984')
+
+    def test_default_handlers(self):
+        elms = [_make_elm(name) for name in (
+            'title', 'map_version', 'create_date_time', 'mxd_name', 'scale', 'spatial_reference',
+            'data_sources', 'map_producer', 'not_a_marginalia_element')]
+
+        MarginaliaRenderer().render(elms, self._context())
+        texts = dict((elm.name, elm.text) for elm in elms)
+
+        self.assertEqual(texts['title'], 'Atlantis: Overview Map')
+        self.assertEqual(texts['map_version'], 'v03')
+        self.assertEqual(texts['create_date_time'], '06-Mar-2020 12:30')
+        self.assertEqual(texts['mxd_name'], 'ma001-v03.mxd')
+        self.assertEqual(texts['scale'], '1: 250,000 (At A3)')
+        self.assertEqual(texts['spatial_reference'], 'WGS 1984')
+        self.assertEqual(texts['data_sources'], '<BOL>Data Sources:</BOL>' + os.linesep * 2 + 'OSM, GADM')
+        self.assertEqual(texts['map_producer'],
+                         'Produced by MapAction' + os.linesep + 'test@mapaction.org' + os.linesep + 'mapaction.org')
+        self.assertEqual(texts['not_a_marginalia_element'], '')
+
+    def test_unchanged_elements_are_not_written(self):
+        elms = [_make_elm('title', 'Atlantis: Overview Map'), _make_elm('summary', 'old summary')]
+        updated = MarginaliaRenderer().render(elms, self._context())
+        self.assertEqual(updated, ['summary'])
+
+    def test_missing_glide_number_leaves_element_unchanged(self):
+        elms = [_make_elm('glide_no', 'template text')]
+        MarginaliaRenderer().render(elms, self._context())
+        self.assertEqual(elms[0].text, 'template text')
+
+    def test_lazy_values_are_only_calculated_when_needed(self):
+        renderer = MarginaliaRenderer()
+        context = self._context()
+        renderer.render([_make_elm('title')], context)
+        self.assertEqual(self.scale_calls, [])
+
+        renderer.render([_make_elm('scale'), _make_elm('scale')], context)
+        self.assertEqual(len(self.scale_calls), 1)
+
+    def test_user_defined_handler(self):
+        renderer = MarginaliaRenderer()
+        renderer.register('operation_id', lambda ctx: ctx['recipe'].mapnumber + '-op')
+        elms = [_make_elm('operation_id')]
+        renderer.render(elms, self._context())
+        self.assertEqual(elms[0].text, 'MA001-op')
+
+    def test_atlas_page_handlers(self):
+        renderer = MarginaliaRenderer(ATLAS_PAGE_HANDLERS, include_defaults=False)
+        base_context = MarginaliaContext(recipe=self.recipe, event=self.event)
+        elms = [_make_elm('title'), _make_elm('map_no'), _make_elm('summary')]
+
+        renderer.render(elms, base_context.derive(region='North Coast'))
+
+        self.assertEqual(elms[0].text, "Reference map of Atlantis\n<CLR red = '255'>Sheet - North Coast</CLR>")
+        self.assertEqual(elms[1].text, 'MA001_Sheet_North_Coast')
+        self.assertEqual(elms[2].text, '')
@@ -0,0 +1,99 @@
+import os
+import shutil
+import six
+import tempfile
+from unittest import TestCase
+
+from mapactionpy_arcmap.dataset_types import get_default_resolver, resolve_recipe
+from mapactionpy_arcmap.preflight import run_preflight, PreflightError
+
+# works differently for python 2.7 and python 3.x
+if six.PY2:
+    import mock  # noqa: F401
+else:
+    from unittest import mock  # noqa: F401
+
+
+class TestPreflight(TestCase):
+
+    def setUp(self):
+        self.test_data = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'test_data')
+        self.valid_lyr = os.path.join(self.test_data, 'mainmap_tran_por_pt_s0_allmaps.lyr')
+        self.tmp_dir = tempfile.mkdtemp()
+
+        self.valid_shp = os.path.join(self.tmp_dir, 'ago_tran_por_pt_s0_ourairports_pp.shp')
+        for ext in ('.shp', '.shx', '.dbf'):
+            with open(self.valid_shp[:-4] + ext, 'w') as f:
+                f.write('')
+
+        self.not_a_lyr = os.path.join(self.tmp_dir, 'not_a_layer.lyr')
+        with open(self.not_a_lyr, 'w') as f:
+            f.write('text')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _make_recipe(self, product, layers):
+        recipe_frame = mock.Mock()
+        recipe_frame.name = 'Main map'
+        recipe_frame.layers = []
+        for name, lyr_path, data_source_path in layers:
+            lyr = mock.Mock(spec=['name', 'layer_file_path', 'data_source_path'])
+            lyr.name = name
+            lyr.layer_file_path = lyr_path
+            if data_source_path is None:
+                del lyr.data_source_path
+            else:
+                lyr.data_source_path = data_source_path
+            recipe_frame.layers.append(lyr)
+
+        recipe = mock.Mock()
+        recipe.product = product
+        recipe.map_frames = [recipe_frame]
+        return recipe
+
+    def test_valid_recipe(self):
+        recipe = self._make_recipe('Airports', [('airports', self.valid_lyr, self.valid_shp)])
+        report = run_preflight([recipe])[0]
+
+        self.assertTrue(report.is_ok())
+        self.assertEqual(report.issues, [])
+        report.raise_for_fatal()
+
+    def test_problems_are_reported_per_recipe(self):
+        missing_shp = os.path.join(self.tmp_dir, 'missing.shp')
+        recipes = [
+            self._make_recipe('Airports', [('airports', self.valid_lyr, self.valid_shp)]),
+            self._make_recipe('Broken', [
+                ('missing_lyr', os.path.join(self.tmp_dir, 'missing.lyr'), self.valid_shp),
+                ('bad_lyr', self.not_a_lyr, self.valid_shp),
+                ('missing_data', self.valid_lyr, missing_shp),
+                ('unsupported', self.valid_lyr, os.path.join(self.tmp_dir, 'readme.pdf')),
+                ('not_located', self.valid_lyr, None)
+            ])
+        ]
+
+        reports = run_preflight(recipes, num_threads=2)
+
+        self.assertTrue(reports[0].is_ok())
+        self.assertFalse(reports[1].is_ok())
+        self.assertEqual([issue.layer for issue in reports[1].get_fatal_issues()],
+                         ['missing_lyr', 'bad_lyr', 'missing_data', 'unsupported'])
+        self.assertEqual(len(reports[1].issues), 5)
+        self.assertRaises(PreflightError, reports[1].raise_for_fatal)
+
+    def test_shapefile_sidecars(self):
+        os.remove(self.valid_shp[:-4] + '.shx')
+        recipe = self._make_recipe('Airports', [('airports', self.valid_lyr, self.valid_shp)])
+        report = run_preflight([recipe])[0]
+
+        self.assertFalse(report.is_ok())
+        self.assertIn('.shx', report.issues[0].message)
+
+    def test_dataset_types_are_shared_with_the_cook(self):
+        recipe = self._make_recipe('Airports', [('airports', self.valid_lyr, self.valid_shp)])
+        run_preflight([recipe])
+
+        with mock.patch.object(get_default_resolver(), '_lookup') as mock_lookup:
+            resolve_recipe(recipe)
+        self.assertEqual(mock_lookup.call_count, 0)
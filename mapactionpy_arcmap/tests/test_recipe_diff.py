@@ -0,0 +1,101 @@
+import copy
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mapactionpy_arcmap.recipe_diff import RecipeDiff, load_recipe_json
+
+
+class _Obj(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def _make_layer(name, **kwargs):
+    lyr_def = {
+        'name': name,
+        'layer_file_path': '/lyrs/{}.lyr'.format(name),
+        'data_source_path': '/data/{}.shp'.format(name),
+        'data_name': name,
+        'definition_query': '',
+        'label_classes': [],
+        'add_to_legend': True,
+        'visible': True
+    }
+    lyr_def.update(kwargs)
+    return lyr_def
+
+
+class TestRecipeDiff(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.previous = {
+            'py/object': 'mapactionpy_controller.map_recipe.MapRecipe',
+            'template_path': '/templates/arcgis_10_6_reference_landscape_bottom.mxd',
+            'map_frames': [{
+                'name': 'Main map',
+                'crs': 'EPSG:4326',
+                'extent': {'py/tuple': [1, 2, 3, 4]},
+                'layers': [_make_layer('settlements'), _make_layer('roads'), _make_layer('rivers')]
+            }]
+        }
+        # 'rivers' did not have a data source located in the previous version
+        del self.previous['map_frames'][0]['layers'][2]['data_source_path']
+        self.added_layers = {'Main map': [['settlements', 'Settlements'], ['roads', 'Roads']]}
+
+        recipe_path = os.path.join(self.tmp_dir, 'ma001-v01-example.json')
+        with open(recipe_path, 'w') as f:
+            json.dump(self.previous, f)
+        self.previous = load_recipe_json(recipe_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _make_current(self, layer_overrides=None, **frame_overrides):
+        frame_def = copy.deepcopy(self.previous['map_frames'][0])
+        frame_def.update(frame_overrides)
+        layers = []
+        for lyr_def in frame_def.pop('layers'):
+            lyr_def.update((layer_overrides or {}).get(lyr_def['name'], {}))
+            lyr_def.setdefault('data_source_path', None)
+            lyr_def['label_classes'] = [_Obj(**lbl) for lbl in lyr_def['label_classes']]
+            layers.append(_Obj(**lyr_def))
+
+        return _Obj(template_path=self.previous['template_path'],
+                    map_frames=[_Obj(layers=layers, **frame_def)])
+
+    def test_unchanged_recipe(self):
+        diff = RecipeDiff(self.previous, self._make_current(), self.added_layers)
+        self.assertTrue(diff.is_safe())
+        self.assertFalse(diff.has_changes())
+
+    def test_in_place_changes(self):
+        current = self._make_current(
+            {'roads': {'definition_query': '"TYPE" = \'primary\'', 'data_source_path': '/data/roads_v2.shp'}},
+            extent=[1, 2, 3, 5])
+        diff = RecipeDiff(self.previous, current, self.added_layers)
+
+        self.assertTrue(diff.is_safe())
+        self.assertEqual([f.name for f in diff.changed_frames], ['Main map'])
+        self.assertEqual(len(diff.changed_layers), 1)
+        change = diff.changed_layers[0]
+        self.assertEqual((change.position, change.arc_lyr_name), (1, 'Roads'))
+        self.assertEqual(change.fields, ['data_source_path', 'definition_query'])
+
+    def test_changes_which_require_a_full_cook(self):
+        unsafe_changes = [
+            {'roads': {'layer_file_path': '/lyrs/roads-v2.lyr'}},
+            {'roads': {'add_to_legend': False}},
+            # A data source has been found for a layer which was not previously added
+            {'rivers': {'data_source_path': '/data/rivers.shp'}}
+        ]
+        for layer_overrides in unsafe_changes:
+            diff = RecipeDiff(self.previous, self._make_current(layer_overrides), self.added_layers)
+            self.assertFalse(diff.is_safe(), layer_overrides)
+
+        current = self._make_current()
+        current.template_path = '/templates/arcgis_10_6_reference_portrait_bottom.mxd'
+        self.assertFalse(RecipeDiff(self.previous, current, self.added_layers).is_safe())
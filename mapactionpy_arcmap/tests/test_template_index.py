@@ -0,0 +1,105 @@
+import os
+import shutil
+import six
+import tempfile
+from unittest import TestCase
+
+from mapactionpy_arcmap.template_index import TemplateIndex, check_template, get_frames
+
+# works differently for python 2.7 and python 3.x
+if six.PY2:
+    import mock  # noqa: F401
+else:
+    from unittest import mock  # noqa: F401
+
+
+def _make_frame(name, width, height):
+    arc_df = mock.Mock(name=name)
+    arc_df.name = name
+    arc_df.elementWidth = width
+    arc_df.elementHeight = height
+    arc_df.spatialReference = mock.Mock(factoryCode=4326, name='GCS_WGS_1984')
+    arc_df.spatialReference.name = 'GCS_WGS_1984'
+    return arc_df
+
+
+def _make_element(name):
+    elm = mock.Mock(name=name)
+    elm.name = name
+    return elm
+
+
+class _Obj(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class TestTemplateIndex(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.tmp_dir, 'template-index.json')
+        self.templates = []
+        for name in ('arcgis_10_6_reference_landscape_bottom.mxd', 'arcgis_10_6_reference_portrait_bottom.mxd'):
+            self.templates.append(os.path.join(self.tmp_dir, name))
+            with open(self.templates[-1], 'w') as f:
+                f.write(name)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    @mock.patch('mapactionpy_arcmap.template_index.arcpy.mapping.MapDocument')
+    @mock.patch('mapactionpy_arcmap.template_index.arcpy.mapping.ListDataFrames')
+    def test_templates_are_only_read_once(self, mock_ListDataFrames, mock_MapDocument):
+        mock_ListDataFrames.return_value = [_make_frame('Main map', 277, 190), _make_frame('Location map', 60, 40)]
+
+        index = TemplateIndex(self.index_path)
+        entries = index.get_entries(self.templates + ['/does/not/exist.mxd'])
+        self.assertEqual(sorted(entries), sorted(self.templates))
+        self.assertEqual(mock_MapDocument.call_count, 2)
+
+        # A new index, reading the same file
+        index = TemplateIndex(self.index_path)
+        entry = index.get_entries(self.templates)[self.templates[0]]
+        self.assertEqual(mock_MapDocument.call_count, 2)
+        self.assertEqual(index.get_stats()['hits'], 2)
+        self.assertEqual([df['name'] for df in get_frames(entry, 'main MAP')], ['Main map'])
+        self.assertEqual(entry['data_frames'][0]['crs'], {'factory_code': 4326, 'name': 'GCS_WGS_1984'})
+
+        # A template which has changed is read again
+        with open(self.templates[1], 'a') as f:
+            f.write('v2')
+        index.get_entries(self.templates)
+        self.assertEqual(mock_MapDocument.call_count, 3)
+
+    @mock.patch('mapactionpy_arcmap.template_index.arcpy.mapping.MapDocument')
+    @mock.patch('mapactionpy_arcmap.template_index.arcpy.mapping.ListDataFrames')
+    @mock.patch('mapactionpy_arcmap.template_index.arcpy.mapping.ListLayoutElements')
+    def test_scan_and_check_template(self, mock_ListLayoutElements, mock_ListDataFrames, mock_MapDocument):
+        mock_ListDataFrames.return_value = [_make_frame('Main map', 277, 190), _make_frame('Location map', 60, 40)]
+        elements = {
+            'TEXT_ELEMENT': [_make_element('title'), _make_element('summary')],
+            'LEGEND_ELEMENT': [_make_element('Legend')],
+            'MAPSURROUND_ELEMENT': [_make_element('Scale Bar')]
+        }
+        mock_ListLayoutElements.side_effect = lambda mxd, element_type: elements[element_type]
+
+        index = TemplateIndex(self.index_path)
+        entries = index.scan(self.tmp_dir)
+        self.assertEqual(sorted(entries), sorted(self.templates))
+        entry = entries[self.templates[0]]
+        self.assertEqual(entry['text_elements'], ['title', 'summary'])
+        self.assertEqual(entry['map_surround_elements'], ['Scale Bar'])
+
+        recipe = _Obj(principal_map_frame='Main map', map_frames=[_Obj(name='Main map'), _Obj(name='Location map')])
+        self.assertEqual(check_template(entry, recipe), [])
+        recipe = _Obj(principal_map_frame='Main Map 1', map_frames=[_Obj(name='Main Map 1'), _Obj(name='Inset')])
+        self.assertEqual(len(check_template(entry, recipe)), 2)
+        # Frame names are matched as by `DocumentIndex.get_frame`
+        recipe = _Obj(principal_map_frame='MAIN MAP', map_frames=[_Obj(name='MAIN MAP'), _Obj(name='location MAP')])
+        self.assertEqual(check_template(entry, recipe), [])
+
+        # Templates which have been deleted are removed from the index
+        os.remove(self.templates[1])
+        self.assertEqual(list(TemplateIndex(self.index_path).scan(self.tmp_dir)), [self.templates[0]])
+        self.assertEqual(TemplateIndex(self.index_path).get_stats()['templates'], 1)
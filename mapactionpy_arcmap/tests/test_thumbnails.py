@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from PIL import Image
+
+from mapactionpy_arcmap import thumbnails
+
+
+class TestThumbnails(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.product_dir = os.path.join(self.tmp_dir, 'MA001', 'v01')
+        os.makedirs(self.product_dir)
+        # An A4 landscape page at 96 dpi
+        self.jpeg_path = os.path.join(self.product_dir, 'ma001-v01-example-300dpi.jpg')
+        Image.new('RGB', (1123, 794), (200, 100, 50)).save(self.jpeg_path, 'JPEG')
+        self.png_path = os.path.join(self.product_dir, thumbnails.THUMBNAIL_FNAME)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_save_thumbnail(self):
+        thumbnails.save_thumbnail(self.jpeg_path, self.png_path)
+        img = Image.open(self.png_path)
+        self.assertEqual((img.format, img.size), ('PNG', (140, 99)))
+        self.assertTrue(thumbnails.is_up_to_date(self.jpeg_path, self.png_path))
+
+    def test_thumbnails_from_a_previous_spec_are_not_up_to_date(self):
+        Image.new('RGB', (140, 99)).save(self.png_path, 'PNG')
+        self.assertFalse(thumbnails.is_up_to_date(self.jpeg_path, self.png_path))
+
+        # A newer JPEG
+        thumbnails.save_thumbnail(self.jpeg_path, self.png_path)
+        os.utime(self.jpeg_path, (os.path.getmtime(self.png_path) + 10,) * 2)
+        self.assertFalse(thumbnails.is_up_to_date(self.jpeg_path, self.png_path))
+
+    def test_find_thumbnail_jobs(self):
+        open(os.path.join(self.product_dir, 'ma001-v01-example-300dpi.pdf'), 'w').close()
+        os.makedirs(os.path.join(self.tmp_dir, 'MA002', 'v01'))
+        self.assertEqual(thumbnails.find_thumbnail_jobs(self.tmp_dir), [(self.jpeg_path, self.png_path)])
+
+    def test_regenerate_thumbnail(self):
+        result = thumbnails.regenerate_thumbnail((self.jpeg_path, self.png_path, False))
+        self.assertEqual(result['status'], 'created')
+        result = thumbnails.regenerate_thumbnail((self.jpeg_path, self.png_path, False))
+        self.assertEqual(result['status'], 'skipped')
+        result = thumbnails.regenerate_thumbnail((self.jpeg_path, self.png_path, True))
+        self.assertEqual(result['status'], 'created')
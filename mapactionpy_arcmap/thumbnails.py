@@ -0,0 +1,178 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import traceback
+from timeit import default_timer
+from PIL import Image, PngImagePlugin
+from resizeimage import resizeimage
+
+# This module does not use arcpy, so that thumbnails can be regenerated on a machine without ArcMap.
+
+THUMBNAIL_SIZE = [140, 99]
+THUMBNAIL_FNAME = 'thumbnail.png'
+# Stored in each thumbnail, so that thumbnails made to a previous spec can be identified. Change this
+# whenever the way in which thumbnails are made changes.
+THUMBNAIL_SPEC_KEY = 'mapaction-thumbnail-spec'
+THUMBNAIL_SPEC = 'thumbnail-{}x{}'.format(*THUMBNAIL_SIZE)
+
+# Matches the JPEGs produced by `export_workers.export_jpeg`
+_EXPORTED_JPEG_REGEX = re.compile(r'-\d+dpi\.jpe?g$', re.IGNORECASE)
+
+
+def save_thumbnail(src_path, png_fpath):
+    """
+    Makes a thumbnail of the image at `src_path`, no larger than `THUMBNAIL_SIZE` and with the same aspect
+    ratio, and saves it as a PNG at `png_fpath`.
+
+    For a JPEG source the image is decoded at a reduced scale (using `Image.draft`), which is much quicker
+    than decoding it at full size.
+    """
+    with open(src_path, 'rb') as fd_img:
+        img = Image.open(fd_img)
+        # This has no effect for formats other than JPEG
+        img.draft('RGB', tuple(THUMBNAIL_SIZE))
+        img = resizeimage.resize('thumbnail', img, THUMBNAIL_SIZE)
+
+    pnginfo = PngImagePlugin.PngInfo()
+    pnginfo.add_text(THUMBNAIL_SPEC_KEY, THUMBNAIL_SPEC)
+    img.save(png_fpath, 'PNG', pnginfo=pnginfo)
+
+
+def is_up_to_date(src_path, png_fpath):
+    """
+    @returns: True if the thumbnail at `png_fpath` is newer than `src_path` and was made to the current
+              `THUMBNAIL_SPEC`.
+    """
+    if not os.path.exists(png_fpath) or os.path.getmtime(png_fpath) < os.path.getmtime(src_path):
+        return False
+
+    try:
+        # Only the header of the PNG is read
+        with open(png_fpath, 'rb') as png_file:
+            return Image.open(png_file).info.get(THUMBNAIL_SPEC_KEY) == THUMBNAIL_SPEC
+    except IOError:
+        return False
+
+
+def find_thumbnail_jobs(export_root):
+    """
+    Walks `export_root` for directories containing an exported JPEG.
+
+    @returns: A list of tuples of (JPEG path, thumbnail path). Where a directory contains more than one
+              exported JPEG, the most recently modified one is used.
+    """
+    jobs = []
+    for dir_path, dir_names, file_names in os.walk(export_root):
+        dir_names.sort()
+        jpegs = [os.path.join(dir_path, f) for f in file_names if _EXPORTED_JPEG_REGEX.search(f)]
+        if not jpegs:
+            continue
+
+        if len(jpegs) > 1:
+            logging.warning('{} contains {} exported JPEGs. Using the most recent.'.format(dir_path, len(jpegs)))
+
+        src_path = max(jpegs, key=os.path.getmtime)
+        jobs.append((src_path, os.path.join(dir_path, THUMBNAIL_FNAME)))
+
+    return jobs
+
+
+def regenerate_thumbnail(job):
+    """
+    @param job: A tuple of (source image path, thumbnail path, force).
+    @returns: A dict with the keys `src_path`, `png_fpath`, `status` ('created', 'skipped' or 'failed'),
+              `seconds` and `error`.
+    """
+    src_path, png_fpath, force = job
+    start = default_timer()
+    status = 'skipped'
+    error = None
+    try:
+        if force or not is_up_to_date(src_path, png_fpath):
+            save_thumbnail(src_path, png_fpath)
+            status = 'created'
+    except Exception:
+        status = 'failed'
+        error = traceback.format_exc()
+
+    return {
+        'src_path': src_path,
+        'png_fpath': png_fpath,
+        'status': status,
+        'seconds': default_timer() - start,
+        'error': error
+    }
+
+
+def regenerate_thumbnails(export_root, processes=None, force=False):
+    """
+    Regenerates the thumbnail for every product exported under `export_root`, from the JPEGs which are
+    already on disk, using a pool of worker processes. Thumbnails which are already up to date (see
+    `is_up_to_date`) are skipped unless `force` is True.
+
+    @param processes: The number of worker processes. Defaults to the number of CPUs.
+    @returns: A dict summarising the run.
+    """
+    start = default_timer()
+    jobs = [(src_path, png_fpath, force) for src_path, png_fpath in find_thumbnail_jobs(export_root)]
+
+    results = []
+    if jobs:
+        pool = multiprocessing.Pool(processes=processes)
+        try:
+            for result in pool.imap_unordered(regenerate_thumbnail, jobs, chunksize=8):
+                if result['error']:
+                    logging.error('Failed to make a thumbnail of {}.\n{}'.format(result['src_path'], result['error']))
+                results.append(result)
+        finally:
+            pool.close()
+            pool.join()
+
+    seconds = default_timer() - start
+    created = len([r for r in results if r['status'] == 'created'])
+    report = {
+        'products': len(jobs),
+        'created': created,
+        'skipped': len([r for r in results if r['status'] == 'skipped']),
+        'failed': sorted(r['src_path'] for r in results if r['status'] == 'failed'),
+        'seconds': seconds,
+        'thumbnails_per_second': created / seconds if seconds else 0
+    }
+    logging.info('Made {created} thumbnails ({skipped} up to date, {num_failed} failed) in {seconds:.2f}s, '
+                 '{thumbnails_per_second:.1f} thumbnails/s'.format(num_failed=len(report['failed']), **report))
+    return report
+
+
+def is_valid_directory(parser, arg):
+    if os.path.isdir(arg):
+        return arg
+    else:
+        parser.error("The directory %s does not exist!" % arg)
+        return False
+
+
+def main(args):
+    report = regenerate_thumbnails(args.exportDirectory, processes=args.processes, force=args.force)
+    print("products|created|skipped|failed|seconds|thumbnailsPerSecond")
+    print("|".join(map(str, (report['products'], report['created'], report['skipped'], len(report['failed']),
+                             round(report['seconds'], 2), round(report['thumbnails_per_second'], 1)))))
+    return 1 if report['failed'] else 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description='Regenerates the thumbnails of every product in an export directory, from the exported JPEGs.',
+    )
+    parser.add_argument("-ed", "--exportDirectory", dest="exportDirectory", required=True,
+                        help="path to the export directory of the event", metavar="DIR",
+                        type=lambda x: is_valid_directory(parser, x))
+    parser.add_argument("-p", "--processes", dest="processes", type=int, default=None,
+                        help="number of worker processes (defaults to the number of CPUs)")
+    parser.add_argument("-f", "--force", dest="force", action="store_true",
+                        help="regenerate thumbnails even if they are up to date")
+    args = parser.parse_args()
+    sys.exit(main(args))